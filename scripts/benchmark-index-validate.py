@@ -0,0 +1,40 @@
+# Measures schema validation and construction of Index objects for one of the
+# bundled index files.
+#
+# Usage: python scripts/benchmark-index-validate.py [INDEX_FILE] [REPEAT]
+
+import json
+import sys
+import timeit
+
+from pathlib import Path
+
+REPO = Path(__file__).absolute().parent.parent
+sys.path.append(str(REPO / "src"))
+from manage.indexutils import Index, SCHEMA, _validate_one
+
+
+def main(index_file=REPO / "src" / "index-legacy.json", repeat=20):
+    data = Path(index_file).read_bytes()
+    parsed = json.loads(data)
+    count = len(parsed["versions"])
+    repeat = int(repeat)
+
+    def validate():
+        # Validation does not modify its input, so we can reuse it
+        _validate_one(parsed, SCHEMA)
+
+    def construct():
+        Index("https://example.com/index.json", json.loads(data))
+
+    validate()
+    t_validate = min(timeit.repeat(validate, number=1, repeat=repeat))
+    t_construct = min(timeit.repeat(construct, number=1, repeat=repeat))
+    print(f"{Path(index_file).name}: {len(data) // 1024} KB, {count} versions")
+    print(f"Validate:  {t_validate * 1000:10.2f}ms")
+    print(f"Index():   {t_construct * 1000:10.2f}ms")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(*sys.argv[1:]))
@@ -0,0 +1,92 @@
+# Compares sorting CompanyTag objects using their comparison operators against
+# sorting by their precomputed 'sortkey' tuples. Before timing, checks that both
+# give the same order for the cases in tests/test_tagutils.py and for the
+# random tags being timed, and exits with an error if they do not.
+#
+# Usage: python scripts/benchmark-tag-sort.py [COUNT]
+
+import itertools
+import random
+import sys
+import timeit
+
+from pathlib import Path
+
+REPO = Path(__file__).absolute().parent.parent
+sys.path.append(str(REPO / "src"))
+from manage.tagutils import CompanyTag
+
+
+COMPANIES = ["", "PythonCore", "Company", "OtherCompany"]
+PLATFORMS = ["", "-32", "-64", "-arm64"]
+
+# From test_tag_order, test_tag_sort and test_tag_sortkey_order
+ORDERED_PAIRS = [
+    ("3.13.2", "3.13"), ("3.13.1", "3.13.1-32"), ("3.13.1", "3.13.1-arm64"),
+    ("3.13.1", "a3.13.1"), ("a3.13.1", "b3.13.1"), ("3.13.1a", "3.13.1b"),
+]
+SORTED_TAGS = [
+    "3.11-64", "3.10.4", "3.10", "3.9", "3.9-32",
+    "Company/Version10", "Company/Version9",
+    "OtherCompany/3.9.2", "OtherCompany/3.9-32",
+]
+TEST_COMPANIES = ["", "PythonCore", "Company", "company", "OtherCompany"]
+TEST_TAGS = ["3", "3.9", "3.10", "3.10.4", "3.13.1a", "3.13.1b", "a3.13.1",
+             "b3.13.1", "Version9", "Version10", "3.14-dev", "3.14.0-embed",
+             "3-3-3", "x-3"]
+
+
+def make_tags(count):
+    rng = random.Random(count)
+    tags = []
+    for _ in range(count):
+        tag = ".".join(str(rng.randrange(20)) for _ in range(rng.randrange(1, 4)))
+        if rng.random() < 0.2:
+            tag += rng.choice(["a1", "b2", "rc1", "-dev", "-embed"])
+        tags.append(CompanyTag(rng.choice(COMPANIES), tag + rng.choice(PLATFORMS)))
+    return tags
+
+
+def check_test_cases():
+    errors = []
+    for x, y in ORDERED_PAIRS:
+        x, y = CompanyTag(x), CompanyTag(y)
+        if not (x < y and x.sortkey < y.sortkey):
+            errors.append(f"{x} < {y}")
+    expected = list(map(CompanyTag, SORTED_TAGS))
+    if sorted(reversed(expected), key=lambda t: t.sortkey) != expected:
+        errors.append("SORTED_TAGS")
+    all_tags = [CompanyTag(c, t + p) for c, t, p
+                in itertools.product(TEST_COMPANIES, TEST_TAGS, PLATFORMS)]
+    for x, y in itertools.combinations(all_tags, 2):
+        if (x < y) != (x.sortkey < y.sortkey) or (x == y) != (x.sortkey == y.sortkey):
+            errors.append(f"{x} and {y}")
+    return errors
+
+
+def main(count=100_000):
+    errors = check_test_cases()
+    if errors:
+        print("FAIL: sort orders differ for", ", ".join(errors))
+        return 1
+    print("Sort orders match for the test_tagutils cases")
+
+    tags = make_tags(count)
+    by_operator = sorted(tags)
+    by_sortkey = sorted(tags, key=lambda t: t.sortkey)
+    if by_operator != by_sortkey:
+        print("FAIL: sort orders differ")
+        return 1
+    print(f"Sort orders match for {count} tags")
+
+    t_operator = min(timeit.repeat(lambda: sorted(tags), number=1, repeat=3))
+    t_sortkey = min(timeit.repeat(lambda: sorted(tags, key=lambda t: t.sortkey),
+                                  number=1, repeat=3))
+    print(f"Operators: {t_operator * 1000:10.2f}ms")
+    print(f"Sort keys: {t_sortkey * 1000:10.2f}ms")
+    print(f"Speedup:   {t_operator / t_sortkey:10.1f}x")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(*map(int, sys.argv[1:])))
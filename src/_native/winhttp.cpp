@@ -51,6 +51,64 @@ static void http_error(HINTERNET hRequest) {
 }
 
 
+static PyObject *read_string_header(HINTERNET hRequest, DWORD headerIndex) {
+    DWORD value_len = 0;
+    if (WinHttpQueryHeaders(
+        hRequest,
+        headerIndex,
+        WINHTTP_HEADER_NAME_BY_INDEX,
+        WINHTTP_NO_OUTPUT_BUFFER,
+        &value_len,
+        WINHTTP_NO_HEADER_INDEX
+    ) || GetLastError() != ERROR_INSUFFICIENT_BUFFER) {
+        // Header was not included in the response
+        Py_RETURN_NONE;
+    }
+    wchar_t *value = (wchar_t *)PyMem_Malloc(value_len);
+    if (!value) {
+        return PyErr_NoMemory();
+    }
+    if (!WinHttpQueryHeaders(
+        hRequest,
+        headerIndex,
+        WINHTTP_HEADER_NAME_BY_INDEX,
+        value,
+        &value_len,
+        WINHTTP_NO_HEADER_INDEX
+    )) {
+        PyMem_Free(value);
+        winhttp_error();
+        return NULL;
+    }
+    PyObject *result = PyUnicode_FromWideChar(value, value_len / sizeof(wchar_t));
+    PyMem_Free(value);
+    return result;
+}
+
+
+static bool report_response(HINTERNET hRequest, PyObject *on_response) {
+    // Only the headers needed for conditional requests are reported
+    PyObject *etag = read_string_header(hRequest, WINHTTP_QUERY_ETAG);
+    if (!etag) {
+        return false;
+    }
+    PyObject *last_modified = read_string_header(hRequest, WINHTTP_QUERY_LAST_MODIFIED);
+    if (!last_modified) {
+        Py_DECREF(etag);
+        return false;
+    }
+    PyObject *result = PyObject_CallFunction(on_response, "{sOsO}",
+        "ETag", etag, "Last-Modified", last_modified);
+    Py_DECREF(etag);
+    Py_DECREF(last_modified);
+    if (!result) {
+        return false;
+    }
+    Py_DECREF(result);
+    return true;
+}
+
+
 static bool request_creds(HINTERNET hRequest, const wchar_t *url, PyObject *on_cred_request) {
     PyObject *result = PyObject_CallFunction(on_cred_request, "u", url);
     if (!result) {
@@ -151,7 +209,7 @@ static int crack_url(wchar_t *url, URL_COMPONENTS *parts, int add_nuls) {
 extern "C" {
 
 PyObject *winhttp_urlopen(PyObject *, PyObject *args, PyObject *kwargs) {
-    static const char * keywords[] = {"url", "method", "headers", "accepts", "chunksize", "on_progress", "on_cred_request", NULL};
+    static const char * keywords[] = {"url", "method", "headers", "accepts", "chunksize", "on_progress", "on_cred_request", "on_response", NULL};
     wchar_t *url = NULL;
     wchar_t *url2 = NULL; // a copy of url for splitting
     wchar_t *method = NULL;
@@ -159,6 +217,7 @@ PyObject *winhttp_urlopen(PyObject *, PyObject *args, PyObject *kwargs) {
     wchar_t *accepts = NULL;
     PyObject *on_progress = NULL;
     PyObject *on_cred_request = NULL;
+    PyObject *on_response = NULL;
 
     PyObject *result = NULL;
     URL_COMPONENTS url_parts = { sizeof(URL_COMPONENTS) };
@@ -175,8 +234,8 @@ PyObject *winhttp_urlopen(PyObject *, PyObject *args, PyObject *kwargs) {
     uint64_t content_read = 0;
     size_t n = 0;
 
-    if (!PyArg_ParseTupleAndKeywords(args, kwargs, "O&O&O&O&|nOO:winhttp_urlopen", keywords,
-        as_utf16, &url, as_utf16, &method, as_utf16, &headers, as_utf16, &accepts, &chunksize, &on_progress, &on_cred_request)) {
+    if (!PyArg_ParseTupleAndKeywords(args, kwargs, "O&O&O&O&|nOOO:winhttp_urlopen", keywords,
+        as_utf16, &url, as_utf16, &method, as_utf16, &headers, as_utf16, &accepts, &chunksize, &on_progress, &on_cred_request, &on_response)) {
         return NULL;
     }
 
@@ -186,6 +245,9 @@ PyObject *winhttp_urlopen(PyObject *, PyObject *args, PyObject *kwargs) {
     if (on_cred_request && !PyObject_IsTrue(on_cred_request)) {
         on_cred_request = NULL;
     }
+    if (on_response && !PyObject_IsTrue(on_response)) {
+        on_response = NULL;
+    }
 
     accepts_array = (LPCWSTR*)split_to_array(accepts, L';');
     if (!accepts_array) {
@@ -279,6 +341,10 @@ PyObject *winhttp_urlopen(PyObject *, PyObject *args, PyObject *kwargs) {
         }
     }
 
+    if (on_response && !report_response(hRequest, on_response)) {
+        goto exit;
+    }
+
     if (!read_header(hRequest, WINHTTP_QUERY_CONTENT_LENGTH, &content_length)) {
         PyErr_Clear();
         content_length = 0;
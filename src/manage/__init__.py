@@ -48,6 +48,7 @@ def main(args, root=None):
             LOGGER.verbose("Writing logs to %s", log_file)
 
         cmd.execute()
+        cmd.reap_deleted()
         if not cmd.keep_log:
             delete_log = log_file
     except AutomaticInstallDisabledError as ex:
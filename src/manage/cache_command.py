@@ -0,0 +1,59 @@
+import time
+
+from .logging import LOGGER
+from .storeutils import STORE_DIR, list_store, prune_store, remove_package
+
+
+def _format_size(n):
+    if n < 1024:
+        return f"{n} bytes"
+    for unit in ("KB", "MB", "GB"):
+        n /= 1024
+        if n < 1024 or unit == "GB":
+            return f"{n:.1f} {unit}"
+
+
+def _format_entry(e):
+    name = e.get("display-name") or e["path"].name
+    if len(name) > 50:
+        name = name[:47] + "..."
+    last_used = time.strftime("%Y-%m-%d %H:%M", time.localtime(e["last_used"]))
+    return f"{name:<50} {_format_size(e['size']):>10}  {last_used}"
+
+
+def execute(cmd):
+    LOGGER.debug("BEGIN cache_command.execute: %r", cmd.args)
+
+    store_dir = cmd.download_dir / STORE_DIR
+
+    if cmd.clear:
+        if cmd.ask_yn("Remove all cached packages?"):
+            entries = list_store(store_dir)
+            for e in entries:
+                LOGGER.verbose("Removing %s", e["path"])
+                remove_package(e["path"])
+            LOGGER.info("Removed %s cached packages (%s).", len(entries),
+                        _format_size(sum(e["size"] for e in entries)))
+    elif cmd.prune:
+        max_size = cmd.max_size if cmd.max_size is not None else cmd.download_cache_max_size
+        if not max_size:
+            # A limit of 0 means that all packages are kept
+            LOGGER.info("No cache size limit is set, so no packages were removed. " +
+                        "Pass --max-size to choose a size, or --clear to remove all packages.")
+        else:
+            removed = prune_store(store_dir, max_size)
+            LOGGER.info("Removed %s cached packages (%s).", len(removed),
+                        _format_size(sum(e["size"] for e in removed)))
+
+    entries = list_store(store_dir)
+    LOGGER.print("Cached packages in !B!%s!W!:", store_dir)
+    for e in entries:
+        LOGGER.print(_format_entry(e))
+    total = _format_size(sum(e["size"] for e in entries))
+    if cmd.download_cache_max_size:
+        LOGGER.print("!G!%s packages using %s (limit %s)!W!", len(entries), total,
+                     _format_size(cmd.download_cache_max_size))
+    else:
+        LOGGER.print("!G!%s packages using %s!W!", len(entries), total)
+
+    LOGGER.debug("END cache_command.execute")
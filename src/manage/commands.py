@@ -6,6 +6,7 @@ from .config import (
     load_config,
     config_append,
     config_bool,
+    config_list,
     config_split,
     config_split_append,
 )
@@ -153,6 +154,13 @@ CLI_SCHEMA = {
         "from-script": ("from_script", _NEXT),
     },
 
+    "cache": {
+        "prune": ("prune", True),
+        "clear": ("clear", True),
+        "max-size": ("max_size", _NEXT),
+        "help": ("show_help", True), # nested to avoid conflict with command
+    },
+
     "uninstall": {
         "purge": ("purge", True),
         "by-id": ("by_id", True),
@@ -186,6 +194,15 @@ CONFIG_SCHEMA = {
     "shebang_can_run_anything_silently": (config_bool, None, "env"),
     # Typically configured to '%VIRTUAL_ENV%' to pick up the active environment
     "virtual_env": (str, None, "env", "path"),
+    # Seconds to reuse a downloaded index before checking whether it has
+    # changed. By default, we always check (which is cheap if unchanged).
+    "index_cache_max_age": (int, None),
+    # Number of index pages to download in the background ahead of the page
+    # being searched. Set to 0 to only download pages when needed.
+    "index_prefetch": (int, None),
+    # Bytes of downloaded packages to keep for reuse. The least recently used
+    # packages are removed after installing. Set to 0 to keep all packages.
+    "download_cache_max_size": (int, None),
 
     "list": {
         "format": (str, None, "env"),
@@ -195,8 +212,14 @@ CONFIG_SCHEMA = {
     "install": {
         "source": (str, None, "env", "path", "uri"),
         "fallback_source": (str, None, "env", "path", "uri"),
+        # Other sources with the same content as 'source'. The fastest one is
+        # used, based on measurements that are remembered between runs.
+        "mirrors": (config_list, None, "env"),
         "enable_shortcut_kinds": (str, config_split_append),
         "disable_shortcut_kinds": (str, config_split_append),
+        "download_workers": (int, None),
+        "download_segments": (int, None),
+        "download_segment_min_size": (int, None),
     },
 
     # These configuration settings are intended for administrative override only
@@ -260,6 +283,9 @@ class BaseCommand:
     shebang_can_run_anything = True
     shebang_can_run_anything_silently = False
     welcome_on_update = False
+    index_cache_max_age = 0
+    index_prefetch = 2
+    download_cache_max_size = 2 * 1024 * 1024 * 1024
 
     log_file = None
     _create_log_file = True
@@ -280,6 +306,11 @@ class BaseCommand:
 
     show_help = False
 
+    # Set from the configuration to the list of files that were loaded.
+    _config_files = None
+    # Used instead of os.environ when expanding configuration values.
+    _environ = None
+
     def __init__(self, args, root=None):
         cmd_args = {
             k: v for k, v in
@@ -338,7 +369,7 @@ class BaseCommand:
 
         self.root = Path(root or self.root or sys.prefix)
         try:
-            config = load_config(self.root, self.config_file, CONFIG_SCHEMA)
+            config = load_config(self.root, self.config_file, CONFIG_SCHEMA, env=self._environ)
         except Exception:
             LOGGER.warn("Failed to read configuration file from %s", self.config_file)
             raise
@@ -474,6 +505,15 @@ class BaseCommand:
     def execute(self):
         raise NotImplementedError(f"'{type(self).__name__}' does not implement 'execute()'")
 
+    def reap_deleted(self):
+        """Removes files and trees left behind by earlier commands."""
+        from .fsutils import reap_deleted
+        from .storeutils import STORE_DIR
+        roots = [self.install_dir, self.global_dir, self.download_dir]
+        if self.download_dir:
+            roots.append(self.download_dir / STORE_DIR)
+        reap_deleted([r for r in roots if r])
+
     @classmethod
     def usage_text_lines(cls):
         usage_docs = [
@@ -525,14 +565,14 @@ class BaseCommand:
         if usage_ljust % 4:
             usage_ljust += 4 - (usage_ljust % 4)
         usage_ljust = max(usage_ljust, 16)
-        cmd_help = [
+        cmd_help = "\n".join(
             "    {:<{}} {}".format(f"{EXE_NAME} {cmd}", usage_ljust, getattr(COMMANDS[cmd], "HELP_LINE", ""))
             for cmd in sorted(COMMANDS)
             if cmd[:1].isalpha()
-        ]
+        )
         return fr"""
 !G!Commands:!W!
-{'\n'.join(cmd_help)}
+{cmd_help}
 """.lstrip().replace("\r\n", "\n")
 
     @classmethod
@@ -727,6 +767,7 @@ class InstallCommand(BaseCommand):
 
     source = None
     fallback_source = None
+    mirrors = None
     target = None
     download = None
     force = False
@@ -739,6 +780,14 @@ class InstallCommand(BaseCommand):
     from_script = None
     enable_shortcut_kinds = None
     disable_shortcut_kinds = None
+    # Number of runtimes to download at the same time
+    download_workers = 4
+    # Maximum number of parts to download each runtime in, and the smallest
+    # part size in bytes, when the server supports range requests. Segmented
+    # downloads always use urllib, which does not use the system proxy
+    # configuration, and so are only used when enabled.
+    download_segments = 1
+    download_segment_min_size = 8 * 1024 * 1024
 
     def __init__(self, args, root=None):
         super().__init__(args, root)
@@ -755,6 +804,12 @@ class InstallCommand(BaseCommand):
                 self.fallback_source = Path(self.fallback_source).absolute().as_uri()
             except Exception as ex:
                 raise ArgumentError("Fallback source feed is not a valid path or URL") from ex
+        if self.mirrors:
+            try:
+                self.mirrors = [m if "://" in m else Path(m).absolute().as_uri()
+                                for m in self.mirrors]
+            except Exception as ex:
+                raise ArgumentError("Mirror is not a valid path or URL") from ex
         if self.target:
             self.target = Path(self.target).absolute()
         if self.download:
@@ -801,6 +856,47 @@ class UninstallCommand(BaseCommand):
         execute(self)
 
 
+class CacheCommand(BaseCommand):
+    CMD = "cache"
+    HELP_LINE = "Show or remove downloaded runtime packages"
+    HELP_TEXT = r"""!G!Cache command!W!
+> py cache !B![options]!W!
+
+!G!Options:!W!
+    --prune          Remove the least recently used packages to reduce the cache
+                     size (!B!download_cache_max_size=...!W!)
+    --max-size=!B!<BYTES>!W!
+                     Override the size to reduce the cache to when pruning
+    --clear          Remove all cached packages
+
+!B!EXAMPLE:!W! Show cached packages
+> py cache
+
+!B!EXAMPLE:!W! Reduce the cache to 500MB
+> py cache --prune --max-size=500000000
+"""
+
+    prune = False
+    clear = False
+    max_size = None
+    keep_log = False
+
+    def __init__(self, args, root=None):
+        super().__init__(args, root)
+        if self.max_size is not None:
+            try:
+                self.max_size = int(self.max_size)
+            except ValueError as ex:
+                raise ArgumentError("--max-size must be a number of bytes") from ex
+            if self.max_size < 0:
+                raise ArgumentError("--max-size must be a number of bytes")
+
+    def execute(self):
+        from .cache_command import execute
+        self.show_welcome()
+        execute(self)
+
+
 #class RunCommand(BaseCommand):
 #    CMD = "run"
 #    HELP_LINE = "Launch a script in a dedicated environment"
@@ -850,11 +946,35 @@ class HelpWithErrorCommand(HelpCommand):
         LOGGER.print(f"The command !R!{EXE_NAME} {' '.join(self.args)}!W! was not recognized.")
 
 
+class ResolverCommand(BaseCommand):
+    CMD = "resolver"
+    HELP_LINE = "Run a background service to speed up launching runtimes"
+    HELP_TEXT = r"""!G!Resolver command!W!
+> py resolver
+
+Runs until interrupted with Ctrl+C, answering requests from the launcher for
+the runtime to use. The launcher only uses this service when the
+!B!PYMANAGER_RESOLVER!W! environment variable is set, and otherwise (or if the
+service cannot be reached) will find the runtime itself.
+
+!B!EXAMPLE:!W! Start the resolver service for faster launches
+> set PYMANAGER_RESOLVER=1
+> start /min py resolver
+"""
+
+    _create_log_file = False
+
+    def execute(self):
+        from .resolver_command import execute
+        execute(self)
+
+
 class DefaultConfig(BaseCommand):
     CMD = "__no_command"
     _create_log_file = False
 
-    def __init__(self, root):
+    def __init__(self, root, env=None):
+        self._environ = env
         super().__init__([], root)
 
 
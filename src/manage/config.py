@@ -1,7 +1,5 @@
-import json
 import os
 import sys
-import winreg
 
 from .exceptions import InvalidConfigurationError
 from .logging import LOGGER
@@ -28,6 +26,14 @@ def config_split_append(x, y):
     return config_append(x, config_split(y))
 
 
+def config_list(v):
+    if isinstance(v, str):
+        return [s for s in v.split(";") if s]
+    if isinstance(v, list):
+        return [str(s) for s in v if s]
+    raise TypeError(v)
+
+
 def config_bool(v):
     if not v:
         return False
@@ -42,18 +48,22 @@ def _global_file():
         return Path(sys.executable).parent / DEFAULT_CONFIG_NAME
     return Path(package_get_root()) / DEFAULT_CONFIG_NAME
 
-def load_config(root, override_file, schema):
+def _load_config(override_file, schema, env, sources):
+    # Every file or registry key that may be read is added to 'sources', even
+    # if it does not exist, so that the cache is invalidated if it is created.
     cfg = {}
 
     global_file = _global_file()
     if global_file:
+        sources.append(str(global_file))
         try:
-            load_one_config(cfg, global_file, schema=schema)
+            load_one_config(cfg, global_file, schema=schema, env=env)
         except FileNotFoundError:
             pass
 
     try:
-        reg_cfg = load_registry_config(cfg["registry_override_key"], schema=schema)
+        sources.append(("registry", cfg["registry_override_key"]))
+        reg_cfg = load_registry_config(cfg["registry_override_key"], schema=schema, env=env)
         merge_config(cfg, reg_cfg, schema=schema, source="registry", overwrite=True)
     except LookupError:
         reg_cfg = {}
@@ -72,19 +82,178 @@ def load_config(root, override_file, schema):
             pass
         else:
             if file:
-                load_one_config(cfg, file, schema=schema, overwrite=overwrite)
+                sources.append(str(file))
+                load_one_config(cfg, file, schema=schema, overwrite=overwrite, env=env)
 
     if reg_cfg:
         # Apply the registry overrides one more time
         merge_config(cfg, reg_cfg, schema=schema, source="registry", overwrite=True)
 
     if override_file:
-        load_one_config(cfg, override_file, schema=schema, overwrite=True)
+        sources.append(str(override_file))
+        load_one_config(cfg, override_file, schema=schema, overwrite=True, env=env)
+
+    return cfg
+
+
+# The merged configuration is cached in a single file, along with the state of
+# every source that was used to create it. Set PYMANAGER_ENABLE_CONFIG_CACHE=0
+# to always read every source.
+CONFIG_CACHE_NAME = "config_cache.json"
+CONFIG_CACHE_VERSION = 1
+
+
+def _get_cache_file():
+    appdata = os.getenv("LocalAppData")
+    if not appdata:
+        return None
+    return Path(appdata) / "Python" / "_cache" / CONFIG_CACHE_NAME
+
+
+class _RecordingEnv:
+    """Records the environment variables that are read while loading
+    configuration, so that the cache can be invalidated when they change."""
+    def __init__(self, env):
+        self._env = env
+        self.used = {}
+        self.relative_paths = False
+
+    def get(self, key, default=None):
+        v = self._env.get(key)
+        self.used[key] = v
+        return default if v is None else v
+
+
+def _get_registry_state(key_path):
+    import winreg
+    hive_name, _, key_name = key_path.replace("/", "\\").partition("\\")
+    try:
+        with winreg.OpenKey(getattr(winreg, hive_name), key_name) as key:
+            # Changing any value updates the last write time
+            return winreg.QueryInfoKey(key)[2]
+    except (AttributeError, OSError):
+        return None
+
+
+def _get_sources_state(sources):
+    state = []
+    for s in sources:
+        if isinstance(s, (tuple, list)):
+            state.append([*s, _get_registry_state(s[1])])
+            continue
+        try:
+            st = os.stat(s)
+        except OSError:
+            state.append([s, None, None])
+        else:
+            state.append([s, st.st_mtime_ns, st.st_size])
+    return state
+
+
+def _encode_cached(v):
+    if isinstance(v, dict):
+        return {k: _encode_cached(v2) for k, v2 in v.items()}
+    if isinstance(v, list):
+        return [_encode_cached(v2) for v2 in v]
+    if hasattr(v, "__fspath__"):
+        return {"$path": v.__fspath__()}
+    return v
+
+
+def _decode_cached(v):
+    if isinstance(v, dict):
+        try:
+            return Path(v["$path"])
+        except LookupError:
+            return {k: _decode_cached(v2) for k, v2 in v.items()}
+    if isinstance(v, list):
+        return [_decode_cached(v2) for v2 in v]
+    return v
+
 
+def _read_cached_config(cache_file, override_file, env):
+    import json
+    from . import __version__
+    try:
+        with open(cache_file, "r", encoding="utf-8") as f:
+            cached = json.load(f)
+    except FileNotFoundError:
+        raise LookupError(cache_file) from None
+    except (OSError, ValueError) as ex:
+        LOGGER.debug("Failed to read %s: %s", cache_file, ex)
+        raise LookupError(cache_file) from ex
+    try:
+        if (cached["version"] != CONFIG_CACHE_VERSION
+            or cached["manage_version"] != __version__
+            or cached["override_file"] != (str(override_file) if override_file else None)
+            or cached["global_file"] != str(_global_file())
+        ):
+            raise LookupError("version")
+        if cached["cwd"] is not None and cached["cwd"] != os.getcwd():
+            raise LookupError("cwd")
+        for k, v in cached["env"].items():
+            if env.get(k) != v:
+                raise LookupError(k)
+        if _get_sources_state(cached["sources"]) != cached["state"]:
+            raise LookupError("sources")
+        return _decode_cached(cached["config"])
+    except (LookupError, TypeError, ValueError, AttributeError) as ex:
+        LOGGER.debug("Not using cached configuration because %s has changed", ex)
+        raise LookupError(cache_file) from ex
+
+
+def _write_cached_config(cache_file, override_file, env, sources, cfg):
+    import json
+    from . import __version__
+    cached = {
+        "version": CONFIG_CACHE_VERSION,
+        "manage_version": __version__,
+        "override_file": str(override_file) if override_file else None,
+        # Another install with the same version may share the cache file
+        "global_file": str(_global_file()),
+        # Relative paths from environment variables depend on the working dir
+        "cwd": os.getcwd() if env.relative_paths else None,
+        "env": env.used,
+        "sources": sources,
+        "state": _get_sources_state(sources),
+        "config": _encode_cached(cfg),
+    }
+    try:
+        os.makedirs(os.path.dirname(cache_file), exist_ok=True)
+        tmp = f"{cache_file}.{os.getpid()}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(cached, f)
+        os.replace(tmp, cache_file)
+    except (OSError, TypeError, ValueError):
+        LOGGER.debug("Failed to write %s", cache_file, exc_info=True)
+
+
+def load_config(root, override_file, schema, *, env=None):
+    if env is None:
+        env = os.environ
+    cache_file = None
+    # An empty value is treated the same as not setting it
+    if (os.getenv("PYMANAGER_ENABLE_CONFIG_CACHE") or "1").lower()[:1] in "1yt":
+        cache_file = _get_cache_file()
+    if cache_file:
+        try:
+            cfg = _read_cached_config(cache_file, override_file, env)
+        except LookupError:
+            pass
+        else:
+            LOGGER.debug("Using cached configuration from %s", cache_file)
+            return cfg
+
+    env = _RecordingEnv(env)
+    sources = []
+    cfg = _load_config(override_file, schema, env, sources)
+    if cache_file:
+        _write_cached_config(cache_file, override_file, env, sources, cfg)
     return cfg
 
 
-def load_one_config(cfg, file, schema, *, overwrite=False):
+def load_one_config(cfg, file, schema, *, overwrite=False, env=None):
+    import json
     LOGGER.verbose("Loading configuration from %s", file)
     try:
         with open(file, "r", encoding="utf-8-sig") as f:
@@ -101,11 +270,12 @@ def load_one_config(cfg, file, schema, *, overwrite=False):
         LOGGER.debug("TRACEBACK:", exc_info=True)
         return
     cfg2["_config_files"] = file
-    resolve_config(cfg2, file, Path(file).absolute().parent, schema=schema)
+    resolve_config(cfg2, file, Path(file).absolute().parent, schema=schema, env=env)
     merge_config(cfg, cfg2, schema=schema, source=file, overwrite=overwrite)
 
 
-def load_registry_config(key_path, schema):
+def load_registry_config(key_path, schema, *, env=None):
+    import winreg
     hive_name, _, key_name = key_path.replace("/", "\\").partition("\\")
     hive = getattr(winreg, hive_name)
     cfg = {}
@@ -129,7 +299,7 @@ def load_registry_config(key_path, schema):
                         "This is very unexpected. Please check your configuration " +
                         "or report an issue at https://github.com/python/pymanager.",
                         key_path)
-    resolve_config(cfg, key_path, _global_file().parent, schema=schema, error_unknown=True)
+    resolve_config(cfg, key_path, _global_file().parent, schema=schema, error_unknown=True, env=env)
     return cfg
 
 
@@ -144,7 +314,7 @@ def _expand_vars(v, env):
     return v2
 
 
-def resolve_config(cfg, source, relative_to, key_so_far="", schema=None, error_unknown=False):
+def resolve_config(cfg, source, relative_to, key_so_far="", schema=None, error_unknown=False, env=None):
     for k, v in list(cfg.items()):
         try:
             subschema = schema[k]
@@ -157,7 +327,7 @@ def resolve_config(cfg, source, relative_to, key_so_far="", schema=None, error_u
         if isinstance(subschema, dict):
             if not isinstance(v, dict):
                 raise InvalidConfigurationError(source, key_so_far + k, v)
-            resolve_config(v, source, relative_to, f"{key_so_far}{k}.", subschema)
+            resolve_config(v, source, relative_to, f"{key_so_far}{k}.", subschema, env=env)
             continue
 
         kind, merge, *opts = subschema
@@ -165,7 +335,7 @@ def resolve_config(cfg, source, relative_to, key_so_far="", schema=None, error_u
         if "env" in opts and isinstance(v, str):
             try:
                 orig_v = v
-                v = _expand_vars(v, os.environ)
+                v = _expand_vars(v, os.environ if env is None else env)
                 from_env = orig_v != v
             except TypeError:
                 pass
@@ -182,6 +352,8 @@ def resolve_config(cfg, source, relative_to, key_so_far="", schema=None, error_u
             if not from_env:
                 v = relative_to / v
             else:
+                if isinstance(env, _RecordingEnv) and not os.path.isabs(v):
+                    env.relative_paths = True
                 v = type(relative_to)(v).absolute()
         if v and "uri" in opts:
             if hasattr(v, "as_uri"):
@@ -21,17 +21,37 @@ def ensure_tree(path, overwrite_files=True):
         path.parent.mkdir(parents=True, exist_ok=True)
 
 
+# rmtree removes files on this many threads once it has found at least
+# RMTREE_MIN_PARALLEL files, passing RMTREE_BATCH_SIZE files to each task.
+RMTREE_WORKERS = min(8, os.cpu_count() or 1)
+RMTREE_MIN_PARALLEL = 256
+RMTREE_BATCH_SIZE = 64
+
+
+# When enabled, rmtree(defer=True) returns as soon as the tree has been renamed
+# and leaves the removal to reap_deleted() in a later command.
+ENABLE_DEFERRED_DELETE = os.getenv("PYMANAGER_ENABLE_DEFERRED_DELETE", "1").lower()[:1] in "1yt"
+
+# Seconds that reap_deleted() may spend removing old trees
+REAP_TIME_LIMIT = 1.0
+
+# Trees deferred by this process, which reap_deleted() leaves for next time
+_DEFERRED = set()
+
+
 def _rglob(root):
-    q = [root]
+    from collections import deque
+    q = deque([root])
     while q:
-        r = q.pop(0)
-        for f in os.scandir(r):
-            p = r / f.name
-            if f.is_dir():
-                q.append(p)
-                yield p, None
-            else:
-                yield None, p
+        r = q.popleft()
+        with os.scandir(r) as it:
+            for f in it:
+                p = r / f.name
+                if f.is_dir():
+                    q.append(p)
+                    yield p, None
+                else:
+                    yield None, p
 
 
 def rglob(root, files=True, dirs=True):
@@ -42,54 +62,79 @@ def rglob(root, files=True, dirs=True):
             yield f
 
 
-def _unlink(f, on_missing=None, on_fail=None, on_isdir=None):
-    try:
-        f.unlink()
-    except FileNotFoundError:
-        if on_missing:
-            on_missing(f)
-        else:
+def _walk_for_delete(root):
+    # Yields (dirs, files) for each directory in root, breadth first, so that
+    # reversing the directories gives an order they can be removed in.
+    # Links to directories are returned as files and never followed.
+    from collections import deque
+    q = deque([root])
+    while q:
+        r = q.popleft()
+        dirs = []
+        files = []
+        try:
+            with os.scandir(r) as it:
+                for e in it:
+                    try:
+                        is_dir = e.is_dir(follow_symlinks=False)
+                    except OSError:
+                        is_dir = False
+                    (dirs if is_dir else files).append(e.path)
+        except (FileNotFoundError, NotADirectoryError):
+            continue
+        except OSError:
+            LOGGER.debug("Failed to list %s", r, exc_info=True)
+            continue
+        q.extend(dirs)
+        yield dirs, files
+
+
+def _unlink_all(files):
+    # Returns the files that could not be removed, and any that turned out to
+    # be directories (or links to directories).
+    failed = []
+    dirs = []
+    for f in files:
+        try:
+            os.unlink(f)
+        except FileNotFoundError:
             pass
-    except PermissionError:
-        if f.is_dir():
-            if on_isdir:
-                on_isdir(f)
-            elif on_fail:
-                on_fail(f)
+        except PermissionError:
+            if os.path.isdir(f):
+                dirs.append(f)
             else:
-                raise IsADirectoryError() from None
-    except OSError:
-        if on_fail:
-            on_fail(f)
-        else:
-            raise
+                failed.append(f)
+        except OSError:
+            failed.append(f)
+    return failed, dirs
 
 
-def _rmdir(d, on_missing=None, on_fail=None, on_isfile=None):
-    try:
-        d.rmdir()
-    except FileNotFoundError:
-        if on_missing:
-            on_missing(d)
-        else:
+def _rmdir_all(dirs):
+    # Returns the directories that could not be removed, and any that turned
+    # out to be files.
+    failed = []
+    files = []
+    for d in dirs:
+        try:
+            os.rmdir(d)
+        except FileNotFoundError:
             pass
-    except NotADirectoryError:
-        if on_isfile:
-            on_isfile(d)
-        elif on_fail:
-            on_fail(d)
-        else:
-            raise
-    except OSError:
-        if on_fail:
-            on_fail(d)
-        else:
-            raise
+        except NotADirectoryError:
+            files.append(d)
+        except OSError:
+            failed.append(d)
+    return failed, files
 
 
-def rmtree(path, after_5s_warning=None, remove_ext_first=()):
+def rmtree(path, after_5s_warning=None, remove_ext_first=(), defer=False):
     start = time.monotonic()
 
+    def _check_warning():
+        nonlocal after_5s_warning
+        if after_5s_warning and (time.monotonic() - start) > 5:
+            LOGGER.warn(after_5s_warning)
+            after_5s_warning = None
+
     if isinstance(path, (str, bytes)):
         path = Path(path)
     if not path.is_dir():
@@ -114,9 +159,7 @@ def rmtree(path, after_5s_warning=None, remove_ext_first=()):
                 LOGGER.debug("Files successfully removed")
 
     for i in range(1000):
-        if after_5s_warning and (time.monotonic() - start) > 5:
-            LOGGER.warn(after_5s_warning)
-            after_5s_warning = None
+        _check_warning()
         new_path = path.with_name(f"{path.name}.{i}.deleteme")
         if new_path.exists():
             continue
@@ -129,30 +172,67 @@ def rmtree(path, after_5s_warning=None, remove_ext_first=()):
     else:
         raise FileExistsError(str(path))
 
+    if defer and ENABLE_DEFERRED_DELETE:
+        LOGGER.debug("Deferring removal of %s", path)
+        _DEFERRED.add(os.path.normcase(os.fspath(path)))
+        return
+
+    _rmtree_renamed(os.fspath(path), _check_warning)
+
+
+def _rmtree_renamed(path, check_warning, deadline=None):
+    # Removes a tree that has already been renamed out of the way. If deadline
+    # passes, stops early and leaves the rest of the tree.
     to_rmdir = [path]
     to_unlink = []
-    for d, f in _rglob(path):
-        if after_5s_warning and (time.monotonic() - start) > 5:
-            LOGGER.warn(after_5s_warning)
-            after_5s_warning = None
-
-        if d:
-            to_rmdir.append(d)
-        else:
-            _unlink(f, on_fail=to_unlink.append, on_isdir=to_rmdir.append)
+    results = []
+    pending = []
+    pool = None
+    try:
+        for dirs, files in _walk_for_delete(path):
+            check_warning()
+            if deadline and time.monotonic() > deadline:
+                break
+            to_rmdir.extend(dirs)
+            pending.extend(files)
+            if not pool and RMTREE_WORKERS > 1 and len(pending) >= RMTREE_MIN_PARALLEL:
+                from concurrent.futures import ThreadPoolExecutor
+                LOGGER.debug("Removing files using %s threads", RMTREE_WORKERS)
+                pool = ThreadPoolExecutor(max_workers=RMTREE_WORKERS)
+            while pool and len(pending) >= RMTREE_BATCH_SIZE:
+                results.append(pool.submit(_unlink_all, pending[:RMTREE_BATCH_SIZE]))
+                del pending[:RMTREE_BATCH_SIZE]
+        if pool and pending:
+            results.append(pool.submit(_unlink_all, pending))
+        elif pending:
+            to_unlink, more_dirs = _unlink_all(pending)
+            to_rmdir.extend(more_dirs)
+        for r in results:
+            failed, more_dirs = r.result()
+            to_unlink.extend(failed)
+            to_rmdir.extend(more_dirs)
+            check_warning()
+    finally:
+        if pool:
+            pool.shutdown(cancel_futures=True)
 
-    to_warn = []
+    # Directories were found breadth first, so reversing them puts every
+    # directory before its parent.
+    to_rmdir.reverse()
     retries = 0
     while retries < 3 and (to_rmdir or to_unlink):
         retries += 1
-        for f in to_unlink:
-            _unlink(f, on_fail=to_warn.append, on_isdir=to_rmdir.append)
-        to_unlink.clear()
-
-        for d in sorted(to_rmdir, key=lambda p: len(p.parts), reverse=True):
-            _rmdir(d, on_fail=to_warn.append, on_isfile=to_unlink)
+        check_warning()
+        if deadline and retries > 1 and time.monotonic() > deadline:
+            break
+        to_unlink, more_dirs = _unlink_all(to_unlink)
+        to_rmdir, more_files = _rmdir_all(more_dirs + to_rmdir)
+        to_unlink.extend(more_files)
 
-    if to_warn:
+    to_warn = to_unlink + to_rmdir
+    if to_warn and deadline:
+        LOGGER.debug("Unable to finish removing %s", path)
+    elif to_warn:
         f = os.path.commonprefix(to_warn)
         if f:
             LOGGER.warn("Failed to remove %s", f)
@@ -161,6 +241,34 @@ def rmtree(path, after_5s_warning=None, remove_ext_first=()):
                 LOGGER.warn("Failed to remove %s", f)
 
 
+def reap_deleted(roots, time_limit=REAP_TIME_LIMIT):
+    """Removes '.deleteme' files and trees directly inside each of roots,
+    stopping after time_limit seconds. Anything left over, including trees
+    deferred by this process, will be removed by a later call.
+    """
+    deadline = time.monotonic() + time_limit
+    for root in roots:
+        try:
+            with os.scandir(root) as it:
+                entries = [e for e in it if e.name.endswith(".deleteme")]
+        except OSError:
+            continue
+        for e in entries:
+            if time.monotonic() >= deadline:
+                LOGGER.debug("Leaving remaining deleted files for next time")
+                return
+            if os.path.normcase(e.path) in _DEFERRED:
+                continue
+            LOGGER.debug("Removing %s", e.path)
+            try:
+                if e.is_dir(follow_symlinks=False):
+                    _rmtree_renamed(e.path, lambda: None, deadline)
+                else:
+                    os.unlink(e.path)
+            except OSError:
+                LOGGER.debug("Failed to remove %s", e.path, exc_info=True)
+
+
 def unlink(path, after_5s_warning=None):
     start = time.monotonic()
 
@@ -1,6 +1,6 @@
 from .exceptions import InvalidFeedError
 from .logging import LOGGER
-from .tagutils import tag_or_range, install_matches_any
+from .tagutils import CompanyTag, tag_or_range, install_matches_any
 from .verutils import Version
 
 SCHEMA = {
@@ -75,86 +75,156 @@ def _version_error(actual, expect, ctxt):
     ))
 
 
-def _validate_one_dict_match(d, expect):
-    if not isinstance(d, dict):
-        return True
+class _SchemaErrorAt(Exception):
+    # Raised by compiled validators and caught by _validate_one, which adds
+    # the context to the message. Each level adds its own key to the path as
+    # the exception passes through, so we do not have to track the context
+    # while validating.
+    def __init__(self, make_error, cause=None):
+        self.make_error = make_error
+        self.cause = cause
+        self.path = []
+
+
+def _compile_dict_match(expect):
     if not isinstance(expect, dict):
-        return True
-    try:
-        if expect["schema"] == d["schema"]:
+        return lambda d: True
+    has_schema = "schema" in expect
+    has_version = "version" in expect
+    int_items = [(k, v) for k, v in expect.items() if isinstance(v, int)]
+    keys = None if ... in expect else frozenset(expect)
+
+    def match(d):
+        if not isinstance(d, dict):
             return True
-    except KeyError:
-        pass
-    try:
-        if expect["version"] == d["version"]:
+        if has_schema and "schema" in d and expect["schema"] == d["schema"]:
             return True
-    except KeyError:
-        pass
-
-    for k, v in expect.items():
-        if isinstance(v, int) and d.get(k) != v:
-            return False
-    if ... not in expect:
-        for k in d:
-            if k not in expect:
+        if has_version and "version" in d and expect["version"] == d["version"]:
+            return True
+        for k, v in int_items:
+            if d.get(k) != v:
                 return False
-    return True
-    
-
-def _validate_one_or_list(d, expects, ctxt):
-    if not isinstance(d, list):
-        d = [d]
-    ctxt.append("[]")
-    for i, e in enumerate(d):
-        ctxt[-1] = f"[{i}]"
-        for expect in expects:
-            if _validate_one_dict_match(e, expect):
-                yield _validate_one(e, expect, ctxt)
-                break
-        else:
-            raise InvalidFeedError("No matching 'version' or 'schema' at {}".format(
-                ".".join(ctxt)
-            ))
-    del ctxt[-1]
+        if keys is not None:
+            for k in d:
+                if k not in keys:
+                    return False
+        return True
+    return match
 
 
-def _validate_one(d, expect, ctxt=None):
-    if ctxt is None:
-        ctxt = []
+def _compile_list(expects):
+    options = [(_compile_dict_match(e), _compile(e)) for e in expects]
+
+    def validate(d):
+        if not isinstance(d, list):
+            d = [d]
+        result = []
+        for i, e in enumerate(d):
+            for match, validate_one in options:
+                if match(e):
+                    try:
+                        result.append(validate_one(e))
+                    except _SchemaErrorAt as ex:
+                        ex.path.append(f"[{i}]")
+                        raise
+                    break
+            else:
+                ex = _SchemaErrorAt(lambda ctxt: InvalidFeedError(
+                    "No matching 'version' or 'schema' at {}".format(".".join(ctxt))
+                ))
+                ex.path.append(f"[{i}]")
+                raise ex
+        return result
+    return validate
+
+
+def _compile_dict(expect):
+    validators = {k: _compile(v) for k, v in expect.items() if k is not ...}
+    any_key = _compile(expect[...]) if ... in expect else None
+
+    def validate(d):
+        if not isinstance(d, dict):
+            raise _SchemaErrorAt(lambda ctxt: _schema_error(d, expect, ctxt))
+        d2 = {}
+        for k, v in d.items():
+            try:
+                validate_one = validators.get(k, any_key)
+                if validate_one is None:
+                    raise _SchemaErrorAt(lambda ctxt: InvalidFeedError(
+                        "Unexpected key {}".format(".".join(ctxt))
+                    ))
+                d2[k] = validate_one(v)
+            except _SchemaErrorAt as ex:
+                ex.path.append(k)
+                raise
+        return d2
+    return validate
+
+
+def _compile_type(expect):
+    def validate(d):
+        if isinstance(d, dict):
+            raise _SchemaErrorAt(lambda ctxt: _schema_error(dict, expect, ctxt))
+        if isinstance(d, expect):
+            return d
+        try:
+            return expect(d)
+        except Exception as ex:
+            raise _SchemaErrorAt(lambda ctxt: _schema_error(d, expect, ctxt), ex)
+    return validate
+
+
+def _compile_callable(expect):
+    def validate(d):
+        if isinstance(d, dict):
+            raise _SchemaErrorAt(lambda ctxt: _schema_error(dict, expect, ctxt))
+        try:
+            return expect(d)
+        except Exception as ex:
+            raise _SchemaErrorAt(lambda ctxt: _schema_error(d, expect, ctxt), ex)
+    return validate
+
+
+def _compile(expect):
     if expect is None:
-        raise InvalidFeedError("Unexpected key {}".format(".".join(ctxt)))
+        def validate(d):
+            raise _SchemaErrorAt(lambda ctxt: InvalidFeedError(
+                "Unexpected key {}".format(".".join(ctxt))
+            ))
+        return validate
     if isinstance(expect, int):
-        if d != expect:
-            raise _version_error(d, expect, ctxt)
-        return d
+        def validate(d):
+            if d != expect:
+                raise _SchemaErrorAt(lambda ctxt: _version_error(d, expect, ctxt))
+            return d
+        return validate
     if isinstance(expect, list):
-        return list(_validate_one_or_list(d, expect, ctxt))
+        return _compile_list(expect)
     if expect is ...:
         # Allow ... value for arbitrary value types
-        return d
-    if isinstance(d, dict):
-        if isinstance(expect, dict):
-            d2 = {}
-            for k, v in d.items():
-                ctxt.append(k)
-                try:
-                    expect2 = expect[k]
-                except LookupError:
-                    # Allow ... key for arbitrary key names
-                    try:
-                        expect2 = expect[...]
-                    except LookupError:
-                        raise InvalidFeedError("Unexpected key {}".format(".".join(ctxt))) from None
-                d2[k] = _validate_one(v, expect2, ctxt)
-                del ctxt[-1]
-            return d2
-        raise _schema_error(dict, expect, ctxt)
-    if isinstance(expect, type) and isinstance(d, expect):
-        return d
+        return lambda d: d
+    if isinstance(expect, dict):
+        return _compile_dict(expect)
+    if isinstance(expect, type):
+        return _compile_type(expect)
+    return _compile_callable(expect)
+
+
+# Compiled validators for each schema, keyed by id(). The schema is kept
+# alongside to ensure that the id() is not reused.
+_COMPILED_SCHEMAS = {}
+
+
+def _validate_one(d, expect, ctxt=None):
+    try:
+        validate = _COMPILED_SCHEMAS[id(expect)][1]
+    except KeyError:
+        validate = _compile(expect)
+        _COMPILED_SCHEMAS[id(expect)] = expect, validate
     try:
-        return expect(d)
-    except Exception as ex:
-        raise _schema_error(d, expect, ctxt) from ex
+        return validate(d)
+    except _SchemaErrorAt as ex:
+        raise ex.make_error([*(ctxt or ()), *reversed(ex.path)]) from ex.cause
 
 
 def _patch_schema_1(source_url, v):
@@ -195,7 +265,29 @@ class Index:
         self.source_url = source_url
         self.next_url = validated.get("next")
         versions = [_patch(source_url, v) for v in validated["versions"]]
-        self.versions = sorted(versions, key=lambda v: v["sort-version"], reverse=True)
+        self.versions = sorted(versions, key=lambda v: v["sort-version"].sortkey, reverse=True)
+        # Lookup tables, created when first needed
+        self._by_id = None
+        self._by_version = None
+
+    def to_cache(self):
+        """Returns the validated index as data that can be stored as JSON."""
+        return {
+            "next": self.next_url,
+            "versions": [{**v, "sort-version": v["sort-version"].s} for v in self.versions],
+        }
+
+    @classmethod
+    def from_cache(cls, source_url, d):
+        """Recreates an index from the result of to_cache() without validating
+        or sorting it again."""
+        self = cls.__new__(cls)
+        self.source_url = source_url
+        self.next_url = d["next"]
+        self.versions = [{**v, "sort-version": Version(v["sort-version"])} for v in d["versions"]]
+        self._by_id = None
+        self._by_version = None
+        return self
 
     def __repr__(self):
         return "<Index({!r}, next={!r}, versions=[...{} entries])>".format(
@@ -204,6 +296,63 @@ class Index:
             len(self.versions),
         )
 
+    def find_by_id(self, id):
+        if self._by_id is None:
+            self._by_id = {}
+            for i in self.versions:
+                self._by_id.setdefault(i["id"].casefold(), i)
+        try:
+            return self._by_id[id.casefold()]
+        except KeyError:
+            raise LookupError(id) from None
+
+    @staticmethod
+    def _version_keys(v, is_filter):
+        # Tags only match when the major version of their first segment is the
+        # same. When the filter specifies a minor version, it must match too,
+        # unless the install's tag is a major version wildcard.
+        major = v.sortkey[0]
+        if is_filter:
+            if v.sortkey[-3] < 2:
+                return [(major,)]
+            return [(major, v.sortkey[1]), (major, None)]
+        if v.sortkey[-3] >= 2:
+            return [(major,), (major, v.sortkey[1])]
+        if v.prefix_match or v.prerelease_match:
+            return [(major,), (major, None)]
+        return [(major,)]
+
+    def _get_candidates(self, filters):
+        # Selects the installs that may match any of the filters, so we can
+        # skip those that cannot. Anything other than a simple tag requires
+        # a full search.
+        keys = set()
+        for f in filters:
+            if not isinstance(f, CompanyTag) or not f._sortkey:
+                return self.versions
+            head = f._sortkey[0]
+            if not isinstance(head, Version):
+                return self.versions
+            keys.update(self._version_keys(head, True))
+        if not keys:
+            return self.versions
+
+        if self._by_version is None:
+            self._by_version = {}
+            for n, i in enumerate(self.versions):
+                for t in (i.get("install-for") or [i["tag"]]):
+                    head = CompanyTag(i["company"], t)._sortkey[:1]
+                    if not head or not isinstance(head[0], Version):
+                        continue
+                    for k in self._version_keys(head[0], False):
+                        positions = self._by_version.setdefault(k, [])
+                        if not positions or positions[-1] != n:
+                            positions.append(n)
+        positions = set()
+        for k in keys:
+            positions.update(self._by_version.get(k, ()))
+        return [self.versions[n] for n in sorted(positions)]
+
     def find_all(self, tags, *, seen_ids=None, loose_company=False, with_prerelease=False):
         filters = []
         for tag in tags:
@@ -211,7 +360,7 @@ class Index:
                 filters.append(tag_or_range(tag))
             except ValueError as ex:
                 LOGGER.warn("%s", ex)
-        for i in self.versions:
+        for i in self._get_candidates(filters):
             if seen_ids is not None:
                 if i["id"].casefold() in seen_ids:
                     continue
@@ -10,10 +10,13 @@ from .exceptions import (
 )
 from .fsutils import ensure_tree, rmtree, unlink
 from .indexutils import Index
+from .installs import update_snapshot
 from .logging import LOGGER, ProgressPrinter
 from .pathutils import Path, PurePath
 from .tagutils import install_matches_any, tag_or_range
 from .urlutils import (
+    INDEX_CACHE_DIR,
+    RESUME_SUFFIX,
     sanitise_url,
     urlopen as _urlopen,
     urlretrieve as _urlretrieve,
@@ -30,17 +33,27 @@ CONSOLE_WIDTH = 79
 DOWNLOAD_CACHE = {}
 
 
+# Suffix added to downloaded packages to record their verified hashes
+HASH_RECORD_SUFFIX = ".hash"
+
+
 def _multihash(file, hashes):
     import hashlib
     LOGGER.debug("Calculating hashes: %s", ", ".join(hashes))
-    hashers = [(hashlib.new(k), k, v) for k, v in hashes.items()]
+    hashers = [(hashlib.new(k), k) for k in hashes]
 
     for chunk in iter(lambda: file.read(1024 * 1024), b""):
         for h in hashers:
             h[0].update(chunk)
 
-    for h, alg, expect in hashers:
-        actual = h.hexdigest().casefold()
+    digests = {alg: h.hexdigest() for h, alg in hashers}
+    _check_hashes(digests, hashes)
+    return digests
+
+
+def _check_hashes(digests, hashes):
+    for alg, expect in hashes.items():
+        actual = digests[alg].casefold()
         expect = expect.casefold()
         if expect and actual != expect:
             raise HashMismatchError(f"Hash mismatch: {alg}:{actual} (expected {expect})")
@@ -48,6 +61,38 @@ def _multihash(file, hashes):
             LOGGER.debug("%s digest: %s (matched)", alg, actual)
 
 
+def _hash_record_file(dest):
+    return dest.with_name(dest.name + HASH_RECORD_SUFFIX)
+
+
+def _read_hash_record(dest):
+    """Returns the hashes previously recorded for dest, provided it has not
+    been modified since they were recorded. Otherwise, returns None.
+    """
+    try:
+        with open(_hash_record_file(dest), "r", encoding="utf-8") as f:
+            record = json.load(f)
+        st = os.stat(dest)
+        if record["size"] == st.st_size and record["mtime_ns"] == st.st_mtime_ns:
+            return dict(record["hashes"])
+    except (OSError, LookupError, TypeError, ValueError):
+        pass
+    return None
+
+
+def _write_hash_record(dest, digests):
+    try:
+        st = os.stat(dest)
+        with open(_hash_record_file(dest), "w", encoding="utf-8") as f:
+            json.dump({
+                "size": st.st_size,
+                "mtime_ns": st.st_mtime_ns,
+                "hashes": digests,
+            }, f)
+    except OSError:
+        LOGGER.debug("Failed to record hashes for %s", dest, exc_info=True)
+
+
 def _expand_versions_by_tag(versions):
     for v in versions:
         if isinstance(v["tag"], str):
@@ -71,12 +116,12 @@ def select_package(index_downloader, tag, platform=None, *, urlopen=_urlopen, by
     for index in index_downloader:
         try:
             if by_id:
-                for v in index.versions:
-                    if v["id"].casefold() == tag.casefold():
-                        return v
-                raise LookupError("Could not find a runtime matching '{}' at '{}'".format(
-                    tag, sanitise_url(index.source_url)
-                ))
+                try:
+                    return index.find_by_id(tag)
+                except LookupError:
+                    raise LookupError("Could not find a runtime matching '{}' at '{}'".format(
+                        tag, sanitise_url(index.source_url)
+                    )) from None
             if platform:
                 try:
                     return index.find_to_install(tag + platform)
@@ -96,10 +141,16 @@ def select_package(index_downloader, tag, platform=None, *, urlopen=_urlopen, by
 def download_package(cmd, install, dest, cache, *, on_progress=None, urlopen=_urlopen, urlretrieve=_urlretrieve):
     LOGGER.debug("Starting download package %s to %s", sanitise_url(install["url"]), dest)
 
-    if not cmd.force and dest.is_file():
+    # A partial download is left for urlretrieve to resume
+    resume_file = dest.with_name(dest.name + RESUME_SUFFIX)
+    if cmd.force:
+        unlink(resume_file)
+    partial = resume_file.is_file()
+
+    if not cmd.force and not partial and dest.is_file():
         LOGGER.verbose("Download was found in the cache. (Pass --force to ignore cached downloads.)")
         try:
-            validate_package(install, dest, delete=False)
+            validate_package(install, dest, delete=False, record=True)
         except HashMismatchError:
             LOGGER.info("Cached file could not be verified. Downloading it again.")
         else:
@@ -117,8 +168,12 @@ def download_package(cmd, install, dest, cache, *, on_progress=None, urlopen=_ur
                 LOGGER.verbose("Using bundled file at %s", bundled)
                 return bundled
 
-    unlink(dest, "Removing old download is taking some time. " + 
-                 "Please continue to wait, or press Ctrl+C to abort.")
+    if partial:
+        LOGGER.verbose("Resuming partial download of %s", dest)
+    else:
+        unlink(dest, "Removing old download is taking some time. " + 
+                     "Please continue to wait, or press Ctrl+C to abort.")
+    unlink(_hash_record_file(dest))
 
     def _find_creds(url):
         from .urlutils import extract_url_auth, unsanitise_url
@@ -134,29 +189,79 @@ def download_package(cmd, install, dest, cache, *, on_progress=None, urlopen=_ur
         return None
 
     ensure_tree(dest)
-    urlretrieve(install["url"], dest, on_progress=on_progress, on_auth_request=_find_creds)
+    digests = urlretrieve(install["url"], dest, on_progress=on_progress, on_auth_request=_find_creds,
+                          hash_algorithms=list(install.get("hash", ())),
+                          segments=cmd.download_segments,
+                          segment_min_size=cmd.download_segment_min_size)
     LOGGER.debug("Downloaded to %s", dest)
+    if digests:
+        # Hashes were calculated during the download, so we can validate the
+        # package now (and record them) without reading it again.
+        validate_package(install, dest, digests=digests, record=True)
     return dest
 
 
-def validate_package(install, dest, *, delete=True):
+def validate_package(install, dest, *, delete=True, digests=None, record=False):
     if "hash" in install:
-        LOGGER.debug("Starting hash validation of %s", dest)
+        recorded = False
+        if digests is None:
+            digests = _read_hash_record(dest)
+            recorded = bool(digests)
         try:
-            with open(dest, "rb") as f:
-                _multihash(f, install["hash"])
+            if digests and all(k in digests for k in install["hash"]):
+                LOGGER.debug("Using known hashes to validate %s", dest)
+                _check_hashes(digests, install["hash"])
+            else:
+                LOGGER.debug("Starting hash validation of %s", dest)
+                recorded = False
+                with open(dest, "rb") as f:
+                    digests = _multihash(f, install["hash"])
         except HashMismatchError as ex:
             if not delete:
                 raise
             unlink(dest, "Deleting downloaded files is taking some time. " +
                          "Please continue to wait, or press Ctrl+C to abort.")
+            unlink(_hash_record_file(dest))
             raise HashMismatchError() from ex
+        if record and not recorded:
+            _write_hash_record(dest, digests)
     else:
         LOGGER.debug("Skipping hash validation of %s because there is no hash "
                      "listed in the install data.", dest)
 
 
-def extract_package(package, prefix, calculate_dest=Path, *, on_progress=None, repair=False):
+# Number of threads used to extract packages. Each thread opens its own handle
+# to the package, so more threads also means more memory.
+EXTRACT_WORKERS = min(8, os.cpu_count() or 1)
+
+# Packages with fewer members than this are extracted on the calling thread
+EXTRACT_MIN_PARALLEL = 64
+
+# Members are submitted to workers in batches of this size, which keeps
+# related files together and limits the overhead of each task.
+EXTRACT_BATCH_SIZE = 32
+
+# Members are copied in chunks of this size, rather than read into memory.
+EXTRACT_CHUNK_SIZE = 1024 * 1024
+
+
+def _extract_members(package, members, handles):
+    import shutil
+    import threading
+    import zipfile
+    try:
+        zf = handles[threading.get_ident()]
+    except KeyError:
+        # ZipFile objects share a file position, so each thread has its own
+        zf = handles[threading.get_ident()] = zipfile.ZipFile(package, "r")
+    for member, dest in members:
+        with zf.open(member) as src, open(dest, "wb") as f:
+            shutil.copyfileobj(src, f, EXTRACT_CHUNK_SIZE)
+    return len(members)
+
+
+def extract_package(package, prefix, calculate_dest=Path, *, on_progress=None, repair=False,
+                    workers=None):
     import zipfile
 
     LOGGER.debug("Starting extract of %s to %s", package, prefix)
@@ -171,33 +276,71 @@ def extract_package(package, prefix, calculate_dest=Path, *, on_progress=None, r
             return calculate_dest(prefix, *PurePath(filename).parts[1:])
         calculate_dest = _calc
 
-    # TODO: Optimise/parallelise extract
-
     warn_out_of_prefix = []
     warn_overwrite = []
+    # All checks and directory creation happen here, so that the workers only
+    # need to write the files.
+    to_extract = []
+    seen = set()
+    created = set()
     with zipfile.ZipFile(package, "r") as zf:
         items = list(zf.infolist())
-        total = len(items) if on_progress else 0
-        for i, member in enumerate(items):
-            on_progress((i * 100) // total)
-            dest = calculate_dest(prefix, member.filename)
-            if not dest:
-                continue
-            try:
-                dest.relative_to(prefix)
-            except ValueError:
-                warn_out_of_prefix.append(dest)
-                continue
-            if repair:
-                unlink(dest, "Deleting an existing file is taking some time. " +
-                             "Please ensure Python is not running, and continue to wait " +
-                             "or press Ctrl+C to abort (which will leave your install corrupted).")
-            elif dest.exists():
-                warn_overwrite.append(dest)
-                continue
+    for member in items:
+        dest = calculate_dest(prefix, member.filename)
+        if not dest:
+            continue
+        try:
+            dest.relative_to(prefix)
+        except ValueError:
+            warn_out_of_prefix.append(dest)
+            continue
+        if dest in seen:
+            # The package contains the same file twice
+            warn_overwrite.append(dest)
+            continue
+        seen.add(dest)
+        if repair:
+            unlink(dest, "Deleting an existing file is taking some time. " +
+                         "Please ensure Python is not running, and continue to wait " +
+                         "or press Ctrl+C to abort (which will leave your install corrupted).")
+        elif dest.exists():
+            warn_overwrite.append(dest)
+            continue
+        if dest.parent not in created:
             ensure_tree(dest)
-            with open(dest, "wb") as f:
-                f.write(zf.read(member))
+            created.add(dest.parent)
+        to_extract.append((member, dest))
+
+    total = len(to_extract)
+    if workers is None:
+        workers = EXTRACT_WORKERS if total >= EXTRACT_MIN_PARALLEL else 1
+    batches = [to_extract[i:i + EXTRACT_BATCH_SIZE]
+               for i in range(0, total, EXTRACT_BATCH_SIZE)]
+    handles = {}
+    on_progress(0)
+    try:
+        if workers <= 1:
+            done = 0
+            for batch in batches:
+                done += _extract_members(package, batch, handles)
+                on_progress((done * 100) // total)
+        else:
+            from concurrent.futures import ThreadPoolExecutor, as_completed
+            LOGGER.debug("Extracting %s files using %s workers", total, workers)
+            with ThreadPoolExecutor(max_workers=workers) as pool:
+                futures = [pool.submit(_extract_members, package, batch, handles)
+                           for batch in batches]
+                try:
+                    done = 0
+                    for f in as_completed(futures):
+                        done += f.result()
+                        on_progress((done * 100) // total)
+                finally:
+                    for f in futures:
+                        f.cancel()
+    finally:
+        for zf in handles.values():
+            zf.close()
     on_progress(100)
 
     if warn_out_of_prefix:
@@ -220,19 +363,127 @@ def extract_package(package, prefix, calculate_dest=Path, *, on_progress=None, r
             LOGGER.debug("Attempted to overwrite: %s", dest)
 
 
-def _write_alias(cmd, alias, target):
+# Records the aliases and shortcuts that were last written, so that unchanged
+# entries can be skipped. Stored in install_dir.
+SHORTCUT_MANIFEST_NAME = "__shortcuts__.json"
+SHORTCUT_MANIFEST_VERSION = 1
+
+
+def _read_shortcut_manifest(cmd):
+    try:
+        with open(cmd.install_dir / SHORTCUT_MANIFEST_NAME, "r", encoding="utf-8") as f:
+            manifest = json.load(f)
+        if isinstance(manifest, dict) and manifest.get("version") == SHORTCUT_MANIFEST_VERSION:
+            return manifest
+        LOGGER.debug("Ignoring shortcut manifest because the version is not supported")
+    except FileNotFoundError:
+        pass
+    except (OSError, ValueError):
+        LOGGER.debug("Failed to read shortcut manifest", exc_info=True)
+    return None
+
+
+def _write_shortcut_manifest(cmd, manifest):
+    file = cmd.install_dir / SHORTCUT_MANIFEST_NAME
+    try:
+        tmp = file.with_name(f"{file.name}.{os.getpid()}.tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({**manifest, "version": SHORTCUT_MANIFEST_VERSION}, f)
+        os.replace(tmp, file)
+    except OSError:
+        LOGGER.debug("Failed to write shortcut manifest", exc_info=True)
+
+
+def _file_stamp(p):
+    st = os.stat(p)
+    return [st.st_size, st.st_mtime_ns]
+
+
+def _shortcut_hash(install, shortcut):
+    import hashlib
+    data = json.dumps([install, shortcut], sort_keys=True, default=str)
+    return hashlib.sha256(data.encode("utf-8")).hexdigest()
+
+
+def _read_launcher(launcher, launchers):
+    # Each launcher template is only read once, however many aliases use it
+    key = str(launcher)
+    try:
+        return launchers[key]
+    except KeyError:
+        pass
+    import hashlib
+    data = launcher.read_bytes()
+    launchers[key] = data, hashlib.sha256(data).hexdigest()
+    return launchers[key]
+
+
+def _write_alias(cmd, alias, target, launchers=None, existing=None, install_id=None):
+    """Writes an alias to target, unless existing describes an identical alias
+    that has not been modified since it was written.
+
+    Returns a record of the alias, or None if it could not be written.
+    """
     p = (cmd.global_dir / alias["name"])
-    ensure_tree(p)
-    unlink(p)
     launcher = cmd.launcher_exe
     if alias.get("windowed"):
         launcher = cmd.launcherw_exe or launcher
-    LOGGER.debug("Create %s linking to %s using %s", alias["name"], target, launcher)
     if not launcher or not launcher.is_file():
+        unlink(p)
         LOGGER.warn("Skipping %s alias because the launcher template was not found.", alias["name"])
-        return
-    p.write_bytes(launcher.read_bytes())
+        return None
+    data, digest = _read_launcher(launcher, {} if launchers is None else launchers)
+    record = {"name": alias["name"], "target": str(target), "launcher": digest,
+              "install": install_id}
+    if existing and all(existing.get(k) == v for k, v in record.items()):
+        try:
+            if (_file_stamp(p) == existing.get("stamp")
+                and p.with_name(p.name + ".__target__").is_file()):
+                LOGGER.debug("Alias %s is up to date", alias["name"])
+                return existing
+        except OSError:
+            pass
+    ensure_tree(p)
+    unlink(p)
+    LOGGER.debug("Create %s linking to %s using %s", alias["name"], target, launcher)
+    p.write_bytes(data)
     p.with_name(p.name + ".__target__").write_text(str(target), encoding="utf-8")
+    return {**record, "stamp": _file_stamp(p)}
+
+
+def get_alias_index(cmd):
+    """Returns a dict mapping alias names to records of their targets.
+
+    The records come from the shortcut manifest if it matches the aliases in
+    global_dir. Otherwise, they are rebuilt by reading every alias.
+    """
+    if not cmd.global_dir or not cmd.global_dir.is_dir():
+        return {}
+    on_disk = {t.with_suffix("").name.casefold(): t for t in cmd.global_dir.glob("*.__target__")}
+    manifest = _read_shortcut_manifest(cmd)
+    aliases = (manifest or {}).get("aliases")
+    if isinstance(aliases, dict) and aliases.keys() == on_disk.keys():
+        return aliases
+    LOGGER.debug("Rebuilding alias index from %s", cmd.global_dir)
+    index = {}
+    for name, t in on_disk.items():
+        try:
+            target = t.read_text(encoding="utf-8-sig", errors="strict")
+        except OSError:
+            continue
+        index[name] = {"name": t.with_suffix("").name, "target": target}
+    return index
+
+
+def find_install_aliases(cmd, install, index=None):
+    """Returns the paths of aliases in global_dir that launch install."""
+    if index is None:
+        index = get_alias_index(cmd)
+    return [
+        cmd.global_dir / r["name"]
+        for r in index.values()
+        if r.get("install") == install["id"] or PurePath(r["target"]).match(install["executable"])
+    ]
 
 
 def _create_shortcut_pep514(cmd, install, shortcut):
@@ -273,21 +524,36 @@ SHORTCUT_HANDLERS = {
 }
 
 
-def update_all_shortcuts(cmd, path_warning=True):
+def update_all_shortcuts(cmd, path_warning=True, *, force=False):
+    """Creates aliases and shortcuts for every install, and removes any that
+    are no longer needed.
+
+    Only entries that have changed since the last update are written, unless
+    force is True.
+    """
     LOGGER.debug("Updating global shortcuts")
+    manifest = None if force else _read_shortcut_manifest(cmd)
+    old_aliases = (manifest or {}).get("aliases", {})
+    old_shortcuts = (manifest or {}).get("shortcuts", {})
+    new_aliases = {}
+    new_shortcuts = {}
+    launchers = {}
     alias_written = set()
     shortcut_written = {}
     for i in cmd.get_installs():
         if cmd.global_dir:
             for a in i.get("alias", ()):
-                if a["name"].casefold() in alias_written:
+                name = a["name"].casefold()
+                if name in alias_written:
                     continue
                 target = i["prefix"] / a["target"]
                 if not target.is_file():
                     LOGGER.warn("Skipping alias '%s' because target '%s' does not exist", a["name"], a["target"])
                     continue
-                _write_alias(cmd, a, target)
-                alias_written.add(a["name"].casefold())
+                record = _write_alias(cmd, a, target, launchers, old_aliases.get(name), i["id"])
+                if record:
+                    new_aliases[name] = record
+                alias_written.add(name)
 
         for s in i.get("shortcuts", ()):
             if cmd.enable_shortcut_kinds and s["kind"] not in cmd.enable_shortcut_kinds:
@@ -300,22 +566,36 @@ def update_all_shortcuts(cmd, path_warning=True):
                 LOGGER.warn("Skipping invalid shortcut for '%s'", i["id"])
                 LOGGER.debug("shortcut: %s", s)
             else:
-                create(cmd, i, s)
+                h = _shortcut_hash(i, s)
+                if h in old_shortcuts.get(s["kind"], ()):
+                    LOGGER.debug("Skipping unchanged %s shortcut for '%s'", s["kind"], i["id"])
+                else:
+                    create(cmd, i, s)
+                new_shortcuts.setdefault(s["kind"], []).append(h)
                 shortcut_written.setdefault(s["kind"], []).append((i, s))
 
     if cmd.global_dir and cmd.global_dir.is_dir() and cmd.launcher_exe:
-        for target in cmd.global_dir.glob("*.exe.__target__"):
-            alias = target.with_suffix("")
+        if manifest is None:
+            stale = [t.with_suffix("") for t in cmd.global_dir.glob("*.exe.__target__")]
+        else:
+            stale = [cmd.global_dir / a["name"] for a in old_aliases.values()]
+        for alias in stale:
             if alias.name.casefold() not in alias_written:
                 LOGGER.debug("Unlink %s", alias)
                 unlink(alias, f"Attempting to remove {alias} is taking some time. " +
                                "Ensure it is not is use, and please continue to wait " +
                                "or press Ctrl+C to abort.")
-                target.unlink()
+                unlink(alias.with_name(alias.name + ".__target__"))
 
     for k, (_, cleanup) in SHORTCUT_HANDLERS.items():
+        if manifest is not None and sorted(new_shortcuts.get(k, ())) == sorted(old_shortcuts.get(k, ())):
+            LOGGER.debug("Skipping cleanup of unchanged %s shortcuts", k)
+            continue
         cleanup(cmd, shortcut_written.get(k, []))
 
+    if cmd.install_dir and cmd.install_dir.is_dir():
+        _write_shortcut_manifest(cmd, {"aliases": new_aliases, "shortcuts": new_shortcuts})
+
     if path_warning and cmd.global_dir and cmd.global_dir.is_dir() and any(cmd.global_dir.glob("*.exe")):
         try:
             if not any(cmd.global_dir.match(p) for p in os.getenv("PATH", "").split(os.pathsep) if p):
@@ -352,6 +632,74 @@ def _same_install(i, j):
     return i["id"] == j["id"] and i["sort-version"] == j["sort-version"]
 
 
+def _find_by_ids(cmd, source, ids):
+    """Returns a dict mapping each id in ids to the latest install for it in
+    source. Index pages are only read until all ids have been found.
+    """
+    remaining = {i.casefold() for i in ids}
+    found = {}
+    with IndexDownloader(source, Index, {}, DOWNLOAD_CACHE,
+                         cache_dir=cmd.download_dir / INDEX_CACHE_DIR,
+                         max_age=cmd.index_cache_max_age,
+                         prefetch=cmd.index_prefetch) as downloader:
+        for index in downloader:
+            for id in list(remaining):
+                try:
+                    found[id] = index.find_by_id(id)
+                except LookupError:
+                    continue
+                remaining.discard(id)
+            if not remaining:
+                break
+    return found
+
+
+def _plan_updates(cmd, installed, sources):
+    """Returns (source, install) pairs for each installed runtime with a newer
+    version available. Each install's own source is checked first, followed by
+    sources. Every source is searched once for all the installs that need it.
+    """
+    chains = [(i, [s for s in dict.fromkeys([i.get("source"), *sources]) if s]) for i in installed]
+    results = {}
+    updates = []
+    for install, chain in chains:
+        first_exc = None
+        update = None
+        for source in chain:
+            if source not in results:
+                ids = [i["id"] for i, c in chains if source in c]
+                LOGGER.debug("Searching %s for updates to %s installs", source, len(ids))
+                try:
+                    results[source] = _find_by_ids(cmd, source, ids)
+                except Exception as ex:
+                    LOGGER.debug("Capturing error in case fallbacks fail", exc_info=True)
+                    results[source] = ex
+            result = results[source]
+            if isinstance(result, Exception):
+                first_exc = first_exc or result
+                continue
+            try:
+                update = result[install["id"].casefold()]
+            except LookupError:
+                LOGGER.error("Failed to find a suitable update for '%s'.", install["id"])
+                raise NoInstallFoundError()
+            break
+        else:
+            if first_exc:
+                raise first_exc
+            # Reachable if all sources are blank
+            raise RuntimeError("All install sources failed, nothing can be updated.")
+        if update["sort-version"] > install["sort-version"]:
+            updates.append((source, update))
+        else:
+            LOGGER.verbose(
+                "No new version available for %s\\%s '%s'.",
+                install["company"], install["tag"],
+                install["display-name"],
+            )
+    return updates
+
+
 def _find_one(cmd, source, tag, *, installed=None, by_id=False):
     if by_id:
         LOGGER.debug("Searching for Python with ID %s", tag)
@@ -360,8 +708,11 @@ def _find_one(cmd, source, tag, *, installed=None, by_id=False):
     else:
         LOGGER.verbose("Searching for default Python version")
 
-    downloader = IndexDownloader(source, Index, {}, DOWNLOAD_CACHE)
-    install = select_package(downloader, tag, cmd.default_platform, by_id=by_id)
+    with IndexDownloader(source, Index, {}, DOWNLOAD_CACHE,
+                         cache_dir=cmd.download_dir / INDEX_CACHE_DIR,
+                         max_age=cmd.index_cache_max_age,
+                         prefetch=cmd.index_prefetch) as downloader:
+        install = select_package(downloader, tag, cmd.default_platform, by_id=by_id)
 
     if by_id:
         return install
@@ -398,15 +749,42 @@ def _find_one(cmd, source, tag, *, installed=None, by_id=False):
     return None
 
 
-def _download_one(cmd, source, install, download_dir, *, must_copy=False):
+def _download_one(cmd, source, install, download_dir, *, must_copy=False, show_progress=True):
+    from .storeutils import (
+        INFO_SUFFIX, STORE_DIR, link_or_copy, mark_used, store_path, write_info,
+    )
+
     package = download_dir / f"{install['id']}-{install['sort-version']}.zip"
     # Preserve nupkg extensions so we can directly reference Nuget packages
     if install["url"].casefold().endswith(".nupkg".casefold()):
         package = package.with_suffix(".nupkg")
 
-    with ProgressPrinter("Downloading", maxwidth=CONSOLE_WIDTH) as on_progress:
-        package = download_package(cmd, install, package, DOWNLOAD_CACHE, on_progress=on_progress)
-    validate_package(install, package)
+    # Packages with a known SHA256 are shared between all installs that use
+    # the same content.
+    stored = store_path(cmd.download_dir / STORE_DIR, install)
+    if stored and not stored.is_file() and download_dir == cmd.download_dir and package.is_file():
+        try:
+            ensure_tree(stored)
+            os.replace(package, stored)
+            LOGGER.debug("Moved %s into the package store", package)
+        except OSError:
+            LOGGER.debug("Failed to move %s into the package store", package, exc_info=True)
+    dest = stored or package
+
+    if show_progress:
+        with ProgressPrinter("Downloading", maxwidth=CONSOLE_WIDTH) as on_progress:
+            dest = download_package(cmd, install, dest, DOWNLOAD_CACHE, on_progress=on_progress)
+    else:
+        dest = download_package(cmd, install, dest, DOWNLOAD_CACHE)
+    validate_package(install, dest)
+    if stored and dest == stored:
+        if not stored.with_name(stored.name + INFO_SUFFIX).is_file():
+            write_info(stored, install)
+        mark_used(stored)
+        if download_dir != cmd.download_dir:
+            return link_or_copy(stored, package)
+        return stored
+    package = dest
     if must_copy and package.parent != download_dir:
         import shutil
         dst = download_dir / package.name
@@ -415,7 +793,94 @@ def _download_one(cmd, source, install, download_dir, *, must_copy=False):
     return package
 
 
-def _install_one(cmd, source, install, *, target=None):
+def _prune_package_store(cmd):
+    if not cmd.download_cache_max_size or cmd.dry_run:
+        return
+    from .storeutils import STORE_DIR, prune_store
+    try:
+        prune_store(cmd.download_dir / STORE_DIR, cmd.download_cache_max_size)
+    except OSError:
+        LOGGER.debug("Failed to prune the package store", exc_info=True)
+
+
+def _download_workers(cmd, count):
+    try:
+        workers = int(cmd.download_workers)
+    except (AttributeError, TypeError, ValueError):
+        workers = 1
+    return max(1, min(workers, count))
+
+
+def _download_key(install):
+    # Installs with the same key are downloaded to the same file
+    from .storeutils import store_key
+    return store_key(install) or (install["id"].casefold(), install.get("sort-version"))
+
+
+def _download_group(cmd, group, download_dir, **kwargs):
+    return [
+        (source, install, _download_one(cmd, source, install, download_dir, **kwargs))
+        for source, install in group
+    ]
+
+
+def _download_many(cmd, items, download_dir, *, must_copy=False):
+    """Downloads each (source, install) pair in items, yielding a
+    (source, install, package) tuple as each download completes.
+
+    Downloads are run concurrently on worker threads, but results are only
+    yielded on the calling thread, so that the caller may extract or copy
+    packages while other downloads are still in progress. Installs that would
+    download to the same file are handled one after another by one worker.
+    """
+    items = list(items)
+    groups = {}
+    for source, install in items:
+        groups.setdefault(_download_key(install), []).append((source, install))
+    workers = _download_workers(cmd, len(groups))
+    if workers <= 1:
+        for source, install in items:
+            LOGGER.info("Downloading %s", install["display-name"])
+            yield source, install, _download_one(cmd, source, install, download_dir,
+                                                 must_copy=must_copy)
+        return
+
+    from concurrent.futures import ThreadPoolExecutor, as_completed
+    LOGGER.debug("Downloading %s packages using %s workers", len(groups), workers)
+    # Progress bars cannot be shared, so we only report completed downloads
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = []
+        for group in groups.values():
+            for source, install in group:
+                LOGGER.info("Downloading %s", install["display-name"])
+            futures.append(pool.submit(_download_group, cmd, group, download_dir,
+                                       must_copy=must_copy, show_progress=False))
+        try:
+            for f in as_completed(futures):
+                for source, install, package in f.result():
+                    LOGGER.verbose("Downloaded %s", install["display-name"])
+                    yield source, install, package
+        finally:
+            # Abandon any downloads that have not started if we are exiting
+            # early, but the executor will wait for the rest to finish.
+            for f in futures:
+                f.cancel()
+
+
+def _install_many(cmd, items):
+    """Installs each (source, install) pair in items, downloading them in
+    parallel and extracting each as soon as its download completes.
+    """
+    items = list(items)
+    if cmd.dry_run or _download_workers(cmd, len(items)) <= 1:
+        for source, install in items:
+            _install_one(cmd, source, install)
+        return
+    for source, install, package in _download_many(cmd, items, cmd.download_dir):
+        _install_one(cmd, source, install, package=package)
+
+
+def _install_one(cmd, source, install, *, target=None, package=None):
     if cmd.repair:
         LOGGER.info("Repairing %s.", install['display-name'])
     elif cmd.update:
@@ -428,7 +893,8 @@ def _install_one(cmd, source, install, *, target=None):
         LOGGER.info("Skipping rest of install due to --dry-run")
         return
 
-    package = _download_one(cmd, source, install, cmd.download_dir)
+    if not package:
+        package = _download_one(cmd, source, install, cmd.download_dir)
 
     dest = target or (cmd.install_dir / install["id"])
 
@@ -441,6 +907,7 @@ def _install_one(cmd, source, install, *, target=None):
                 "Ensure Python is not running, and continue to wait " +
                 "or press Ctrl+C to abort.",
                 remove_ext_first=("exe", "dll", "json"),
+                defer=True,
             )
         except FileExistsError:
             LOGGER.error(
@@ -504,6 +971,23 @@ def _install_one(cmd, source, install, *, target=None):
     LOGGER.verbose("Install complete")
 
 
+def _get_sources(cmd):
+    """Returns the sources to search, in order. Mirrors of the main source are
+    ordered from fastest to slowest, followed by the fallback source.
+    """
+    sources = [cmd.source]
+    if cmd.mirrors:
+        from .mirrorutils import select_sources, STATS_FILE
+        sources = select_sources([cmd.source, *cmd.mirrors], cmd.download_dir / STATS_FILE)
+    return [*sources, cmd.fallback_source]
+
+
+def _source_failed(cmd, source):
+    if cmd.mirrors:
+        from .mirrorutils import record_source_failure, STATS_FILE
+        record_source_failure(cmd.download_dir / STATS_FILE, source)
+
+
 def _fatal_install_error(cmd, ex):
     logfile = cmd.get_log_file()
     if logfile:
@@ -533,7 +1017,8 @@ def execute(cmd):
             LOGGER.info("Skipping shortcut refresh due to --dry-run")
         else:
             LOGGER.info("Refreshing install registrations.")
-            update_all_shortcuts(cmd)
+            update_all_shortcuts(cmd, force=True)
+            update_snapshot(cmd.install_dir, cmd.default_tag, cmd.default_platform)
             LOGGER.debug("END install_command.execute")
         return
 
@@ -588,7 +1073,7 @@ def execute(cmd):
 
             try:
                 first_exc = None
-                for source in [cmd.source, cmd.fallback_source]:
+                for source in _get_sources(cmd):
                     if not source:
                         continue
                     try:
@@ -599,6 +1084,7 @@ def execute(cmd):
                         raise NoInstallFoundError()
                     except Exception as ex:
                         LOGGER.debug("Capturing error in case fallbacks fail", exc_info=True)
+                        _source_failed(cmd, source)
                         first_exc = first_exc or ex
                 else:
                     if first_exc:
@@ -633,55 +1119,27 @@ def execute(cmd):
             installed = []
 
         try:
+            sources = _get_sources(cmd)
             if not cmd.tags:
                 if cmd.repair:
                     LOGGER.verbose("No tags provided, repairing all installs:")
-                    for install in installed:
-                        # Only try to redownload from the same source
-                        _install_one(cmd, install.get('source'), install)
+                    # Only try to redownload from the same source
+                    _install_many(cmd, [(install.get('source'), install) for install in installed])
                     # Fallthrough is safe - cmd.tags is empty
                 elif cmd.update:
                     LOGGER.verbose("No tags provided, updating all installs:")
-                    for install in installed:
-                        first_exc = None
-                        update = None
-                        for source in [install.get('source'), cmd.source, cmd.fallback_source]:
-                            if not source:
-                                continue
-                            try:
-                                update = _find_one(cmd, source, install['id'], by_id=True)
-                                if update:
-                                    break
-                            except LookupError:
-                                LOGGER.error("Failed to find a suitable update for '%s'.", install['id'])
-                                raise NoInstallFoundError()
-                            except Exception as ex:
-                                LOGGER.debug("Capturing error in case fallbacks fail", exc_info=True)
-                                first_exc = first_exc or ex
-                        else:
-                            if first_exc:
-                                raise first_exc
-                            # Reachable if all sources are blank
-                            raise RuntimeError("All install sources failed, nothing can be updated.")
-                        if update and update["sort-version"] > install["sort-version"]:
-                            _install_one(cmd, source, update)
-                        else:
-                            LOGGER.verbose(
-                                "No new version available for %s\\%s '%s'.",
-                                install["company"], install["tag"],
-                                install["display-name"],
-                            )
+                    _install_many(cmd, _plan_updates(cmd, installed, sources))
                     # Fallthrough is safe - cmd.tags is empty
                 else:
                     raise ArgumentError("Specify at least one tag to install, or 'default' for "
                                         "the latest recommended release.")
 
-            installs = []
             first_exc = None
-            for source in [cmd.source, cmd.fallback_source]:
+            for source in sources:
                 if not source:
                     continue
                 LOGGER.debug("Searching %s", source)
+                installs = []
                 try:
                     for tag in cmd.tags:
                         install = _find_one(cmd, source, tag, installed=installed, by_id=cmd.by_id)
@@ -696,22 +1154,27 @@ def execute(cmd):
                     raise
                 except Exception as ex:
                     LOGGER.debug("Capturing error in case fallbacks fail", exc_info=True)
+                    _source_failed(cmd, source)
                     first_exc = first_exc or ex
             else:
                 if first_exc:
                     raise first_exc
                 # Reachable if all sources are blank
                 raise RuntimeError("All install sources failed, nothing can be installed.")
-            for install in installs:
-                if cmd.download:
-                    LOGGER.info("Downloading %s", install["display-name"])
-                    package = _download_one(cmd, source, install, cmd.download, must_copy=True)
+            if cmd.download:
+                packages = {}
+                for _, install, package in _download_many(
+                    cmd, [(source, i) for i in installs], cmd.download, must_copy=True
+                ):
+                    packages[id(install)] = package
+                # Keep the offline index in the order that tags were requested
+                for install in installs:
                     download_index["versions"].append({
                         **install,
-                        "url": package.name,
+                        "url": packages[id(install)].name,
                     })
-                else:
-                    _install_one(cmd, source, install)
+            else:
+                _install_many(cmd, [(source, i) for i in installs])
         except ArgumentError:
             raise
         except NoInstallFoundError as ex:
@@ -719,6 +1182,8 @@ def execute(cmd):
         except Exception as ex:
             return _fatal_install_error(cmd, ex)
 
+        _prune_package_store(cmd)
+
         if cmd.download:
             with open(cmd.download / "index.json", "w", encoding="utf-8") as f:
                 json.dump(download_index, f, indent=2, default=str)
@@ -732,6 +1197,7 @@ def execute(cmd):
                 LOGGER.info("Skipping shortcut refresh due to --dry-run")
             else:
                 update_all_shortcuts(cmd)
+                update_snapshot(cmd.install_dir, cmd.default_tag, cmd.default_platform)
                 print_cli_shortcuts(cmd)
 
     finally:
@@ -1,9 +1,10 @@
 import json
+import os
 
 from .exceptions import NoInstallFoundError, NoInstallsError
 from .logging import DEBUG, LOGGER
 from .pathutils import Path
-from .tagutils import CompanyTag, tag_or_range, companies_match
+from .tagutils import CompanyTag, tag_or_range, companies_match, _split_platform
 from .verutils import Version
 
 
@@ -13,19 +14,183 @@ def _make_sort_key(install):
         # Non-prereleases always sort last
         0 if not Version(install["sort-version"]).is_prerelease else 1,
         # Order by descending tags
-        CompanyTag(install.get("company"), install.get("tag")),
+        CompanyTag(install.get("company"), install.get("tag")).sortkey,
     )
 
 
-def _get_installs(install_dir):
+# The snapshot contains the parsed contents of every __install__.json file in
+# the install directory. It is written by commands that modify installs, and is
+# only used while the set of __install__.json files and their modification
+# times match. Other subdirectories, such as the global and download
+# directories in the default configuration, do not affect it.
+SNAPSHOT_NAME = "__snapshot__.json"
+SNAPSHOT_VERSION = 2
+
+
+def _get_install_dir_state(install_dir):
+    # Only one stat() per subdirectory, so this is much cheaper than reading
+    # every file.
+    state = {}
+    with os.scandir(install_dir) as it:
+        for e in it:
+            if not e.is_dir() or e.name.endswith(".deleteme"):
+                continue
+            try:
+                st = os.stat(os.path.join(e.path, "__install__.json"))
+            except OSError:
+                continue
+            state[e.name] = st.st_mtime_ns
+    return state
+
+
+def _read_install_files(install_dir):
     for d in Path(install_dir).iterdir():
         p = d / "__install__.json"
         try:
             with p.open() as f:
-                j = json.load(f)
-        except FileNotFoundError:
+                yield d.name, json.load(f)
+        except (FileNotFoundError, NotADirectoryError):
             continue
 
+
+# Only the most recently read snapshot is kept in memory
+_SNAPSHOT_CACHE = {}
+
+
+def _read_snapshot(install_dir):
+    file = Path(install_dir) / SNAPSHOT_NAME
+    try:
+        st = os.stat(file)
+        key = str(file), st.st_mtime_ns, st.st_size
+        try:
+            snapshot = _SNAPSHOT_CACHE[key]
+        except KeyError:
+            with file.open() as f:
+                snapshot = json.load(f)
+            _SNAPSHOT_CACHE.clear()
+            _SNAPSHOT_CACHE[key] = snapshot
+    except FileNotFoundError:
+        raise LookupError(file) from None
+    except (OSError, ValueError) as ex:
+        LOGGER.debug("Failed to read %s: %s", file, ex)
+        raise LookupError(file) from ex
+    if not isinstance(snapshot, dict) or snapshot.get("version") != SNAPSHOT_VERSION:
+        LOGGER.debug("Ignoring %s because the version is not supported", file)
+        raise LookupError(file)
+    try:
+        state = _get_install_dir_state(install_dir)
+    except OSError as ex:
+        raise LookupError(file) from ex
+    if snapshot.get("dirs") != state:
+        LOGGER.debug("Ignoring %s because installs have changed", file)
+        raise LookupError(file)
+    return snapshot
+
+
+def _get_resolve_tags(installs, default_tag):
+    # Collects the tags that are most likely to be used to launch one of the
+    # installs: each 'run-for' tag, its version prefixes (with and without a
+    # platform), and the default tag.
+    tags = []
+    if default_tag:
+        try:
+            tags.append(tag_or_range(default_tag))
+        except ValueError:
+            pass
+    for i in installs:
+        for t in i.get("run-for", ()):
+            tag, platform = _split_platform(t["tag"])
+            tags.append(CompanyTag(i["company"], t["tag"]))
+            tags.append(CompanyTag(i["company"], tag))
+            n = 0
+            while n < len(tag) and (tag[n].isdigit() or tag[n] == "."):
+                n += 1
+            bits = tag[:n].strip(".").split(".")
+            for j in range(1, len(bits) + 1):
+                prefix = ".".join(bits[:j])
+                if prefix:
+                    tags.append(CompanyTag(i["company"], prefix))
+                    tags.append(CompanyTag(i["company"], prefix + platform))
+    return {str(t): t for t in tags if isinstance(t, CompanyTag)}
+
+
+def _build_resolve_table(installs, default_tag, default_platform):
+    """Precalculates the result of get_matching_install_tags() for the likely
+    tags, so that launching does not need to parse and compare every tag.
+
+    The results are stored as indexes into 'installs' and their 'run-for'
+    lists, and are only valid for exactly the same list of installs.
+    """
+    positions = {id(i): n for n, i in enumerate(installs)}
+    table = {}
+    for key, tag in _get_resolve_tags(installs, default_tag).items():
+        table[key] = [
+            [
+                [positions[id(i)], next(n for n, t2 in enumerate(i["run-for"]) if t2 is t)]
+                for i, t in _get_matching_install_tags(
+                    installs, tag, windowed=windowed, default_platform=default_platform,
+                    log_debug=False,
+                )
+            ]
+            for windowed in (False, True)
+        ]
+    return {
+        "order": [i["id"] for i in installs],
+        "default_platform": default_platform,
+        "tags": table,
+    }
+
+
+def _lookup_resolve_table(resolve, installs, tag, windowed, default_platform):
+    if not isinstance(tag, CompanyTag) or windowed is None:
+        raise LookupError(tag)
+    # Any unmanaged installs (including virtual environments) were not included
+    # when the table was created, so we can't use it.
+    if any(i.get("unmanaged") for i in installs):
+        raise LookupError(tag)
+    try:
+        if resolve["default_platform"] != default_platform:
+            raise LookupError(default_platform)
+        if resolve["order"] != [i["id"] for i in installs]:
+            raise LookupError(tag)
+        best = resolve["tags"][str(tag)][1 if windowed else 0]
+        return [(installs[n], installs[n]["run-for"][j]) for n, j in best]
+    except (TypeError, ValueError) as ex:
+        raise LookupError(tag) from ex
+
+
+def update_snapshot(install_dir, default_tag=None, default_platform=None):
+    """Rewrites the snapshot of installs in 'install_dir'.
+
+    This should be called after any command modifies the install directory.
+    """
+    file = Path(install_dir) / SNAPSHOT_NAME
+    LOGGER.debug("Updating %s", file)
+    try:
+        # Read the state first, so that any changes made while reading files
+        # will invalidate the snapshot rather than being missed.
+        state = _get_install_dir_state(install_dir)
+        entries = dict(_read_install_files(install_dir))
+        installs = sorted(_parse_installs(install_dir, entries.items()), key=_make_sort_key)
+        snapshot = {
+            "version": SNAPSHOT_VERSION,
+            "dirs": state,
+            "installs": entries,
+            "resolve": _build_resolve_table(installs, default_tag, default_platform),
+        }
+        tmp = file.with_name(f"{file.name}.{os.getpid()}.tmp")
+        with tmp.open("w", encoding="utf-8") as f:
+            json.dump(snapshot, f)
+        os.replace(tmp, file)
+    except FileNotFoundError:
+        LOGGER.debug("Skipping snapshot because %s does not exist", install_dir)
+    except (OSError, TypeError, ValueError):
+        LOGGER.debug("Failed to update %s", file, exc_info=True)
+
+
+def _parse_installs(install_dir, entries):
+    for d, j in entries:
+        p = Path(install_dir) / d / "__install__.json"
         if j.get("schema", 0) == 1:
             # HACK: to help transition alpha users from their existing installs
             try:
@@ -46,6 +211,15 @@ def _get_installs(install_dir):
             continue
 
 
+def _get_installs(install_dir):
+    try:
+        entries = _read_snapshot(install_dir)["installs"].items()
+        LOGGER.debug("Reading installs from snapshot")
+    except LookupError:
+        entries = _read_install_files(install_dir)
+    return _parse_installs(install_dir, entries)
+
+
 def _get_unmanaged_installs():
     from .pep514utils import get_unmanaged_installs
     return get_unmanaged_installs()
@@ -128,6 +302,10 @@ def _patch_install_to_run(i, run_for):
     }
 
 
+def _no_debug(*_):
+    pass
+
+
 def get_matching_install_tags(
     installs,
     tag,
@@ -135,6 +313,26 @@ def get_matching_install_tags(
     default_platform=None,
     single_tag=False,
 ):
+    return _get_matching_install_tags(
+        installs,
+        tag,
+        windowed=windowed,
+        default_platform=default_platform,
+        single_tag=single_tag,
+    )
+
+
+def _get_matching_install_tags(
+    installs,
+    tag,
+    windowed=None,
+    default_platform=None,
+    single_tag=False,
+    *,
+    log_debug=True,
+):
+    debug = LOGGER.debug if log_debug else _no_debug
+
     exact_matches = []
     core_matches = []
     matches = []
@@ -146,7 +344,7 @@ def get_matching_install_tags(
     if tag:
         if isinstance(tag, str):
             tag = tag_or_range(tag)
-        LOGGER.debug("Filtering installs by tag = %s", tag)
+        debug("Filtering installs by tag = %s", tag)
     for i in installs:
         matched_any = False
         for t in i.get("run-for", ()):
@@ -169,29 +367,29 @@ def get_matching_install_tags(
                     matched_any = True
             if single_tag:
                 break
-        if LOGGER.would_log_to_console(DEBUG):
+        if log_debug and LOGGER.would_log_to_console(DEBUG):
             # Don't bother listing all installs unless the user has asked
             # for console output.
             if matched_any:
-                LOGGER.debug("Filter included %s", i["id"])
+                debug("Filter included %s", i["id"])
             else:
-                LOGGER.debug("Filter did not include %s", i["id"])
+                debug("Filter did not include %s", i["id"])
 
     best = [*exact_matches, *core_matches, *matches, *unmanaged_matches]
 
     if tag:
-        LOGGER.debug("tag '%s' matched %s %s", tag, len(best),
-                     "install" if len(best) == 1 else "installs")
+        debug("tag '%s' matched %s %s", tag, len(best),
+              "install" if len(best) == 1 else "installs")
         if exact_matches:
-            LOGGER.debug("- %s exact match(es)", len(exact_matches))
+            debug("- %s exact match(es)", len(exact_matches))
         if core_matches:
-            LOGGER.debug("- %s core install(s) by prefix", len(core_matches))
+            debug("- %s core install(s) by prefix", len(core_matches))
         if matches:
-            LOGGER.debug("- %s non-core install(s) by prefix", len(matches))
+            debug("- %s non-core install(s) by prefix", len(matches))
         if unmanaged_matches:
-            LOGGER.debug("- %s unmanaged install(s) by prefix", len(unmanaged_matches))
+            debug("- %s unmanaged install(s) by prefix", len(unmanaged_matches))
         if fallback_matches:
-            LOGGER.debug("- %s additional installs by tag alone", len(fallback_matches))
+            debug("- %s additional installs by tag alone", len(fallback_matches))
 
     if not best and fallback_matches:
         best = fallback_matches
@@ -200,8 +398,8 @@ def get_matching_install_tags(
     if windowed is not None:
         windowed = bool(windowed)
         best = [(i, t) for i, t in best if windowed == bool(t.get("windowed"))] or best
-        LOGGER.debug("windowed = %s matched %s %s", windowed,
-                     len(best), "install" if len(best) == 1 else "installs")
+        debug("windowed = %s matched %s %s", windowed,
+              len(best), "install" if len(best) == 1 else "installs")
 
     # Filter for default_platform matches (by tag suffix).
     # If none or only prereleases, keep them all
@@ -211,10 +409,10 @@ def get_matching_install_tags(
         best = [(i, t) for i, t in best
                 if i.get("__any-platform")
                 or t["tag"].casefold().endswith(default_platform)]
-        LOGGER.debug("default_platform '%s' matched %s %s", default_platform,
-                     len(best), "install" if len(best) == 1 else "installs")
+        debug("default_platform '%s' matched %s %s", default_platform,
+              len(best), "install" if len(best) == 1 else "installs")
         if not best or all(Version(i["sort-version"]).is_prerelease for i, t in best):
-            LOGGER.debug("Reusing unfiltered list")
+            debug("Reusing unfiltered list")
             best = best2
 
     return best
@@ -254,12 +452,22 @@ def get_install_to_run(
         tag = tag_or_range(tag)
         used_default = False
 
-    best = get_matching_install_tags(
-        installs,
-        tag,
-        windowed=windowed,
-        default_platform=default_platform,
-    )
+    try:
+        best = _lookup_resolve_table(
+            _read_snapshot(install_dir)["resolve"],
+            installs,
+            tag,
+            windowed,
+            default_platform,
+        )
+        LOGGER.debug("Resolved '%s' using snapshot", tag)
+    except LookupError:
+        best = get_matching_install_tags(
+            installs,
+            tag,
+            windowed=windowed,
+            default_platform=default_platform,
+        )
 
     if best:
         return _patch_install_to_run(*best[0])
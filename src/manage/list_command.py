@@ -268,12 +268,13 @@ def execute(cmd):
 
     if cmd.source:
         from .indexutils import Index
-        from .urlutils import IndexDownloader
+        from .urlutils import IndexDownloader, INDEX_CACHE_DIR
         try:
-            installs = _get_installs_from_index(
-                IndexDownloader(cmd.source, Index),
-                tags,
-            )
+            with IndexDownloader(cmd.source, Index,
+                                 cache_dir=cmd.download_dir / INDEX_CACHE_DIR,
+                                 max_age=cmd.index_cache_max_age,
+                                 prefetch=cmd.index_prefetch) as downloader:
+                installs = _get_installs_from_index(downloader, tags)
         except OSError as ex:
             raise SystemExit(1) from ex
     elif cmd.install_dir:
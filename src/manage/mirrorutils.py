@@ -0,0 +1,180 @@
+import os
+import time
+
+from .logging import LOGGER
+from .urlutils import sanitise_url, urlprobe
+
+
+# Name of the file in download_dir that records how each mirror performed
+STATS_FILE = "mirrors.json"
+
+# Mirrors are probed again once their latest measurement is this old (seconds)
+PROBE_MAX_AGE = 6 * 60 * 60
+
+# Probes that take longer than this are treated as failures (seconds)
+PROBE_TIMEOUT = 5.0
+
+# After a failure, a mirror is avoided for this long (seconds)
+FAILURE_BACKOFF = 10 * 60
+
+# Weight given to each new latency measurement
+LATENCY_WEIGHT = 0.5
+
+
+def _index_url(source):
+    # Matches the URL that IndexDownloader will request first
+    url = source.rstrip("/")
+    if not url.casefold().endswith(".json".casefold()):
+        url += "/index.json"
+    return url
+
+
+def load_stats(file):
+    import json
+    try:
+        with open(file, "r", encoding="utf-8") as f:
+            stats = json.load(f)
+        if isinstance(stats, dict):
+            return stats
+    except FileNotFoundError:
+        pass
+    except (OSError, ValueError):
+        LOGGER.debug("Failed to read mirror statistics from %s", file, exc_info=True)
+    return {}
+
+
+def save_stats(file, stats):
+    import json
+    try:
+        os.makedirs(os.path.dirname(file), exist_ok=True)
+        with open(f"{file}.tmp", "w", encoding="utf-8") as f:
+            json.dump(stats, f, indent=2)
+        os.replace(f"{file}.tmp", file)
+    except OSError:
+        LOGGER.debug("Failed to write mirror statistics to %s", file, exc_info=True)
+
+
+def record_success(stats, source, latency, now=None):
+    s = stats.setdefault(sanitise_url(source), {})
+    old = s.get("latency")
+    if old is None:
+        s["latency"] = latency
+    else:
+        s["latency"] = LATENCY_WEIGHT * latency + (1 - LATENCY_WEIGHT) * old
+    s["measured"] = now or time.time()
+    s["successes"] = s.get("successes", 0) + 1
+
+
+def record_failure(stats, source, now=None):
+    s = stats.setdefault(sanitise_url(source), {})
+    s["measured"] = s["last_failure"] = now or time.time()
+    s["failures"] = s.get("failures", 0) + 1
+
+
+def _is_remote(source):
+    return source.partition("://")[0].casefold() in ("http".casefold(), "https".casefold())
+
+
+def rank_sources(sources, stats, now=None):
+    """Orders sources from most to least preferred. Mirrors that failed
+    recently are tried last, then the fastest mirrors are preferred. Without
+    any statistics, the original order is kept.
+    """
+    now = now or time.time()
+    def _key(i_source):
+        i, source = i_source
+        if not _is_remote(source):
+            # Local sources are always fastest
+            return (False, 0, i)
+        s = stats.get(sanitise_url(source), {})
+        failed = now - s.get("last_failure", 0) < FAILURE_BACKOFF
+        return (failed, s.get("latency", float("inf")), i)
+    return [s for _, s in sorted(enumerate(sources), key=_key)]
+
+
+def _probe(url, timeout):
+    # Probes use the same backends and proxy settings as downloads. Any HTTP
+    # response shows that the mirror is reachable, including those that
+    # require credentials or do not allow HEAD.
+    start = time.perf_counter()
+    urlprobe(url, timeout)
+    return time.perf_counter() - start
+
+
+def probe_sources(sources, stats, *, timeout=PROBE_TIMEOUT, probe=_probe):
+    """Sends a HEAD request to every remote source at the same time, and
+    records how long each takes. Returns the first source to respond, or
+    None if none responded in time.
+    """
+    import queue
+    import threading
+
+    sources = [s for s in sources if _is_remote(s)]
+    results = queue.Queue()
+    def _run(source):
+        try:
+            results.put((source, probe(_index_url(source), timeout), None))
+        except Exception as ex:
+            results.put((source, None, ex))
+
+    for source in sources:
+        # Daemon threads ensure that a slow mirror cannot delay our exit
+        threading.Thread(target=_run, args=(source,), daemon=True).start()
+
+    fastest = None
+    deadline = time.monotonic() + timeout
+    pending = set(sources)
+    while pending:
+        try:
+            source, latency, ex = results.get(timeout=max(0, deadline - time.monotonic()))
+        except queue.Empty:
+            break
+        pending.discard(source)
+        if ex is None:
+            LOGGER.debug("Mirror %s responded in %.3fs", sanitise_url(source), latency)
+            record_success(stats, source, latency)
+            fastest = fastest or source
+        else:
+            LOGGER.debug("Mirror %s failed: %s", sanitise_url(source), ex)
+            record_failure(stats, source)
+    for source in pending:
+        LOGGER.debug("Mirror %s did not respond within %ss", sanitise_url(source), timeout)
+        record_failure(stats, source)
+    return fastest
+
+
+def needs_probe(sources, stats, now=None):
+    now = now or time.time()
+    for source in sources:
+        if not _is_remote(source):
+            continue
+        s = stats.get(sanitise_url(source), {})
+        if now - s.get("measured", 0) >= PROBE_MAX_AGE:
+            return True
+    return False
+
+
+def select_sources(sources, stats_file, *, probe=_probe):
+    """Returns sources ordered by preference, probing them first if our
+    statistics are out of date. Statistics are updated in stats_file.
+    """
+    sources = list(dict.fromkeys(s for s in sources if s))
+    if len(sources) <= 1:
+        return sources
+    stats = load_stats(stats_file)
+    if needs_probe(sources, stats):
+        LOGGER.verbose("Checking %s mirrors for the fastest source.", len(sources))
+        probe_sources(sources, stats, probe=probe)
+        save_stats(stats_file, stats)
+    ranked = rank_sources(sources, stats)
+    LOGGER.debug("Mirror order: %s", ", ".join(map(sanitise_url, ranked)))
+    return ranked
+
+
+def record_source_failure(stats_file, source):
+    """Records a failure to use source outside of probing, so that it will
+    be avoided for a while.
+    """
+    stats = load_stats(stats_file)
+    record_failure(stats, source)
+    save_stats(stats_file, stats)
@@ -0,0 +1,190 @@
+import os
+import time
+
+from .exceptions import NoInstallFoundError, NoInstallsError
+from .logging import LOGGER
+
+
+# The launcher sends a single message containing NUL-separated UTF-16 strings:
+# the protocol version, the launcher's root directory, the current working
+# directory, the requested tag, the script path, '1' if windowed (otherwise
+# '0'), followed by its complete environment block.
+#
+# The response is the executable and its arguments separated by a NUL, or an
+# empty message if the launcher should find the runtime itself. We send an
+# empty response whenever the result may not match an in-process lookup, such
+# as scripts with shebang lines (which may display warnings) or any errors.
+PROTOCOL_VERSION = "1"
+
+# Requests are small, so anything larger than this is not from our launcher
+MAX_REQUEST_SIZE = 1024 * 1024
+
+# Loaded configuration is reused until any of its files are modified, or it is
+# older than this many seconds (to pick up registry and new file changes).
+CONFIG_MAX_AGE = 60
+
+# Configuration is cached per directory and environment, but we limit how
+# many we keep. Once full, the cache is cleared and starts again.
+CONFIG_CACHE_SIZE = 16
+
+
+def get_pipe_name():
+    # The launcher calculates the same name, and will ensure that whoever
+    # created the pipe is running as the same user.
+    return r"\\.\pipe\PyManager-Resolver-" + os.getlogin()
+
+
+def _file_state(files):
+    if not files:
+        return ()
+    if not isinstance(files, list):
+        files = [files]
+    state = []
+    for f in files:
+        try:
+            st = os.stat(f)
+        except OSError:
+            state.append((str(f), None, None))
+        else:
+            state.append((str(f), st.st_mtime_ns, st.st_size))
+    return tuple(state)
+
+
+class _Environment(dict):
+    """Environment variables with case-insensitive names, as in os.environ on
+    Windows. Configuration refers to '%LocalAppData%', but the launcher's
+    environment block contains 'LOCALAPPDATA'."""
+    def __getitem__(self, key):
+        return super().__getitem__(key.upper())
+
+    def __contains__(self, key):
+        return super().__contains__(key.upper())
+
+    def get(self, key, default=None):
+        return super().get(key.upper(), default)
+
+
+def _parse_environment(env_block):
+    env = _Environment()
+    for e in env_block.split("\0"):
+        # Skip the hidden per-drive current directory variables
+        if not e or e.startswith("="):
+            continue
+        k, sep, v = e.partition("=")
+        if sep:
+            env[k.upper()] = v
+    return env
+
+
+def _has_shebang(script):
+    try:
+        with open(script, "rb") as f:
+            first = f.read(5)
+    except OSError:
+        # The launcher will not use the script either
+        return False
+    if first.startswith(b"\xEF\xBB\xBF"):
+        first = first[3:]
+    return first.startswith(b"#!")
+
+
+def _load_default_config(root, env):
+    from .commands import DefaultConfig
+    return DefaultConfig(root, env=env)
+
+
+class Resolver:
+    def __init__(self, root, load_config=None):
+        self.root = str(root)
+        self._load_config = load_config or _load_default_config
+        self._configs = {}
+
+    def get_config(self, cwd, env_block):
+        key = cwd, env_block
+        try:
+            cmd, state, loaded = self._configs[key]
+        except KeyError:
+            pass
+        else:
+            if (time.monotonic() - loaded < CONFIG_MAX_AGE
+                and _file_state(cmd._config_files) == state):
+                return cmd
+            LOGGER.debug("Reloading configuration")
+        if len(self._configs) >= CONFIG_CACHE_SIZE:
+            self._configs.clear()
+        cmd = self._load_config(self.root, _parse_environment(env_block))
+        self._configs[key] = cmd, _file_state(cmd._config_files), time.monotonic()
+        return cmd
+
+    def resolve(self, cwd, env_block, tag, script, windowed):
+        if script and not tag:
+            if _has_shebang(os.path.join(cwd, script)):
+                LOGGER.debug("Not resolving %s because it has a shebang", script)
+                return None
+        cmd = self.get_config(cwd, env_block)
+        try:
+            return cmd.get_install_to_run(tag, None, windowed=windowed)
+        except (NoInstallFoundError, NoInstallsError):
+            LOGGER.debug("No install found for '%s'", tag, exc_info=True)
+            return None
+
+    def handle(self, request):
+        from .scriptutils import quote_args
+        try:
+            fields = request.decode("utf-16-le").split("\0")
+            version, root, cwd, tag, script, windowed, *env_block = fields
+        except ValueError:
+            LOGGER.debug("Ignoring invalid request")
+            return b""
+        if version != PROTOCOL_VERSION or root.casefold() != self.root.casefold():
+            LOGGER.debug("Ignoring request for version %s from %s", version, root)
+            return b""
+        LOGGER.verbose("Resolving '%s' or '%s'%s", tag, script, " (windowed)" if windowed == "1" else "")
+        # Configuration and environment variables may contain relative paths,
+        # so we switch to the launcher's directory while we process them.
+        prev_cwd = os.getcwd()
+        try:
+            os.chdir(cwd)
+            try:
+                i = self.resolve(cwd, "\0".join(env_block), tag, script, windowed == "1")
+            finally:
+                os.chdir(prev_cwd)
+        except Exception:
+            LOGGER.debug("Failed to resolve request", exc_info=True)
+            return b""
+        if not i:
+            return b""
+        exe = str(i["executable"])
+        args = quote_args(i.get("executable_args", ()))
+        LOGGER.verbose("Selected %s %s", exe, args)
+        return f"{exe}\0{args}".encode("utf-16-le")
+
+
+def execute(cmd):
+    from multiprocessing.connection import Listener
+
+    resolver = Resolver(cmd.root)
+    name = get_pipe_name()
+    try:
+        listener = Listener(name, family="AF_PIPE")
+    except PermissionError:
+        LOGGER.error("The resolver is already running.")
+        return
+
+    LOGGER.info("Resolver is listening on %s. Press Ctrl+C to stop.", name)
+    try:
+        with listener:
+            while True:
+                try:
+                    conn = listener.accept()
+                except OSError:
+                    LOGGER.debug("Failed to accept connection", exc_info=True)
+                    continue
+                with conn:
+                    try:
+                        request = conn.recv_bytes(MAX_REQUEST_SIZE)
+                        conn.send_bytes(resolver.handle(request))
+                    except (OSError, EOFError):
+                        LOGGER.debug("Failed to respond to request", exc_info=True)
+    except KeyboardInterrupt:
+        LOGGER.info("Resolver has stopped.")
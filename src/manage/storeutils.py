@@ -0,0 +1,142 @@
+import json
+import os
+import time
+
+from .fsutils import ensure_tree, unlink
+from .logging import LOGGER
+from .urlutils import RESUME_SUFFIX
+
+
+# Subdirectory of download_dir containing packages named by their SHA256 hash
+STORE_DIR = "store"
+
+# Suffix of the file describing where each stored package came from
+INFO_SUFFIX = ".info"
+
+PACKAGE_SUFFIXES = ".zip", ".nupkg"
+
+# Other files that may be kept alongside a stored package
+SIDECAR_SUFFIXES = INFO_SUFFIX, ".hash", RESUME_SUFFIX
+
+
+def store_key(install):
+    """Returns the SHA256 hash of the install's package, or None if the index
+    does not provide one.
+    """
+    try:
+        key = install["hash"]["sha256"]
+    except (LookupError, TypeError):
+        return None
+    return key.lower() if isinstance(key, str) and key else None
+
+
+def store_path(store_dir, install):
+    key = store_key(install)
+    if not key:
+        return None
+    if install["url"].casefold().endswith(".nupkg".casefold()):
+        return store_dir / f"{key}.nupkg"
+    return store_dir / f"{key}.zip"
+
+
+def write_info(package, install):
+    info = {k: install[k] for k in ("id", "display-name", "sort-version", "url") if k in install}
+    try:
+        with open(f"{package}{INFO_SUFFIX}", "w", encoding="utf-8") as f:
+            json.dump(info, f)
+    except OSError:
+        LOGGER.debug("Failed to write package info for %s", package, exc_info=True)
+
+
+def _read_info(package):
+    try:
+        with open(f"{package}{INFO_SUFFIX}", "r", encoding="utf-8") as f:
+            info = json.load(f)
+        if isinstance(info, dict):
+            return info
+    except (OSError, ValueError):
+        pass
+    return {}
+
+
+def mark_used(package):
+    # Only the access time is updated, because the modified time is used to
+    # detect changes to the package.
+    try:
+        st = os.stat(package)
+        os.utime(package, ns=(time.time_ns(), st.st_mtime_ns))
+    except OSError:
+        LOGGER.debug("Failed to update last use of %s", package, exc_info=True)
+
+
+def link_or_copy(src, dest):
+    """Makes dest refer to the same content as src, preferring a hard link
+    so that no additional space is used.
+    """
+    unlink(dest)
+    ensure_tree(dest)
+    try:
+        os.link(src, dest)
+        LOGGER.debug("Linked %s to %s", dest, src)
+    except OSError:
+        import shutil
+        LOGGER.debug("Unable to link %s - copying instead", dest, exc_info=True)
+        shutil.copyfile(src, dest)
+    return dest
+
+
+def list_store(store_dir):
+    """Returns details of each package in the store, most recently used
+    first. Partial downloads, which have a resume file alongside them, are
+    not included.
+    """
+    entries = []
+    try:
+        files = list(store_dir.iterdir())
+    except FileNotFoundError:
+        return entries
+    names = {p.name.casefold() for p in files}
+    for p in files:
+        if p.suffix.casefold() not in (s.casefold() for s in PACKAGE_SUFFIXES):
+            continue
+        if (p.name + RESUME_SUFFIX).casefold() in names:
+            continue
+        try:
+            st = os.stat(p)
+        except OSError:
+            continue
+        entries.append({
+            **_read_info(p),
+            "path": p,
+            "size": st.st_size,
+            "last_used": max(st.st_atime, st.st_mtime),
+        })
+    entries.sort(key=lambda e: e["last_used"], reverse=True)
+    return entries
+
+
+def remove_package(package):
+    unlink(package)
+    for suffix in SIDECAR_SUFFIXES:
+        unlink(package.with_name(package.name + suffix))
+
+
+def prune_store(store_dir, max_size, *, keep=()):
+    """Removes the least recently used packages until the store is no larger
+    than max_size bytes. Packages in keep are never removed. Returns the
+    entries that were removed.
+    """
+    entries = list_store(store_dir)
+    total = sum(e["size"] for e in entries)
+    keep = {os.path.normcase(os.fspath(k)) for k in keep}
+    removed = []
+    for e in reversed(entries):
+        if total <= max_size:
+            break
+        if os.path.normcase(os.fspath(e["path"])) in keep:
+            continue
+        LOGGER.verbose("Removing %s from the package cache", e.get("display-name") or e["path"].name)
+        remove_package(e["path"])
+        total -= e["size"]
+        removed.append(e)
+    return removed
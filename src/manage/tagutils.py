@@ -1,3 +1,5 @@
+import re
+
 from .verutils import Version
 
 
@@ -6,16 +8,36 @@ from .verutils import Version
 SUPPORTED_PLATFORM_SUFFIXES = ("-64", "-32", "-arm64")
 
 
+# Parsed tags are immutable, so we share instances between all uses of the
+# same strings. Once the cache is full, it is cleared and starts again.
+_CACHE = {}
+_CACHE_SIZE = 4096
+
+
+def _immutable_setattr(self, name, value):
+    raise AttributeError(f"'{type(self).__name__}' object is immutable")
+
+
 class _CompanyKey:
+    __slots__ = ("company", "_company", "is_core", "allow_prefix")
+
     CORE_COMPANY_NAMES = frozenset(map(str.casefold, ["CPython", "PythonCore", ""]))
 
     def __init__(self, company, allow_prefix=True):
-        self.company = company or ""
-        self._company = self.company.casefold()
-        self.is_core = self._company in self.CORE_COMPANY_NAMES
-        if self.is_core:
-            self._company = ""
-        self.allow_prefix = allow_prefix
+        company = company or ""
+        _company = company.casefold()
+        is_core = _company in self.CORE_COMPANY_NAMES
+        if is_core:
+            _company = ""
+        object.__setattr__(self, "company", company)
+        object.__setattr__(self, "_company", _company)
+        object.__setattr__(self, "is_core", is_core)
+        object.__setattr__(self, "allow_prefix", allow_prefix)
+
+    __setattr__ = _immutable_setattr
+
+    def __hash__(self):
+        return hash(self._company)
 
     def startswith(self, other):
         if self.is_core and other.is_core:
@@ -54,8 +76,15 @@ def companies_match(c1, c2):
 
 
 class _AscendingText:
+    __slots__ = ("s",)
+
     def __init__(self, s):
-        self.s = s.casefold()
+        object.__setattr__(self, "s", s.casefold())
+
+    __setattr__ = _immutable_setattr
+
+    def __hash__(self):
+        return hash(self.s)
 
     def startswith(self, other):
         if not isinstance(other, type(self)):
@@ -96,6 +125,8 @@ class _AscendingText:
 
 
 class _DescendingVersion(Version):
+    __slots__ = ()
+
     def __gt__(self, other):
         if other is None:
             return True
@@ -144,15 +175,17 @@ def _platform_gt(x, y):
         return False
 
 
+_TAG_SEGMENT = re.compile(r"^(\d+(?:\.\d+)*)(.*)$")
+
+
 def _sort_tag(tag):
-    import re
     key = []
 
     if not tag:
         return ()
 
     for bit in tag.split("-"):
-        m = re.match(r"^(\d+(?:\.\d+)*)(.*)$", bit)
+        m = _TAG_SEGMENT.match(bit)
         if m:
             key.append(_DescendingVersion(m.group(1)))
             key.append(_AscendingText(m.group(2)))
@@ -161,19 +194,71 @@ def _sort_tag(tag):
     return tuple(key)
 
 
+def _plain_sort_key(company, sortkey, platform):
+    # Produces a flat tuple of built-in types that orders the same as
+    # CompanyTag's comparison operators, so that sorting does not call back
+    # into Python. Core companies are stored as "" and so come first. Each
+    # segment starts with a marker so that versions sort before text.
+    # Versions have their fields negated and trailing zeros removed, followed
+    # by a terminator that is greater than any field and then their length
+    # (tag segments never have a prerelease level). The end marker sorts before any further
+    # segments, and platforms can only be one of the supported suffixes.
+    key = [company._company]
+    for k in sortkey:
+        if isinstance(k, Version):
+            fields = k.sortkey[:Version.MAX_FIELDS]
+            n = len(fields)
+            while n and not fields[n - 1]:
+                n -= 1
+            key.append(0)
+            key.extend(-i for i in fields[:n])
+            key.append(1)
+            key.append(-k.sortkey[-3])
+        else:
+            key.append(1)
+            key.append(k.s)
+    key.append(-1)
+    key.append(SUPPORTED_PLATFORM_SUFFIXES.index(platform) + 1 if platform else 0)
+    return tuple(key)
+
+
 class CompanyTag:
-    def __init__(self, company_or_tag, tag=None, *, loose_company=True):
+    __slots__ = ("_company", "tag", "platform", "_sortkey", "sortkey")
+
+    def __new__(cls, company_or_tag, tag=None, *, loose_company=True):
         if isinstance(company_or_tag, str):
+            key = cls, company_or_tag, tag, loose_company
+            try:
+                return _CACHE[key]
+            except KeyError:
+                pass
             if tag is not None:
                 company = company_or_tag
             else:
                 company, _, tag = (company_or_tag or "").replace("/", "\\").rpartition("\\")
-            self._company = _CompanyKey(company, allow_prefix=loose_company)
+            company = _CompanyKey(company, allow_prefix=loose_company)
         else:
             assert isinstance(company_or_tag, _CompanyKey)
-            self._company = company_or_tag
-        self.tag, self.platform = _split_platform(tag)
-        self._sortkey = _sort_tag(self.tag)
+            key = None
+            company = company_or_tag
+        self = super().__new__(cls)
+        object.__setattr__(self, "_company", company)
+        tag, platform = _split_platform(tag)
+        object.__setattr__(self, "tag", tag)
+        object.__setattr__(self, "platform", platform)
+        object.__setattr__(self, "_sortkey", _sort_tag(tag))
+        # Use 'sortkey' as the key= argument when sorting many tags
+        object.__setattr__(self, "sortkey", _plain_sort_key(company, self._sortkey, platform))
+        if key:
+            if len(_CACHE) >= _CACHE_SIZE:
+                _CACHE.clear()
+            _CACHE[key] = self
+        return self
+
+    __setattr__ = _immutable_setattr
+
+    def __reduce__(self):
+        return _make_company_tag, (self.company, self.tag + self.platform, self._company.allow_prefix)
 
     @property
     def company(self):
@@ -216,7 +301,7 @@ class CompanyTag:
         return repr(str(self))
 
     def __hash__(self):
-        return hash(self._sortkey)
+        return hash((self._company, self._sortkey, self.platform))
 
     def __eq__(self, other):
         if other is None:
@@ -309,6 +394,10 @@ class CompanyTag:
         return self < other or self == other
 
 
+def _make_company_tag(company, tag, loose_company):
+    return CompanyTag(company, tag, loose_company=loose_company)
+
+
 class TagRange:
     def __init__(self, spec):
         self.ranges = ranges = []
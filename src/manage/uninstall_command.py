@@ -1,9 +1,8 @@
 from .exceptions import ArgumentError, FilesInUseError
 from .fsutils import rmtree, unlink
-from .installs import get_matching_install_tags
-from .install_command import update_all_shortcuts
+from .installs import get_matching_install_tags, update_snapshot
+from .install_command import find_install_aliases, get_alias_index, update_all_shortcuts
 from .logging import LOGGER
-from .pathutils import PurePath
 from .tagutils import tag_or_range
 
 
@@ -34,7 +33,7 @@ def execute(cmd):
                     rmtree(
                         i["prefix"],
                         after_5s_warning=warn_msg.format(i["display-name"]),
-                        remove_ext_first=("exe", "dll", "json")
+                        remove_ext_first=("exe", "dll", "json"),
                     )
                 except FilesInUseError:
                     LOGGER.warn("Unable to purge %s because it is still in use.",
@@ -101,6 +100,10 @@ def execute(cmd):
             if not cmd.ask_yn("Uninstall these runtimes: %s?", msg):
                 return
 
+    # Read the alias index before removing anything, as removing aliases
+    # would make it look out of date.
+    alias_index = get_alias_index(cmd)
+
     for i in to_uninstall:
         LOGGER.debug("Uninstalling %s from %s", i["display-name"], i["prefix"])
         try:
@@ -108,6 +111,7 @@ def execute(cmd):
                 i["prefix"],
                 after_5s_warning=warn_msg.format(i["display-name"]),
                 remove_ext_first=("exe", "dll", "json"),
+                defer=True,
             )
         except FilesInUseError as ex:
             LOGGER.error("Could not uninstall %s because it is still in use.",
@@ -115,18 +119,17 @@ def execute(cmd):
             raise SystemExit(1) from ex
         LOGGER.info("Removed %s", i["display-name"])
         try:
-            for target in cmd.global_dir.glob("*.__target__"):
-                alias = target.with_suffix("")
-                entry = target.read_text(encoding="utf-8-sig", errors="strict")
-                if PurePath(entry).match(i["executable"]):
-                    LOGGER.debug("Unlink %s", alias)
-                    unlink(alias, after_5s_warning=warn_msg.format(alias))
-                    unlink(target, after_5s_warning=warn_msg.format(target))
+            for alias in find_install_aliases(cmd, i, alias_index):
+                target = alias.with_name(alias.name + ".__target__")
+                LOGGER.debug("Unlink %s", alias)
+                unlink(alias, after_5s_warning=warn_msg.format(alias))
+                unlink(target, after_5s_warning=warn_msg.format(target))
         except OSError as ex:
             LOGGER.warn("Failed to remove alias: %s", ex)
             LOGGER.debug("TRACEBACK:", exc_info=True)
 
     if to_uninstall:
         update_all_shortcuts(cmd, path_warning=False)
+        update_snapshot(cmd.install_dir, cmd.default_tag, cmd.default_platform)
 
     LOGGER.debug("END uninstall_command.execute")
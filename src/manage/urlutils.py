@@ -1,3 +1,4 @@
+import errno
 import os
 import time
 
@@ -56,9 +57,39 @@ ENABLE_BITS = os.getenv("PYMANAGER_ENABLE_BITS_DOWNLOAD", "1").lower()[:1] in "1
 ENABLE_WINHTTP = os.getenv("PYMANAGER_ENABLE_WINHTTP_DOWNLOAD", "1").lower()[:1] in "1yt"
 ENABLE_URLLIB = os.getenv("PYMANAGER_ENABLE_URLLIB_DOWNLOAD", "1").lower()[:1] in "1yt"
 ENABLE_POWERSHELL = os.getenv("PYMANAGER_ENABLE_POWERSHELL_DOWNLOAD", "1").lower()[:1] in "1yt"
+ENABLE_INDEX_CACHE = os.getenv("PYMANAGER_ENABLE_INDEX_CACHE", "1").lower()[:1] in "1yt"
+ENABLE_CONNECTION_POOL = os.getenv("PYMANAGER_ENABLE_CONNECTION_POOL", "1").lower()[:1] in "1yt"
+ENABLE_SEGMENTED = os.getenv("PYMANAGER_ENABLE_SEGMENTED_DOWNLOAD", "1").lower()[:1] in "1yt"
 
 SUPPORTED_SCHEMES = "http".casefold(), "https".casefold(), "file".casefold()
 
+# Number of times the urllib backend retries an interrupted download, and the
+# initial delay between attempts (seconds), which doubles after each retry.
+URLLIB_RETRIES = 4
+URLLIB_RETRY_BACKOFF = 1.0
+
+# Idle connections kept open for each host, and the number of redirects that
+# will be followed for a single request
+POOL_MAX_IDLE = 8
+MAX_REDIRECTS = 10
+
+# Segmented downloads never use segments smaller than this (bytes)
+SEGMENT_MIN_SIZE = 8 * 1024 * 1024
+
+# Seconds to wait for the server to respond during a segmented download, so
+# that an unreachable server does not delay falling back to other backends
+SEGMENT_TIMEOUT = 15
+
+# Suffix of the file recording how to resume a partial download
+RESUME_SUFFIX = ".resume"
+
+# Subdirectory of download_dir for cached indexes
+INDEX_CACHE_DIR = "index"
+
+# Included in the key for parsed indexes, so that changes to their format or
+# validation cause them to be parsed again.
+PARSED_INDEX_VERSION = 3
+
 class NoInternetError(Exception):
     pass
 
@@ -74,6 +105,12 @@ class _Request:
         self.outfile = Path(outfile) if outfile else None
         self._on_progress = None
         self._on_auth_request = None
+        self.hash_algorithms = ()
+        self._hashers = None
+        self.segments = 1
+        self.segment_min_size = SEGMENT_MIN_SIZE
+        # Set by backends that can provide the response headers
+        self.response_headers = None
 
     def __str__(self):
         return sanitise_url(self.url)
@@ -82,6 +119,24 @@ class _Request:
         if self._on_progress:
             self._on_progress(progress)
 
+    def begin_hashes(self):
+        # Backends that see the downloaded bytes call this before passing
+        # them to update_hashes(). Others leave the hashes unset, so that
+        # the caller knows to read the file again.
+        if self.hash_algorithms:
+            import hashlib
+            self._hashers = {k: hashlib.new(k) for k in self.hash_algorithms}
+
+    def update_hashes(self, data):
+        if self._hashers:
+            for h in self._hashers.values():
+                h.update(data)
+
+    def get_hashes(self):
+        if self._hashers is None:
+            return None
+        return {k: h.hexdigest() for k, h in self._hashers.items()}
+
     def on_auth_request(self, url=None):
         if url is None:
             url = self.url
@@ -169,10 +224,15 @@ def _winhttp_urlopen(request):
     accepts = headers.pop("accepts", "application/*;text/*")
     header_str = "\r\n".join(f"{k}: {v}" for k, v in headers.items())
     method = request.method.upper()
+
+    def on_response(response_headers):
+        request.response_headers = {k: v for k, v in response_headers.items() if v}
+
     LOGGER.debug("winhttp_urlopen: %s", request)
     try:
         data = winhttp_urlopen(request.url, method, header_str, accepts,
-            request.chunksize, request.on_progress, request.on_auth_request)
+            request.chunksize, request.on_progress, request.on_auth_request,
+            on_response)
     except OSError as ex:
         if ex.winerror == 0x00002EE7:
             LOGGER.debug("winhttp_isconnected: %s", winhttp_isconnected())
@@ -181,6 +241,11 @@ def _winhttp_urlopen(request):
         if (ex.winerror or 0) & 0xFFFFFFFF == 0x80190194:
             # Returned HTTP status 404 (0x194)
             raise FileNotFoundError() from ex
+        if (ex.winerror or 0) & 0xFFFFFFFF == 0x80190130:
+            # Returned HTTP status 304 (0x130), which only happens when the
+            # caller provided validators
+            request.on_progress(100)
+            return None
         raise
     if data[:3] == b"\xEF\xBB\xBF":
         data = data[3:]
@@ -188,7 +253,200 @@ def _winhttp_urlopen(request):
 
 def _winhttp_urlretrieve(request):
     assert request.outfile
-    request.outfile.write_bytes(_winhttp_urlopen(request))
+    data = _winhttp_urlopen(request)
+    request.begin_hashes()
+    request.update_hashes(data)
+    request.outfile.write_bytes(data)
+
+
+class _PooledResponse:
+    def __init__(self, pool, key, conn, resp, url):
+        self._pool = pool
+        self._key = key
+        self._conn = conn
+        self._resp = resp
+        self.url = url
+        self.status = resp.status
+        self.reason = resp.reason
+        self.headers = resp.headers
+
+    def read(self, amt=None):
+        return self._resp.read(amt)
+
+    def close(self):
+        conn, self._conn = self._conn, None
+        if not conn:
+            return
+        resp = self._resp
+        if not resp.isclosed() and not resp.will_close and (resp.length or 0) <= 64 * 1024:
+            # Read any small remainder so that the connection can be reused
+            try:
+                resp.read()
+            except OSError:
+                pass
+        if resp.isclosed() and not resp.will_close:
+            self._pool.release(self._key, conn)
+        else:
+            resp.close()
+            conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class _ConnectionPool:
+    """Keeps HTTP connections open so that later requests to the same host
+    can skip the connection and TLS handshakes. Also remembers credentials
+    that each host accepted, so they are sent immediately rather than after
+    a 401 response.
+
+    Only the urllib backend uses the pool. On Windows, BITS and WinHTTP are
+    tried first and manage their own connections, so the pool only helps
+    when they are unavailable, disabled or have failed, and for segmented
+    downloads (which are opt-in).
+    """
+    def __init__(self, max_idle=POOL_MAX_IDLE):
+        import threading
+        self.max_idle = max_idle
+        self._lock = threading.Lock()
+        self._idle = {}
+        self._auth = {}
+        self._proxies = None
+
+    @staticmethod
+    def key(url):
+        import urllib.parse
+        p = urllib.parse.urlsplit(url)
+        scheme = p.scheme.lower()
+        return scheme, p.hostname, p.port or (443 if scheme == "https" else 80)
+
+    def can_pool(self, url):
+        import urllib.request
+        scheme, host, _ = self.key(url)
+        if scheme not in ("http", "https") or not host:
+            return False
+        if self._proxies is None:
+            self._proxies = urllib.request.getproxies()
+        # Requests through a proxy are left to urllib
+        return not self._proxies.get(scheme) or bool(urllib.request.proxy_bypass(host))
+
+    def get_auth(self, url):
+        return self._auth.get(self.key(url))
+
+    def set_auth(self, url, header):
+        self._auth[self.key(url)] = header
+
+    def _acquire(self, key, timeout):
+        import http.client
+        import socket
+        with self._lock:
+            idle = self._idle.get(key)
+            if idle:
+                conn = idle.pop()
+                conn.timeout = socket.getdefaulttimeout() if timeout is None else timeout
+                if conn.sock:
+                    conn.sock.settimeout(conn.timeout)
+                return conn, True
+        scheme, host, port = key
+        kwargs = {} if timeout is None else {"timeout": timeout}
+        if scheme == "https":
+            return http.client.HTTPSConnection(host, port, **kwargs), False
+        return http.client.HTTPConnection(host, port, **kwargs), False
+
+    def release(self, key, conn):
+        with self._lock:
+            idle = self._idle.setdefault(key, [])
+            if len(idle) < self.max_idle:
+                idle.append(conn)
+                return
+        conn.close()
+
+    def close(self):
+        with self._lock:
+            idle, self._idle = self._idle, {}
+        for conns in idle.values():
+            for conn in conns:
+                conn.close()
+
+    def request(self, method, url, headers, timeout=None):
+        import urllib.parse
+        key = self.key(url)
+        p = urllib.parse.urlsplit(url)
+        target = p.path or "/"
+        if p.query:
+            target = f"{target}?{p.query}"
+        while True:
+            conn, reused = self._acquire(key, timeout)
+            try:
+                conn.request(method, target, headers=headers)
+                resp = conn.getresponse()
+            except ConnectionError:
+                conn.close()
+                if reused:
+                    # The server closed the idle connection, so try another
+                    LOGGER.debug("Pooled connection was closed - reconnecting")
+                    continue
+                raise
+            except BaseException:
+                conn.close()
+                raise
+            return _PooledResponse(self, key, conn, resp, url)
+
+
+_POOL = _ConnectionPool()
+
+
+def close_connections():
+    """Closes any idle connections that are being kept open."""
+    _POOL.close()
+
+
+def _pooled_urlopen(req, timeout=None):
+    # Behaves like urllib.request.urlopen, including following redirects and
+    # raising HTTPError for unsuccessful responses, but reuses connections.
+    import sys
+    import urllib.error
+    import urllib.parse
+    from urllib.request import Request, urlopen
+
+    url = req.full_url
+    kwargs = {} if timeout is None else {"timeout": timeout}
+    if not ENABLE_CONNECTION_POOL or not _POOL.can_pool(url):
+        return urlopen(req, **kwargs)
+
+    method = req.get_method()
+    headers = dict(req.header_items())
+    headers.setdefault("User-agent", "Python-urllib/%s.%s" % sys.version_info[:2])
+    if "Authorization" not in headers:
+        cached = _POOL.get_auth(url)
+        if cached:
+            LOGGER.debug("Using cached credentials for %s", sanitise_url(url))
+            headers["Authorization"] = cached
+
+    for _ in range(MAX_REDIRECTS + 1):
+        r = _POOL.request(method, url, headers, timeout)
+        location = r.headers.get("Location")
+        if r.status in (301, 302, 303, 307, 308) and location:
+            r.close()
+            new_url = urllib.parse.urljoin(url, location)
+            if _POOL.key(new_url) != _POOL.key(url):
+                # Never send credentials to a different host
+                headers.pop("Authorization", None)
+            if r.status == 303 and method != "HEAD":
+                method = "GET"
+            url = new_url
+            if not _POOL.can_pool(url):
+                return urlopen(Request(url, method=method, headers=headers), **kwargs)
+            continue
+        if r.status >= 300:
+            r.close()
+            raise urllib.error.HTTPError(url, r.status, r.reason, r.headers, None)
+        return r
+    r.close()
+    raise urllib.error.HTTPError(url, r.status, "Too many redirects", r.headers, None)
 
 
 def _basic_auth_header(username, password):
@@ -200,26 +458,35 @@ def _basic_auth_header(username, password):
 
 def _urllib_urlopen(request):
     import urllib.error
-    from urllib.request import Request, urlopen
+    from urllib.request import Request
 
     LOGGER.debug("urlopen: %s", request)
     req = Request(request.url, method=request.method, headers=request.headers)
     try:
         request.on_progress(0)
         try:
-            r = urlopen(req)
-        except urllib.error.HTTPError as ex:
-            if ex.status == 401:
+            try:
+                r = _pooled_urlopen(req)
+            except urllib.error.HTTPError as ex:
+                if ex.status != 401:
+                    raise
                 auth = request.on_auth_request()
                 if not auth:
                     raise
                 req.headers["Authorization"] = _basic_auth_header(*auth)
-                r = urlopen(req)
+                r = _pooled_urlopen(req)
+                _POOL.set_auth(req.full_url, req.headers["Authorization"])
+        except urllib.error.HTTPError as ex:
+            if ex.status == 304:
+                # Only returned when the caller provided validators
+                request.response_headers = ex.headers
+                request.on_progress(100)
+                return None
             elif ex.status == 404:
                 raise FileNotFoundError from ex
-            else:
-                raise
+            raise
         with r:
+            request.response_headers = r.headers
             data = r.read()
         request.on_progress(100)
         return data
@@ -227,39 +494,285 @@ def _urllib_urlopen(request):
         LOGGER.debug("urlopen: complete")
 
 
-def _urllib_urlretrieve(request):
+def _resume_file(outfile):
+    return outfile.with_name(outfile.name + RESUME_SUFFIX)
+
+
+def _read_resume_info(request):
+    # Returns the validators recorded for a partial download of this URL, or
+    # None if there is no partial download that can safely be resumed.
+    import json
+    outfile = request.outfile
+    try:
+        with open(_resume_file(outfile), "r", encoding="utf-8") as f:
+            info = json.load(f)
+        if info.get("url") != sanitise_url(request.url):
+            return None
+        if not info.get("etag") and not info.get("last_modified"):
+            return None
+        size = outfile.stat().st_size
+        length = info.get("length")
+        if not size or (length and size >= length):
+            return None
+    except (OSError, ValueError, AttributeError):
+        return None
+    info["size"] = size
+    return info
+
+
+def _write_resume_info(request, headers, offset):
+    import json
+    etag = headers.get("ETag")
+    last_modified = headers.get("Last-Modified")
+    try:
+        length = offset + int(headers.get("Content-Length", 0))
+    except ValueError:
+        length = None
+    if etag and etag.startswith("W/"):
+        # Weak validators cannot be used to combine ranges
+        etag = None
+    try:
+        with open(_resume_file(request.outfile), "w", encoding="utf-8") as f:
+            json.dump({
+                "url": sanitise_url(request.url),
+                "etag": etag,
+                "last_modified": last_modified,
+                "length": length or None,
+            }, f)
+    except OSError:
+        LOGGER.debug("Failed to record resume information", exc_info=True)
+
+
+# Socket errors that mean we cannot reach the host at all, which is not fixed
+# by waiting and retrying.
+_UNREACHABLE_ERRNOS = frozenset(
+    getattr(errno, n) for n in ("ENETUNREACH", "EHOSTUNREACH", "ENETDOWN",
+                                "WSAENETUNREACH", "WSAEHOSTUNREACH", "WSAENETDOWN")
+    if hasattr(errno, n)
+)
+
+
+def _is_retryable(ex):
+    import http.client
+    import socket
     import urllib.error
-    from urllib.request import Request, urlopen
+    if isinstance(ex, urllib.error.HTTPError):
+        return ex.status >= 500
+    if isinstance(ex, urllib.error.URLError):
+        ex = ex.reason
+    if isinstance(ex, (socket.gaierror, ConnectionRefusedError)):
+        return False
+    if isinstance(ex, OSError) and ex.errno in _UNREACHABLE_ERRNOS:
+        return False
+    return isinstance(ex, (http.client.HTTPException, ConnectionError, TimeoutError))
+
+
+def _urllib_urlretrieve_once(request):
+    import urllib.error
+    from urllib.request import Request
+
+    outfile = request.outfile
+    headers = dict(request.headers)
+    info = _read_resume_info(request) if request.method == "GET" else None
+    if info:
+        headers["Range"] = f"bytes={info['size']}-"
+        headers["If-Range"] = info["etag"] or info["last_modified"]
+    req = Request(request.url, method=request.method, headers=headers)
+    try:
+        r = _pooled_urlopen(req)
+    except urllib.error.HTTPError as ex:
+        if ex.status == 401:
+            auth = request.on_auth_request()
+            if not auth:
+                raise
+            req.headers["Authorization"] = _basic_auth_header(*auth)
+            r = _pooled_urlopen(req)
+            _POOL.set_auth(req.full_url, req.headers["Authorization"])
+        elif ex.status == 416 and info:
+            # Our partial file is no longer valid, so start again
+            LOGGER.debug("Server rejected range request - restarting download")
+            unlink(_resume_file(outfile))
+            unlink(outfile)
+            return _urllib_urlretrieve_once(request)
+        else:
+            raise
+    with r:
+        offset = 0
+        if info and r.status == 206:
+            offset = info["size"]
+            LOGGER.debug("Resuming download at %s bytes", offset)
+        elif info:
+            LOGGER.debug("Server did not resume download - restarting")
+        try:
+            total = offset + int(r.headers.get("Content-Length", 0))
+        except ValueError:
+            total = 1
+        progress = offset
+        request.begin_hashes()
+        if offset:
+            with open(outfile, "rb") as f:
+                for chunk in iter(lambda: f.read(request.chunksize), b""):
+                    request.update_hashes(chunk)
+        if request.method == "GET":
+            _write_resume_info(request, r.headers, offset)
+        with open(outfile, "ab" if offset else "wb") as f:
+            for chunk in iter(lambda: r.read(request.chunksize), b""):
+                f.write(chunk)
+                request.update_hashes(chunk)
+                progress += len(chunk)
+                request.on_progress((progress * 100) // total)
+        if total > 1 and progress < total:
+            import http.client
+            raise http.client.IncompleteRead(b"", total - progress)
+    unlink(_resume_file(outfile))
+
 
+def _urllib_urlretrieve(request):
     outfile = request.outfile
     LOGGER.debug("urlretrieve: %s -> %s", request, outfile)
     ensure_tree(outfile)
-    unlink(outfile)
-    req = Request(request.url, method=request.method, headers=request.headers)
+    if not _read_resume_info(request):
+        unlink(outfile)
+    delay = URLLIB_RETRY_BACKOFF
     try:
         request.on_progress(0)
-        try:
-            r = urlopen(req)
-        except urllib.error.HTTPError as ex:
-            if ex.status == 401:
-                req.auth = request.on_auth_request()
-                if not req.auth:
+        for attempt in range(URLLIB_RETRIES + 1):
+            try:
+                _urllib_urlretrieve_once(request)
+                break
+            except Exception as ex:
+                if attempt >= URLLIB_RETRIES or not _is_retryable(ex):
                     raise
-                r = urlopen(req)
-            else:
-                raise
-        with r:
-            progress = 0
+                LOGGER.verbose("Download interrupted (%s). Retrying in %s seconds.", ex, delay)
+                LOGGER.debug("ERROR:", exc_info=True)
+                time.sleep(delay)
+                delay *= 2
+        request.on_progress(100)
+    finally:
+        LOGGER.debug("urlretrieve: complete")
+
+
+class _SegmentsUnsupported(Exception):
+    pass
+
+
+def _urllib_open(request, req, timeout=None):
+    import urllib.error
+    try:
+        return _pooled_urlopen(req, timeout)
+    except urllib.error.HTTPError as ex:
+        if ex.status == 404:
+            raise FileNotFoundError from ex
+        if ex.status != 401:
+            raise
+        auth = request.on_auth_request()
+        if not auth:
+            raise
+        req.headers["Authorization"] = _basic_auth_header(*auth)
+        r = _pooled_urlopen(req, timeout)
+        _POOL.set_auth(req.full_url, req.headers["Authorization"])
+        return r
+
+
+def _segment_ranges(length, segments, min_size):
+    count = max(1, min(segments, length // max(1, min_size)))
+    size = -(-length // count)
+    return [(start, min(start + size, length) - 1) for start in range(0, length, size)]
+
+
+def _segmented_urlretrieve(request):
+    import http.client
+    import threading
+    from concurrent.futures import ThreadPoolExecutor
+    from urllib.request import Request
+
+    outfile = request.outfile
+    if _resume_file(outfile).is_file():
+        raise _SegmentsUnsupported("a partial download will be resumed instead")
+
+    head = Request(request.url, method="HEAD", headers=request.headers)
+    with _urllib_open(request, head, SEGMENT_TIMEOUT) as r:
+        headers = r.headers
+    if headers.get("Accept-Ranges", "").strip().lower() != "bytes":
+        raise _SegmentsUnsupported("server does not accept byte ranges")
+    try:
+        length = int(headers["Content-Length"])
+    except (KeyError, ValueError):
+        raise _SegmentsUnsupported("server did not provide the length") from None
+    ranges = _segment_ranges(length, request.segments, request.segment_min_size)
+    if len(ranges) <= 1:
+        raise _SegmentsUnsupported("file is too small to split")
+
+    # Every segment must come from the same version of the file
+    validator = headers.get("ETag")
+    if not validator or validator.startswith("W/"):
+        validator = headers.get("Last-Modified")
+    segment_headers = dict(request.headers)
+    if validator:
+        segment_headers["If-Range"] = validator
+    if head.get_header("Authorization"):
+        segment_headers["Authorization"] = head.get_header("Authorization")
+
+    LOGGER.debug("urlretrieve: %s -> %s in %s segments", request, outfile, len(ranges))
+    ensure_tree(outfile)
+    unlink(outfile)
+    with open(outfile, "wb") as f:
+        f.truncate(length)
+
+    lock = threading.Lock()
+    stop = threading.Event()
+    progress = 0
+
+    def _fetch(start, end):
+        nonlocal progress
+        delay = URLLIB_RETRY_BACKOFF
+        for attempt in range(URLLIB_RETRIES + 1):
+            req = Request(request.url, headers={**segment_headers, "Range": f"bytes={start}-{end}"})
             try:
-                total = int(r.headers.get("Content-Length", 0))
-            except ValueError:
-                total = 1
-            with open(outfile, "wb") as f:
-                for chunk in iter(lambda: r.read(request.chunksize), b""):
-                    f.write(chunk)
-                    progress += len(chunk)
-                    request.on_progress((progress * 100) // total)
+                with _urllib_open(request, req, SEGMENT_TIMEOUT) as r:
+                    if r.status != 206:
+                        raise _SegmentsUnsupported("server did not return the requested range")
+                    with open(outfile, "r+b") as f:
+                        f.seek(start)
+                        for chunk in iter(lambda: r.read(min(request.chunksize, end + 1 - start)), b""):
+                            if stop.is_set():
+                                return
+                            f.write(chunk)
+                            start += len(chunk)
+                            with lock:
+                                progress += len(chunk)
+                                request.on_progress((progress * 100) // length)
+                if start <= end:
+                    raise http.client.IncompleteRead(b"", end + 1 - start)
+                return
+            except Exception as ex:
+                if stop.is_set() or attempt >= URLLIB_RETRIES or not _is_retryable(ex):
+                    raise
+                LOGGER.debug("Segment at %s interrupted (%s). Retrying in %s seconds.", start, ex, delay)
+                time.sleep(delay)
+                delay *= 2
+
+    try:
+        request.on_progress(0)
+        with ThreadPoolExecutor(len(ranges)) as pool:
+            futures = [pool.submit(_fetch, *r) for r in ranges]
+            try:
+                for f in futures:
+                    f.result()
+            finally:
+                stop.set()
+        # Segments arrive out of order, and SHA hashes cannot be combined, so
+        # they are calculated afterwards. The file was only just written, so
+        # this is normally read back from the file system cache.
+        request.begin_hashes()
+        if request.hash_algorithms:
+            with open(outfile, "rb") as f:
+                for chunk in iter(lambda: f.read(1024 * 1024), b""):
+                    request.update_hashes(chunk)
         request.on_progress(100)
+    except BaseException:
+        unlink(outfile)
+        raise
     finally:
         LOGGER.debug("urlretrieve: complete")
 
@@ -338,7 +851,14 @@ $r = Invoke-WebRequest '{request.url}' -UseBasicParsing `
                 raise
 
 
-def urlopen(url, method="GET", headers={}, on_progress=None, on_auth_request=None):
+def urlopen(url, method="GET", headers={}, on_progress=None, on_auth_request=None, response_headers=None):
+    """Downloads url and returns the data.
+
+    If response_headers is a dict, it is updated with the response headers
+    (with lowercase names) when the backend can provide them. If the caller
+    passes If-None-Match or If-Modified-Since headers and the server reports
+    that the resource is not modified, returns None.
+    """
     scheme, sep, path = url.partition("://")
     if not sep:
         scheme = "file"
@@ -354,11 +874,16 @@ def urlopen(url, method="GET", headers={}, on_progress=None, on_auth_request=Non
     request._on_progress = on_progress
     request._on_auth_request = on_auth_request
 
+    def _result(data):
+        if response_headers is not None and request.response_headers:
+            response_headers.update((k.lower(), v) for k, v in request.response_headers.items())
+        return data
+
     first_error = None
 
     if ENABLE_WINHTTP:
         try:
-            return _winhttp_urlopen(request)
+            return _result(_winhttp_urlopen(request))
         except ImportError:
             LOGGER.debug("WinHTTP module unavailable - using fallback")
         except NoInternetError as ex:
@@ -378,7 +903,7 @@ def urlopen(url, method="GET", headers={}, on_progress=None, on_auth_request=Non
 
     if ENABLE_URLLIB:
         try:
-            return _urllib_urlopen(request)
+            return _result(_urllib_urlopen(request))
         except ImportError:
             LOGGER.debug("urllib download unavailable - using fallback")
         except (AttributeError, TypeError, ValueError):
@@ -394,6 +919,10 @@ def urlopen(url, method="GET", headers={}, on_progress=None, on_auth_request=Non
             first_error = first_error or ex
 
     if ENABLE_POWERSHELL:
+        # PowerShell cannot report that a resource is not modified, so we
+        # never send it the validators.
+        request.headers.pop("If-None-Match", None)
+        request.headers.pop("If-Modified-Since", None)
         try:
             return _powershell_urlopen(request)
         except FileNotFoundError:
@@ -410,7 +939,65 @@ def urlopen(url, method="GET", headers={}, on_progress=None, on_auth_request=Non
     raise RuntimeError("Unable to download from the internet")
 
 
-def urlretrieve(url, outfile, method="GET", headers={}, chunksize=64 * 1024, on_progress=None, on_auth_request=None):
+def urlprobe(url, timeout=None):
+    """Sends a HEAD request to url, using the same backends and connection
+    settings as urlopen(), and returns once any HTTP response is received.
+
+    Responses with an error status still show that the server is reachable,
+    so only connection errors are raised. No credentials are sent, and
+    PowerShell is not used because it is too slow to start. WinHTTP does not
+    support timeout, so callers should not wait for it longer than needed.
+    """
+    import urllib.error
+    from urllib.request import Request
+
+    request = _Request(sanitise_url(url), method="HEAD")
+    first_error = None
+
+    if ENABLE_WINHTTP:
+        try:
+            _winhttp_urlopen(request)
+            return
+        except ImportError:
+            LOGGER.debug("WinHTTP module unavailable - using fallback")
+        except FileNotFoundError:
+            # Returned HTTP status 404
+            return
+        except OSError as ex:
+            if (getattr(ex, "winerror", 0) or 0) & 0xFFFF0000 == 0x80190000:
+                # Any other HTTP status
+                return
+            LOGGER.debug("Failed to probe using WinHTTP. Retrying with fallback method.",
+                         exc_info=True)
+            first_error = ex
+
+    if ENABLE_URLLIB:
+        try:
+            with _pooled_urlopen(Request(request.url, method="HEAD"), timeout):
+                return
+        except urllib.error.HTTPError as ex:
+            ex.close()
+            return
+        except OSError as ex:
+            first_error = first_error or ex
+
+    if first_error:
+        raise first_error
+    raise RuntimeError("Unable to connect to the internet")
+
+
+def urlretrieve(url, outfile, method="GET", headers={}, chunksize=64 * 1024, on_progress=None, on_auth_request=None,
+                hash_algorithms=(), segments=1, segment_min_size=SEGMENT_MIN_SIZE):
+    """Downloads url to outfile.
+
+    If hash_algorithms are provided and the backend that performs the download
+    is able to calculate them, returns a dict mapping each algorithm to the
+    hex digest of the downloaded file. Otherwise, returns None.
+
+    If segments is more than one and the server supports range requests, the
+    file is downloaded in up to that many parts at once, each at least
+    segment_min_size bytes.
+    """
     scheme, sep, path = url.partition("://")
     if not sep:
         scheme = "file"
@@ -429,25 +1016,58 @@ def urlretrieve(url, outfile, method="GET", headers={}, chunksize=64 * 1024, on_
             else:
                 total = None
             on_progress(0)
+            request = _Request(url)
+            request.hash_algorithms = hash_algorithms
+            request.begin_hashes()
             with open(outfile, "wb") as f:
                 for chunk in iter(lambda: r.read(chunksize), b""):
                     f.write(chunk)
+                    request.update_hashes(chunk)
                     if total:
                         on_progress((100 * f.tell()) // total)
             on_progress(100)
-        return
+        return request.get_hashes()
 
     request = _Request(url, method=method, headers=headers)
     request.outfile = Path(outfile)
     request.chunksize = chunksize
+    request.hash_algorithms = hash_algorithms
+    request.segments = segments or 1
+    request.segment_min_size = segment_min_size or SEGMENT_MIN_SIZE
     request._on_progress = on_progress
     request._on_auth_request = on_auth_request
 
+    def _retrieve(backend):
+        # Discard any hashes from a previous backend that failed part way
+        request._hashers = None
+        backend(request)
+        # A partial download from an earlier attempt is no longer needed,
+        # whichever backend completed it.
+        unlink(_resume_file(request.outfile))
+        return request.get_hashes()
+
     first_error = None
 
+    if ENABLE_SEGMENTED and request.segments > 1 and method.upper() == "GET":
+        try:
+            return _retrieve(_segmented_urlretrieve)
+        except _SegmentsUnsupported as ex:
+            LOGGER.debug("Not using segmented download: %s", ex)
+        except (AttributeError, TypeError, ValueError):
+            # Blame the caller for these errors and let them bubble out
+            raise
+        except FileNotFoundError:
+            # Indicates a successful 404, so let it bubble out
+            raise
+        except Exception as ex:
+            request.on_progress(None)
+            LOGGER.verbose("Failed to download in segments. Retrying with fallback method.")
+            LOGGER.debug("ERROR:", exc_info=True)
+            first_error = ex
+
     if ENABLE_BITS and method.upper() == "GET":
         try:
-            return _bits_urlretrieve(request)
+            return _retrieve(_bits_urlretrieve)
         except ImportError:
             LOGGER.debug("BITS module unavailable - using fallback")
         except NoInternetError as ex:
@@ -470,11 +1090,11 @@ def urlretrieve(url, outfile, method="GET", headers={}, chunksize=64 * 1024, on_
             request.on_progress(None)
             LOGGER.verbose("Failed to download using BITS. Retrying with fallback method.")
             LOGGER.debug("ERROR:", exc_info=True)
-            first_error = ex
+            first_error = first_error or ex
 
     if ENABLE_WINHTTP:
         try:
-            return _winhttp_urlretrieve(request)
+            return _retrieve(_winhttp_urlretrieve)
         except ImportError:
             LOGGER.debug("WinHTTP module unavailable - using fallback")
         except NoInternetError as ex:
@@ -494,7 +1114,7 @@ def urlretrieve(url, outfile, method="GET", headers={}, chunksize=64 * 1024, on_
 
     if ENABLE_URLLIB:
         try:
-            return _urllib_urlretrieve(request)
+            return _retrieve(_urllib_urlretrieve)
         except ImportError:
             LOGGER.debug("urllib module unavailable - using fallback")
         except (AttributeError, TypeError, ValueError):
@@ -511,7 +1131,7 @@ def urlretrieve(url, outfile, method="GET", headers={}, chunksize=64 * 1024, on_
 
     if ENABLE_POWERSHELL:
         try:
-            return _powershell_urlretrieve(request)
+            return _retrieve(_powershell_urlretrieve)
         except FileNotFoundError:
             LOGGER.debug("PowerShell download unavailable - using fallback")
         except Exception as ex:
@@ -624,30 +1244,180 @@ def is_valid_url(url):
     return False
 
 
+def _index_cache_file(cache_dir, url):
+    import hashlib
+    name = hashlib.sha256(url.encode("utf-8", "surrogatepass")).hexdigest()[:32]
+    return os.path.join(cache_dir, name + ".json")
+
+
+def _read_index_cache(cache_dir, url):
+    """Returns the metadata and data for url from the cache, or raises
+    LookupError if it is not available.
+    """
+    import json
+    try:
+        with open(_index_cache_file(cache_dir, url), "rb") as f:
+            meta = json.loads(f.readline())
+            data = f.read()
+    except (OSError, ValueError) as ex:
+        raise LookupError(url) from ex
+    if meta.get("url") != sanitise_url(url) or meta.get("size") != len(data):
+        raise LookupError(url)
+    return meta, data
+
+
+def _write_index_cache(cache_dir, url, data, headers):
+    import json
+    meta = {
+        "url": sanitise_url(url),
+        "size": len(data),
+        "fetched": time.time(),
+        "etag": headers.get("etag") if headers else None,
+        "last_modified": headers.get("last-modified") if headers else None,
+    }
+    file = _index_cache_file(cache_dir, url)
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+        with open(file + ".tmp", "wb") as f:
+            f.write(json.dumps(meta).encode("utf-8"))
+            f.write(b"\n")
+            f.write(data)
+        os.replace(file + ".tmp", file)
+    except OSError:
+        LOGGER.debug("Failed to write index cache for %s", sanitise_url(url), exc_info=True)
+
+
+def _parsed_index_key(url, data):
+    import hashlib
+    h = hashlib.sha256(f"{PARSED_INDEX_VERSION}\0{url}\0".encode("utf-8", "surrogatepass"))
+    h.update(data)
+    return h.hexdigest()[:32]
+
+
 class IndexDownloader:
-    def __init__(self, source, index_cls, auth=None, cache=None):
+    """Iterates over each page of an index.
+
+    When prefetch is greater than zero, pages are downloaded and parsed on a
+    background thread, running up to that many pages ahead of the caller.
+    Use as a context manager (or call close()) to stop prefetching early.
+    """
+    def __init__(self, source, index_cls, auth=None, cache=None, *, cache_dir=None, max_age=0,
+                 prefetch=0):
         self.index_cls = index_cls
         self._url = source.rstrip("/")
         if not self._url.casefold().endswith(".json".casefold()):
             self._url += "/index.json"
         self._auth = auth if auth is not None else {}
         self._cache = cache if cache is not None else {}
+        self._cache_dir = cache_dir if ENABLE_INDEX_CACHE else None
+        self._max_age = max_age or 0
         self._urlopen = urlopen
+        self._prefetch = max(0, prefetch or 0)
+        self._queue = None
+        self._stop = None
 
     def __iter__(self):
         return self
 
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        self._url = None
+        if self._stop:
+            self._stop.set()
+
     def on_auth(self, url):
         # TODO: Try looking for parent paths from URL
         return self._auth[url]
 
-    def __next__(self):
-        if not self._url:
-            raise StopIteration
+    def _fetch(self, url):
+        headers = {"Accepts": "application/json"}
+        scheme = url.partition("://")[0].casefold()
+        if not self._cache_dir or scheme not in ("http".casefold(), "https".casefold()):
+            return self._urlopen(url, "GET", headers, on_auth_request=self.on_auth)
 
+        try:
+            meta, cached = _read_index_cache(self._cache_dir, url)
+        except LookupError:
+            meta, cached = {}, None
+        else:
+            age = time.time() - meta.get("fetched", 0)
+            if 0 <= age < self._max_age:
+                LOGGER.debug("Using cached index (%i seconds old)", age)
+                return cached
+
+        if meta.get("etag"):
+            headers["If-None-Match"] = meta["etag"]
+        if meta.get("last_modified"):
+            headers["If-Modified-Since"] = meta["last_modified"]
+        response_headers = {}
+        data = self._urlopen(url, "GET", headers, on_auth_request=self.on_auth,
+                             response_headers=response_headers)
+        if data is None:
+            LOGGER.debug("Using cached index (not modified)")
+            # Rewriting the cache resets its age and updates any validators
+            _write_index_cache(self._cache_dir, url, cached, {
+                "etag": response_headers.get("etag") or meta.get("etag"),
+                "last-modified": response_headers.get("last-modified") or meta.get("last_modified"),
+            })
+            return cached
+        _write_index_cache(self._cache_dir, url, data, response_headers)
+        return data
+
+    def _parse(self, url, data):
+        # Validating and sorting a large index is slow, so we keep the result
+        # as JSON (so that each caller gets its own copy). It is stored with a
+        # hash of the content, so an updated index is always parsed again.
+        # Only plain data is stored, because the cache directory may be
+        # writable by other users.
         import json
+        from_cache = getattr(self.index_cls, "from_cache", None)
+        key = _parsed_index_key(url, data).encode("ascii")
+        cached = self._cache.get(("parsed", key))
+        file = None
+        if self._cache_dir:
+            file = os.path.splitext(_index_cache_file(self._cache_dir, url))[0] + ".parsed.json"
+        if from_cache and not cached and file:
+            try:
+                with open(file, "rb") as f:
+                    if f.readline().rstrip() == key:
+                        cached = f.read()
+            except OSError:
+                pass
+        if from_cache and cached:
+            try:
+                index = from_cache(url, json.loads(cached))
+            except Exception:
+                LOGGER.debug("Failed to load parsed index", exc_info=True)
+            else:
+                LOGGER.debug("Using previously parsed index")
+                self._cache[("parsed", key)] = cached
+                return index
 
-        url = self._url
+        index = self.index_cls(url, json.loads(data))
+        if not from_cache:
+            return index
+        try:
+            cached = self._cache[("parsed", key)] = json.dumps(index.to_cache()).encode("utf-8")
+        except Exception:
+            LOGGER.debug("Failed to serialize parsed index", exc_info=True)
+            return index
+        if file:
+            try:
+                os.makedirs(self._cache_dir, exist_ok=True)
+                with open(file + ".tmp", "wb") as f:
+                    f.write(key + b"\n")
+                    f.write(cached)
+                os.replace(file + ".tmp", file)
+            except OSError:
+                LOGGER.debug("Failed to write parsed index to %s", file, exc_info=True)
+        return index
+
+    def _load(self, url):
         LOGGER.debug("Fetching: %s", url)
         try:
             data = self._cache[url]
@@ -656,31 +1426,95 @@ class IndexDownloader:
             data = None
 
         if not data:
-            try:
-                data = self._cache[url] = self._urlopen(
-                    url,
-                    "GET",
-                    {"Accepts": "application/json"},
-                    on_auth_request=self.on_auth,
-                )
-            except FileNotFoundError: # includes 404
-                LOGGER.error("Unable to find runtimes index at %s", sanitise_url(url))
-                raise
-            except OSError as ex:
-                LOGGER.error(
-                    "Unable to access runtimes index at %s: %s",
-                    sanitise_url(url),
-                    ex.args[1] if len(ex.args) >= 2 else ex
-                )
-                raise
-            except RuntimeError as ex:
-                LOGGER.error("An unexpected error occurred while downloading the index: %s", ex)
-                raise
+            data = self._cache[url] = self._fetch(url)
+
+        return self._parse(url, data)
+
+    @staticmethod
+    def _report_error(url, ex):
+        # Errors are only reported once the caller asks for the page, as a
+        # page loaded in the background may never be needed.
+        if isinstance(ex, FileNotFoundError): # includes 404
+            LOGGER.error("Unable to find runtimes index at %s", sanitise_url(url))
+        elif isinstance(ex, OSError):
+            LOGGER.error(
+                "Unable to access runtimes index at %s: %s",
+                sanitise_url(url),
+                ex.args[1] if len(ex.args) >= 2 else ex
+            )
+        elif isinstance(ex, RuntimeError):
+            LOGGER.error("An unexpected error occurred while downloading the index: %s", ex)
+
+    @staticmethod
+    def _next_url(url, index):
+        if index.next_url:
+            return urljoin(url, index.next_url, to_parent=True)
+        return None
 
-        index = self.index_cls(self._url, json.loads(data))
+    def _prefetch_all(self, url):
+        # Runs on the background thread. Each page (or the exception raised
+        # while loading it) is passed to the caller through the queue with its
+        # URL. The queue blocks once we are far enough ahead.
+        import queue
+        def _put(item):
+            while not self._stop.is_set():
+                try:
+                    self._queue.put(item, timeout=0.1)
+                    return True
+                except queue.Full:
+                    pass
+            return False
 
-        if index.next_url:
-            self._url = urljoin(url, index.next_url, to_parent=True)
-        else:
+        while url and not self._stop.is_set():
+            try:
+                index = self._load(url)
+            except Exception as ex:
+                _put((url, ex))
+                return
+            if not _put((url, index)):
+                return
+            url = self._next_url(url, index)
+        _put((None, None))
+
+    def _next_prefetched(self):
+        if self._queue is None:
+            if not self._url:
+                raise StopIteration
+            import queue
+            import threading
+            self._queue = queue.Queue(self._prefetch)
+            self._stop = threading.Event()
+            threading.Thread(
+                target=self._prefetch_all,
+                args=(self._url,),
+                name="IndexDownloader",
+                daemon=True,
+            ).start()
             self._url = None
+        elif self._stop.is_set():
+            raise StopIteration
+        url, index = self._queue.get()
+        if isinstance(index, Exception):
+            self._stop.set()
+            self._report_error(url, index)
+            raise index
+        if index is None:
+            self._stop.set()
+            raise StopIteration
+        return index
+
+    def __next__(self):
+        if self._prefetch:
+            return self._next_prefetched()
+
+        if not self._url:
+            raise StopIteration
+
+        url = self._url
+        try:
+            index = self._load(url)
+        except Exception as ex:
+            self._report_error(url, ex)
+            raise
+        self._url = self._next_url(url, index)
         return index
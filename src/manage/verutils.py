@@ -1,7 +1,17 @@
+import re
+
 from .logging import LOGGER
 
 
+# Parsed versions are immutable, so we share instances between all uses of the
+# same string. Once the cache is full, it is cleared and starts again.
+_CACHE = {}
+_CACHE_SIZE = 4096
+
+
 class Version:
+    __slots__ = ("s", "sortkey", "prefix_match", "prerelease_match")
+
     TEXT_MAP = {
         "*": 0,
         "dev": 1,
@@ -14,17 +24,31 @@ class Version:
 
     _TEXT_UNMAP = {v: k for k, v in TEXT_MAP.items()}
 
+    _PATTERN = re.compile(
+        r"^(?P<numbers>\d+(\.\d+)*)([\.\-]?(?P<level>"
+        + "|".join(re.escape(k) for k in TEXT_MAP if k)
+        + r")[\.]?(?P<serial>\d*))?$",
+        re.I,
+    )
+
     # Versions with more fields than this will be truncated.
     MAX_FIELDS = 8
 
-    def __init__(self, s):
-        import re
-        levels = "|".join(re.escape(k) for k in self.TEXT_MAP if k)
-        m = re.match(
-            r"^(?P<numbers>\d+(\.\d+)*)([\.\-]?(?P<level>" + levels + r")[\.]?(?P<serial>\d*))?$",
-            s,
-            re.I,
-        )
+    def __new__(cls, s):
+        key = cls, s
+        try:
+            return _CACHE[key]
+        except KeyError:
+            pass
+        self = super().__new__(cls)
+        self._parse(s)
+        if len(_CACHE) >= _CACHE_SIZE:
+            _CACHE.clear()
+        _CACHE[key] = self
+        return self
+
+    def _parse(self, s):
+        m = self._PATTERN.match(s)
         if not m:
             raise ValueError("Failed to parse version %s", s)
         bits = [int(v) for v in m.group("numbers").split(".")]
@@ -33,19 +57,33 @@ class Version:
         except LookupError:
             dev = 0
             LOGGER.warn("Version %s has invalid development level specified which will be ignored", s)
-        self.s = s
         if len(bits) > self.MAX_FIELDS:
             LOGGER.warn("Version %s is too long and will be truncated to %s for ordering purposes",
                 s, ".".join(map(str, bits[:self.MAX_FIELDS])))
-        self.sortkey = (
+        sortkey = (
             *bits[:self.MAX_FIELDS],
             *([0] * (self.MAX_FIELDS - len(bits))),
             len(bits),  # for sort stability
             dev,
             int(m.group("serial") or 0)
         )
-        self.prefix_match = dev == self.TEXT_MAP["*"]
-        self.prerelease_match = dev == self.TEXT_MAP["dev"]
+        object.__setattr__(self, "s", s)
+        object.__setattr__(self, "sortkey", sortkey)
+        object.__setattr__(self, "prefix_match", dev == self.TEXT_MAP["*"])
+        object.__setattr__(self, "prerelease_match", dev == self.TEXT_MAP["dev"])
+
+    def __setattr__(self, name, value):
+        raise AttributeError(f"'{type(self).__name__}' object is immutable")
+
+    def __reduce__(self):
+        return type(self), (self.s,)
+
+    def __hash__(self):
+        # Wildcard versions compare equal to versions with different sort keys,
+        # but always to ones with the same first field, so only that may be
+        # hashed. Strings are not hashed consistently with equal versions, so
+        # should not be mixed with versions as keys.
+        return hash(self.sortkey[0])
 
     def __str__(self):
         return self.s
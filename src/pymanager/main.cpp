@@ -23,6 +23,11 @@
 #define PY_WINDOWED 0
 #endif
 
+// Must match PROTOCOL_VERSION in resolver_command.py
+#define RESOLVER_PROTOCOL_VERSION L"1"
+// Time to wait for the resolver before falling back to in-process resolution
+#define RESOLVER_TIMEOUT_MS 1000
+
 struct {
     PyObject *mod;
     PyObject *no_install_found_error;
@@ -287,7 +292,10 @@ init_python()
 static void
 close_python()
 {
-    assert(manage.mod);
+    if (!manage.mod) {
+        // Python was never initialized (e.g. the resolver service was used)
+        return;
+    }
     Py_CLEAR(manage.no_installs_error);
     Py_CLEAR(manage.no_install_found_error);
     Py_CLEAR(manage.auto_install_disabled_error);
@@ -297,7 +305,7 @@ close_python()
 
 
 static int
-run_command(int argc, const wchar_t **argv)
+run_command(int argc, const wchar_t **argv, bool exclusive=true)
 {
     int exitCode = 1;
     auto root_str = get_root();
@@ -305,9 +313,16 @@ run_command(int argc, const wchar_t **argv)
     PyObject *root = NULL;
     PyObject *r = NULL;
 
-    HANDLE hGlobalSem = CreateSemaphoreExW(NULL, 0, 1,
-        L"PyManager-OperationInProgress", 0, SEMAPHORE_MODIFY_STATE | SYNCHRONIZE);
-    if (!hGlobalSem) {
+    // Long running commands that do not modify anything (like the resolver)
+    // must not block other operations.
+    HANDLE hGlobalSem = NULL;
+    if (exclusive) {
+        hGlobalSem = CreateSemaphoreExW(NULL, 0, 1,
+            L"PyManager-OperationInProgress", 0, SEMAPHORE_MODIFY_STATE | SYNCHRONIZE);
+    }
+    if (!exclusive) {
+        // No semaphore needed
+    } else if (!hGlobalSem) {
         return GetLastError();
     } else if (GetLastError() == ERROR_ALREADY_EXISTS) {
         DWORD waitTime = 3000;
@@ -358,8 +373,10 @@ run_command(int argc, const wchar_t **argv)
 python_fail:
     PyErr_Print();
 done:
-    ReleaseSemaphore(hGlobalSem, 1, NULL);
-    CloseHandle(hGlobalSem);
+    if (hGlobalSem) {
+        ReleaseSemaphore(hGlobalSem, 1, NULL);
+        CloseHandle(hGlobalSem);
+    }
     Py_XDECREF(r);
     Py_XDECREF(root);
     Py_XDECREF(args);
@@ -466,6 +483,179 @@ done:
 }
 
 
+static bool
+get_token_user(HANDLE hToken, std::vector<BYTE> &buffer)
+{
+    DWORD cb = 0;
+    GetTokenInformation(hToken, TokenUser, NULL, 0, &cb);
+    if (!cb) {
+        return false;
+    }
+    buffer.resize(cb);
+    return GetTokenInformation(hToken, TokenUser, buffer.data(), cb, &cb);
+}
+
+
+static bool
+is_same_user(DWORD pid)
+{
+    bool result = false;
+    std::vector<BYTE> ours, theirs;
+    HANDLE hToken = NULL;
+    HANDLE hProcess = OpenProcess(PROCESS_QUERY_LIMITED_INFORMATION, FALSE, pid);
+    if (!hProcess) {
+        return false;
+    }
+    if (OpenProcessToken(hProcess, TOKEN_QUERY, &hToken)) {
+        result = get_token_user(hToken, theirs)
+            && get_token_user(GetCurrentProcessToken(), ours)
+            && EqualSid(((TOKEN_USER *)theirs.data())->User.Sid,
+                        ((TOKEN_USER *)ours.data())->User.Sid);
+        CloseHandle(hToken);
+    }
+    CloseHandle(hProcess);
+    return result;
+}
+
+
+static HANDLE
+connect_resolver()
+{
+    // Must match get_pipe_name() in resolver_command.py
+    wchar_t user[257];
+    DWORD cch = sizeof(user) / sizeof(user[0]);
+    if (!GetUserNameW(user, &cch)) {
+        return INVALID_HANDLE_VALUE;
+    }
+    std::wstring name = std::wstring(L"\\\\.\\pipe\\PyManager-Resolver-") + user;
+
+    HANDLE hPipe = INVALID_HANDLE_VALUE;
+    for (int attempt = 0; attempt < 2 && hPipe == INVALID_HANDLE_VALUE; ++attempt) {
+        hPipe = CreateFileW(name.c_str(), GENERIC_READ | GENERIC_WRITE, 0, NULL,
+            OPEN_EXISTING, FILE_FLAG_OVERLAPPED | SECURITY_SQOS_PRESENT | SECURITY_IDENTIFICATION,
+            NULL);
+        if (hPipe == INVALID_HANDLE_VALUE) {
+            // The resolver creates a new instance after each connection, so
+            // only wait if it is currently busy.
+            if (GetLastError() != ERROR_PIPE_BUSY
+                || !WaitNamedPipeW(name.c_str(), RESOLVER_TIMEOUT_MS)) {
+                return INVALID_HANDLE_VALUE;
+            }
+        }
+    }
+    if (hPipe == INVALID_HANDLE_VALUE) {
+        return INVALID_HANDLE_VALUE;
+    }
+
+    // Anyone could create a pipe with this name, so we only trust it if the
+    // process that created it is running as the same user as us.
+    ULONG server_pid;
+    DWORD mode = PIPE_READMODE_MESSAGE;
+    if (!GetNamedPipeServerProcessId(hPipe, &server_pid)
+        || !is_same_user(server_pid)
+        || !SetNamedPipeHandleState(hPipe, &mode, NULL, NULL)) {
+        CloseHandle(hPipe);
+        return INVALID_HANDLE_VALUE;
+    }
+    return hPipe;
+}
+
+
+static int
+query_resolver(
+    const std::wstring &tag,
+    const std::wstring &script,
+    std::wstring &executable,
+    std::wstring &args
+) {
+    // The resolver service is only used when it has been enabled, and never
+    // when debug output has been requested (because it cannot show it).
+    if (!is_env_var_set(L"PYMANAGER_RESOLVER")
+        || is_env_var_set(L"PYMANAGER_DEBUG")
+        || is_env_var_set(L"PYMANAGER_VERBOSE")) {
+        return -1;
+    }
+
+    // Request format is described in resolver_command.py
+    std::wstring request = RESOLVER_PROTOCOL_VERSION;
+    request.push_back(L'\0');
+    request += get_root();
+    request.push_back(L'\0');
+    DWORD cwd_len = GetCurrentDirectoryW(0, NULL);
+    if (!cwd_len) {
+        return -1;
+    }
+    std::wstring cwd;
+    cwd.resize(cwd_len);
+    cwd.resize(GetCurrentDirectoryW(cwd_len, cwd.data()));
+    request += cwd;
+    request.push_back(L'\0');
+    request += tag;
+    request.push_back(L'\0');
+    request += script;
+    request.push_back(L'\0');
+    request += PY_WINDOWED ? L"1" : L"0";
+    request.push_back(L'\0');
+    wchar_t *env = GetEnvironmentStringsW();
+    if (!env) {
+        return -1;
+    }
+    const wchar_t *env_end = env;
+    while (*env_end) {
+        env_end += wcslen(env_end) + 1;
+    }
+    request.append(env, env_end - env);
+    FreeEnvironmentStringsW(env);
+
+    HANDLE hPipe = connect_resolver();
+    if (hPipe == INVALID_HANDLE_VALUE) {
+        return -1;
+    }
+
+    int err = -1;
+    std::wstring response;
+    response.resize(32768);
+    DWORD cb_read = 0;
+    OVERLAPPED ov = {};
+    ov.hEvent = CreateEventW(NULL, TRUE, FALSE, NULL);
+    if (!ov.hEvent) {
+        CloseHandle(hPipe);
+        return -1;
+    }
+    if (!TransactNamedPipe(hPipe, request.data(), (DWORD)(request.size() * sizeof(wchar_t)),
+                           response.data(), (DWORD)(response.size() * sizeof(wchar_t)),
+                           NULL, &ov)) {
+        if (GetLastError() != ERROR_IO_PENDING) {
+            goto done;
+        }
+        if (WaitForSingleObject(ov.hEvent, RESOLVER_TIMEOUT_MS) != WAIT_OBJECT_0) {
+            CancelIo(hPipe);
+            // Wait for the cancellation so that our buffers remain valid
+            GetOverlappedResult(hPipe, &ov, &cb_read, TRUE);
+            goto done;
+        }
+    }
+    // A response that does not fit in our buffer fails with ERROR_MORE_DATA
+    if (!GetOverlappedResult(hPipe, &ov, &cb_read, FALSE) || !cb_read) {
+        goto done;
+    }
+    response.resize(cb_read / sizeof(wchar_t));
+    {
+        size_t sep = response.find(L'\0');
+        if (sep == std::wstring::npos || sep == 0) {
+            goto done;
+        }
+        executable = response.substr(0, sep);
+        args = response.substr(sep + 1);
+    }
+    err = 0;
+done:
+    CloseHandle(ov.hEvent);
+    CloseHandle(hPipe);
+    return err;
+}
+
+
 int
 wmain(int argc, wchar_t **argv)
 {
@@ -474,13 +664,6 @@ wmain(int argc, wchar_t **argv)
     std::wstring executable, args, tag, script;
     int skip_argc = 0;
 
-    err = init_python();
-    if (err) {
-        return err;
-    }
-
-    CoInitializeEx(NULL, COINIT_APARTMENTTHREADED);
-
     const wchar_t *default_cmd;
     bool use_commands, use_cli_tag, use_shebangs, use_autoinstall;
     per_exe_settings(argc, argv, &default_cmd, &use_commands, &use_cli_tag, &use_shebangs, &use_autoinstall);
@@ -490,7 +673,12 @@ wmain(int argc, wchar_t **argv)
         // in commands.g.h
         for (const wchar_t **cmd_name = subcommands; *cmd_name; ++cmd_name) {
             if (!wcscmp(argv[1], *cmd_name)) {
-                err = run_command(argc, (const wchar_t **)argv);
+                err = init_python();
+                if (err) {
+                    return err;
+                }
+                CoInitializeEx(NULL, COINIT_APARTMENTTHREADED);
+                err = run_command(argc, (const wchar_t **)argv, wcscmp(argv[1], L"resolver") != 0);
                 goto error;
             }
         }
@@ -504,15 +692,6 @@ wmain(int argc, wchar_t **argv)
         }
     }
 
-    // Use the default command if we have one
-    if (default_cmd) {
-        if (!wcscmp(default_cmd, L"__help_with_error")) {
-            const wchar_t *new_argv[] = {argv[0], default_cmd, argv[1]};
-            return run_command(3, new_argv);
-        }
-        return run_simple_command(argv[0], default_cmd);
-    }
-
     if (use_cli_tag && read_tag_from_argv(argc, (const wchar_t **)argv, skip_argc, tag)) {
         skip_argc += 1;
         use_shebangs = false;
@@ -522,6 +701,28 @@ wmain(int argc, wchar_t **argv)
         read_script_from_argv(argc, (const wchar_t **)argv, skip_argc, script);
     }
 
+    // When the resolver service gives us a runtime, we can launch it without
+    // initializing Python at all.
+    if (!default_cmd && !query_resolver(tag, script, executable, args)) {
+        goto launch;
+    }
+
+    err = init_python();
+    if (err) {
+        return err;
+    }
+
+    CoInitializeEx(NULL, COINIT_APARTMENTTHREADED);
+
+    // Use the default command if we have one
+    if (default_cmd) {
+        if (!wcscmp(default_cmd, L"__help_with_error")) {
+            const wchar_t *new_argv[] = {argv[0], default_cmd, argv[1]};
+            return run_command(3, new_argv);
+        }
+        return run_simple_command(argv[0], default_cmd);
+    }
+
     err = locate_runtime(tag, script, executable, args, use_autoinstall ? 1 : 0, 0);
 
     if (err == ERROR_NO_MATCHING_INSTALL || err == ERROR_NO_INSTALLS) {
@@ -548,6 +749,7 @@ wmain(int argc, wchar_t **argv)
     // Theoretically shouldn't matter, but might help reduce memory usage.
     close_python();
 
+launch:
     err = launch(executable.c_str(), args.c_str(), skip_argc, &exitCode);
 
     // TODO: Consider sharing print_error() with launcher.cpp
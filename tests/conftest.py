@@ -76,3 +76,18 @@ class FakeConfig:
 @pytest.fixture
 def fake_config():
     return FakeConfig()
+
+
+class FakeCommand(FakeConfig):
+    def __init__(self, installs=[], **attrs):
+        super().__init__(installs)
+        self.__dict__.update(attrs)
+
+    def ask_yn(self, *args):
+        return True
+
+
+@pytest.fixture
+def fake_command():
+    # Tests pass only the attributes that the code under test reads
+    return FakeCommand
@@ -1,20 +1,39 @@
+import json
 import os
 import sys
+import threading
 import time
 
 from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
 
+FLAKY_REQUESTS = {}
+FLAKY_LOCK = threading.Lock()
+
 class Handler(BaseHTTPRequestHandler):
+    # Allows clients to keep connections alive between requests
+    protocol_version = "HTTP/1.1"
+
     def do_GET(self, header_only=False):
         if self.path == "/stop":
             self.send_response(200)
+            self.send_header("Content-Length", 0)
             self.end_headers()
             self.server.shutdown()
             return
         if self.path == "/alive":
             self.send_response(200)
+            self.send_header("Content-Length", 0)
             self.end_headers()
             return
+        if self.path == "/peer":
+            # Identifies the client connection, so tests can detect reuse
+            resp = str(self.client_address[1]).encode()
+            self.send_response(200)
+            self.send_header("Content-Length", len(resp))
+            self.end_headers()
+            if not header_only:
+                self.wfile.write(resp)
+            return
         if self.path == "/1kb":
             self.send_response(200)
             self.send_header("Content-Length", 1024)
@@ -31,10 +50,73 @@ class Handler(BaseHTTPRequestHandler):
                     self.wfile.write(os.urandom(1024))
                     time.sleep(0.05)
             return
+        if self.path == "/index.json":
+            # Supports conditional requests using either validator
+            body = b'{"versions": []}'
+            etag = '"index-1"'
+            last_modified = "Wed, 01 Jan 2025 00:00:00 GMT"
+            if "If-None-Match" in self.headers:
+                not_modified = self.headers["If-None-Match"] == etag
+            else:
+                not_modified = self.headers.get("If-Modified-Since") == last_modified
+            if not_modified:
+                self.send_response(304)
+                self.send_header("ETag", etag)
+                self.end_headers()
+                return
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", len(body))
+            self.send_header("ETag", etag)
+            self.send_header("Last-Modified", last_modified)
+            self.end_headers()
+            if not header_only:
+                self.wfile.write(body)
+            return
+        if self.path.startswith("/flaky/"):
+            # Disconnects half way through the first request for each path,
+            # and supports resuming with a Range request.
+            body = bytes(range(256)) * 256
+            etag = '"flaky-1"'
+            path, _, query = self.path.partition("?")
+            requests = FLAKY_REQUESTS.setdefault(path, [])
+            if query == "log":
+                resp = json.dumps(requests).encode()
+                self.send_response(200)
+                self.send_header("Content-Length", len(resp))
+                self.end_headers()
+                self.wfile.write(resp)
+                return
+            with FLAKY_LOCK:
+                first = not requests
+                if not header_only:
+                    requests.append(self.headers.get("Range"))
+            start, end = 0, len(body) - 1
+            if self.headers.get("Range") and self.headers.get("If-Range") == etag:
+                start, _, end = self.headers["Range"].partition("=")[2].partition("-")
+                start, end = int(start), int(end or len(body) - 1)
+                self.send_response(206)
+                self.send_header("Content-Range", f"bytes {start}-{end}/{len(body)}")
+            else:
+                self.send_response(200)
+            self.send_header("Content-Length", end + 1 - start)
+            self.send_header("Accept-Ranges", "bytes")
+            self.send_header("ETag", etag)
+            self.end_headers()
+            if header_only:
+                return
+            if first:
+                self.wfile.write(body[start:start + (end + 1 - start) // 2])
+                self.wfile.flush()
+                self.close_connection = True
+                return
+            self.wfile.write(body[start:end + 1])
+            return
         if self.path == "/withauth":
             if "Authorization" not in self.headers:
                 self.send_response(401)
                 self.send_header("WWW-Authenticate", "Basic")
+                self.send_header("Content-Length", 0)
                 self.end_headers()
                 return
             from base64 import b64decode
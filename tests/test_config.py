@@ -0,0 +1,96 @@
+import json
+import pytest
+
+from manage import config
+
+
+SCHEMA = {
+    "_config_files": (str, config.config_append),
+    "default_tag": (str, None, "env"),
+    "log_level": (int, min),
+    # Not a path here, so that the test does not depend on path handling
+    "additional_config": (str, None, "env"),
+}
+
+
+@pytest.fixture
+def config_files(tmp_path, monkeypatch):
+    global_file = tmp_path / "pymanager.json"
+    extra_file = tmp_path / "extra.json"
+    global_file.write_text(json.dumps({
+        "default_tag": "%TEST_DEFAULT_TAG%",
+        "additional_config": str(extra_file),
+    }))
+    monkeypatch.setattr(config, "_global_file", lambda: global_file)
+    monkeypatch.setattr(config, "_get_cache_file", lambda: tmp_path / "cache" / "config.json")
+    monkeypatch.delenv("PYMANAGER_ENABLE_CONFIG_CACHE", raising=False)
+
+    loads = []
+    _load_config = config._load_config
+    def load(*a):
+        loads.append(a)
+        return _load_config(*a)
+    monkeypatch.setattr(config, "_load_config", load)
+    return global_file, extra_file, loads
+
+
+def test_config_cache(config_files, monkeypatch):
+    global_file, extra_file, loads = config_files
+    env = {"TEST_DEFAULT_TAG": "3.13", "UNRELATED": "1"}
+
+    cfg = config.load_config(None, None, SCHEMA, env=env)
+    assert cfg["default_tag"] == "3.13"
+    assert "log_level" not in cfg
+    assert len(loads) == 1
+    assert config.load_config(None, None, SCHEMA, env=env) == cfg
+    assert len(loads) == 1
+
+    # Unrelated environment variables do not invalidate the cache
+    env["UNRELATED"] = "2"
+    assert config.load_config(None, None, SCHEMA, env=env) == cfg
+    assert len(loads) == 1
+
+    env["TEST_DEFAULT_TAG"] = "3.14"
+    cfg = config.load_config(None, None, SCHEMA, env=env)
+    assert cfg["default_tag"] == "3.14"
+    assert len(loads) == 2
+
+    # Creating a file that did not exist invalidates the cache
+    extra_file.write_text('{"log_level": 10}')
+    cfg = config.load_config(None, None, SCHEMA, env=env)
+    assert cfg["log_level"] == 10
+    assert len(loads) == 3
+    assert config.load_config(None, None, SCHEMA, env=env) == cfg
+    assert len(loads) == 3
+
+    extra_file.write_text('{"log_level": 20}')
+    cfg = config.load_config(None, None, SCHEMA, env=env)
+    assert cfg["log_level"] == 20
+    assert len(loads) == 4
+
+    monkeypatch.setenv("PYMANAGER_ENABLE_CONFIG_CACHE", "0")
+    assert config.load_config(None, None, SCHEMA, env=env) == cfg
+    assert len(loads) == 5
+
+
+def test_config_cache_other_root(config_files, tmp_path, monkeypatch):
+    global_file, extra_file, loads = config_files
+    env = {"TEST_DEFAULT_TAG": "3.13"}
+    assert config.load_config(None, None, SCHEMA, env=env)["default_tag"] == "3.13"
+    assert len(loads) == 1
+
+    # A different install with its own global file does not reuse the cache
+    other_file = tmp_path / "other" / "pymanager.json"
+    other_file.parent.mkdir()
+    other_file.write_text(json.dumps({"default_tag": "3.12"}))
+    monkeypatch.setattr(config, "_global_file", lambda: other_file)
+    assert config.load_config(None, None, SCHEMA, env=env)["default_tag"] == "3.12"
+    assert len(loads) == 2
+
+
+def test_config_cache_empty_env(config_files, monkeypatch):
+    global_file, extra_file, loads = config_files
+    monkeypatch.setenv("PYMANAGER_ENABLE_CONFIG_CACHE", "")
+    config.load_config(None, None, SCHEMA, env={})
+    config.load_config(None, None, SCHEMA, env={})
+    assert len(loads) == 1
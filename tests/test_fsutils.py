@@ -4,7 +4,8 @@ import shutil
 from copy import copy
 
 from manage.exceptions import FilesInUseError
-from manage.fsutils import atomic_unlink, ensure_tree, rmtree, unlink
+import manage.fsutils as FS
+from manage.fsutils import atomic_unlink, ensure_tree, reap_deleted, rglob, rmtree, unlink
 
 @pytest.fixture
 def tree(tmp_path):
@@ -58,6 +59,65 @@ def test_rmtree(tree):
     assert not tree.exists()
 
 
+def test_rmtree_parallel(tmp_path, monkeypatch):
+    monkeypatch.setattr(FS, "RMTREE_WORKERS", 4)
+    monkeypatch.setattr(FS, "RMTREE_MIN_PARALLEL", 8)
+    monkeypatch.setattr(FS, "RMTREE_BATCH_SIZE", 3)
+    root = tmp_path / "root"
+    for i in range(5):
+        d = root / f"d{i}" / "sub" / "subsub"
+        d.mkdir(parents=True)
+        for j in range(7):
+            (d.parent / f"f{j}").write_bytes(b"x")
+            (d / f"f{j}").write_bytes(b"x")
+    rmtree(root)
+    assert not root.exists()
+    assert not list(tmp_path.iterdir())
+
+
+def test_rmtree_does_not_follow_links(tmp_path, tree):
+    root = tmp_path / "root"
+    root.mkdir()
+    (root / "f").write_bytes(b"")
+    try:
+        (root / "link").symlink_to(tree, target_is_directory=True)
+    except OSError:
+        pytest.skip("Unable to create symlinks")
+    rmtree(root)
+    assert not root.exists()
+    assert (tree / "c" / "d").is_file()
+
+
+def test_rmtree_deferred(tmp_path, tree, monkeypatch):
+    monkeypatch.setattr(FS, "ENABLE_DEFERRED_DELETE", True)
+    monkeypatch.setattr(FS, "_DEFERRED", set())
+    rmtree(tree, defer=True)
+    assert not tree.exists()
+    deleted = [p.name for p in tmp_path.iterdir()]
+    assert deleted == ["a.0.deleteme"]
+
+    # Trees deferred by this process are left for the next one
+    reap_deleted([tmp_path])
+    assert [p.name for p in tmp_path.iterdir()] == deleted
+
+    FS._DEFERRED.clear()
+    (tmp_path / "x.0.deleteme").write_bytes(b"")
+    (tmp_path / "keep").write_bytes(b"")
+    reap_deleted([tmp_path, tmp_path / "missing"], time_limit=0)
+    assert sorted(p.name for p in tmp_path.iterdir()) == ["a.0.deleteme", "keep", "x.0.deleteme"]
+
+    reap_deleted([tmp_path])
+    assert [p.name for p in tmp_path.iterdir()] == ["keep"]
+
+
+def test_rglob(tree):
+    assert [p.name for p in rglob(tree, files=False)] == ["c"]
+    assert sorted(p.name for p in rglob(tree, dirs=False)) == ["b", "d"]
+    # Breadth first, so parents are always returned before children
+    found = [p.name for p in rglob(tree)]
+    assert found.index("c") < found.index("d")
+
+
 def test_atomic_unlink(tree):
     files = [tree / "c/d", tree / "b"]
     assert all([f.is_file() for f in files])
@@ -0,0 +1,91 @@
+import subprocess
+import sys
+
+from pathlib import Path
+
+SRC = Path(__file__).absolute().parent.parent / "src"
+
+# Simulates the imports that occur when the launcher resolves a runtime. These
+# modules are imported on every launch, and the output of '-X importtime' is
+# the same as the launcher produces when PYMANAGER_IMPORT_TIME is set.
+LAUNCH_SCRIPT = """
+import manage
+from manage.commands import load_default_config
+from manage.scriptutils import quote_args
+from manage.installs import get_install_to_run
+"""
+
+# Every module in our package that may be imported when launching. Think
+# carefully before adding to this list - anything that is not needed for
+# resolving a runtime should be imported when it is used.
+LAUNCH_MODULES = {
+    "manage",
+    "manage._version",
+    "manage.commands",
+    "manage.config",
+    "manage.exceptions",
+    "manage.installs",
+    "manage.logging",
+    "manage.pathutils",
+    "manage.scriptutils",
+    "manage.tagutils",
+    "manage.verutils",
+}
+
+# Standard library modules that should not be imported when launching. Most of
+# these are used by other commands, and so should be imported where needed.
+LAZY_MODULES = {
+    "argparse",
+    "ctypes",
+    "dataclasses",
+    "datetime",
+    "email",
+    "hashlib",
+    "http.client",
+    "inspect",
+    "logging",
+    "multiprocessing",
+    "pathlib",
+    "shutil",
+    "socket",
+    "ssl",
+    "subprocess",
+    "tempfile",
+    "threading",
+    "typing",
+    "urllib.request",
+    "winreg",
+    "zipfile",
+}
+
+
+def get_imported_modules(script):
+    # Disable site so that modules imported by the test environment do not
+    # hide the ones that we import.
+    script = f"import sys; sys.path.insert(0, {str(SRC)!r})\n{script}"
+    r = subprocess.run(
+        [sys.executable, "-I", "-S", "-X", "importtime", "-c", script],
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        encoding="utf-8",
+        errors="replace",
+    )
+    assert r.returncode == 0, r.stderr
+    modules = {}
+    for line in r.stderr.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        self_us, _, name = line.partition(":")[2].split("|")
+        try:
+            modules[name.strip()] = int(self_us)
+        except ValueError:
+            # Header line
+            continue
+    return modules
+
+
+def test_launch_imports():
+    modules = get_imported_modules(LAUNCH_SCRIPT)
+    ours = {m for m in modules if m.partition(".")[0] == "manage"}
+    assert ours - LAUNCH_MODULES == set()
+    assert LAZY_MODULES & set(modules) == set()
@@ -141,6 +141,20 @@ def test_schema_parse_invalid(value, key):
     assert key in str(ex.value)
 
 
+@pytest.mark.parametrize("value, message", [
+    ({"int": "xyz"}, "Expected 'int' at int; found 'str'"),
+    ({"anystrprops": {"x": {}}}, "Expected 'str' at anystrprops.x; found 'dict'"),
+    ({"anyprops": 1}, "Expected 'dict' at anyprops; found 'int'"),
+    ({"list": [{"key": ...}, {"neither": 1}]}, "No matching 'version' or 'schema' at list.[1]"),
+    ({"versionlist": [{"version": 2, "x": "1", "z": 1}]}, "Unexpected key versionlist.[0].z"),
+    ({"unknown": 1}, "Unexpected key unknown"),
+])
+def test_schema_parse_invalid_message(value, message):
+    with pytest.raises(InvalidFeedError) as ex:
+        iu._validate_one(value, TEST_SCHEMA)
+    assert str(ex.value) == message
+
+
 def test_v1_package():
     # Ensure we don't change the schema for v1 packages
     iu._validate_one(EXAMPLE_V1_PACKAGE, iu.SCHEMA)
@@ -170,6 +184,35 @@ def test_install_lookup():
     assert index.find_to_install("<3.12,!=3.10")["tag"] == "3.11.3"
 
 
+def test_install_lookup_indexes():
+    from manage.tagutils import install_matches_any, tag_or_range
+    versions = [
+        fake_install_data("3.13.1"),
+        fake_install_data("3.12.2", company="Other"),
+        fake_install_data("3.11.3"),
+        fake_install_data("3.10.4"),
+        fake_install_data("2.7.18"),
+        {**fake_install_data("3.14.0a1"), "install-for": ["3.14.0a1", "3.14-dev", "3-dev"]},
+        {**fake_install_data("4.0.0"), "install-for": ["4.*", "dev"]},
+        {**fake_install_data("3.0.0"), "install-for": ["3dev"]},
+    ]
+    index = iu.Index("https://localhost/", {"versions": versions})
+    assert index.find_by_id("PYTHONCORE-3.13.1")["tag"] == "3.13.1"
+    with pytest.raises(LookupError):
+        index.find_by_id("PythonCore-3.13")
+
+    # Compare lookups against a full search of all installs
+    for tag in ["3", "3.13", "3.13.1", "3.1", "3.0", "2", "2.7", "4", "4.1", "5",
+                "3-dev", "3.14-dev", "dev", "Other/3", "Other/3.12", "Py/3.1",
+                "3.*", ">=3.11", "<3"]:
+        for loose_company in [False, True]:
+            expect = [i["id"] for i in index.versions
+                      if install_matches_any(i, [tag_or_range(tag)], loose_company=loose_company)]
+            actual = [i["id"] for i in index.find_all([tag], loose_company=loose_company,
+                                                       with_prerelease=True)]
+            assert actual == expect, (tag, loose_company)
+
+
 def test_select_package():
     from manage.install_command import select_package
 
@@ -181,3 +224,148 @@ def test_select_package():
     })
     assert select_package([index], "3.13", "-64")["tag"] == "3.13.0-64"
     assert select_package([index], "3.13", "-32")["tag"] == "3.13.0-32"
+
+
+def test_parsed_index_cache(tmp_path, monkeypatch):
+    import json
+    from manage.urlutils import IndexDownloader
+    url = "https://example.com/index.json"
+    data = json.dumps({"versions": [
+        {
+            "schema": 1, "id": f"test-{v}", "sort-version": v, "company": "Test",
+            "tag": v, "install-for": [v], "run-for": [], "alias": [],
+            "display-name": f"Test {v}", "executable": "python.exe",
+            "url": f"test-{v}.zip",
+        } for v in ["3.12", "3.13", "3.14"]
+    ]}).encode()
+
+    validated = []
+    _validate_one = iu._validate_one
+    def validate_one(d, expect, ctxt=None):
+        if ctxt is None:
+            validated.append(d)
+        return _validate_one(d, expect, ctxt)
+    monkeypatch.setattr(iu, "_validate_one", validate_one)
+
+    def first_index(data):
+        return next(IndexDownloader(url, iu.Index, cache={url: data}, cache_dir=tmp_path))
+
+    index = first_index(data)
+    assert len(validated) == 1
+    assert [v["id"] for v in index.versions] == ["test-3.14", "test-3.13", "test-3.12"]
+    assert index.versions[0]["url"] == "https://example.com/test-3.14.zip"
+
+    # A new downloader loads the previously parsed index from disk
+    index2 = first_index(data)
+    assert len(validated) == 1
+    assert index2.versions == index.versions
+    assert index2.versions[0]["sort-version"] is index.versions[0]["sort-version"]
+    # Each index has its own copy
+    index2.versions[0]["url"] = "modified"
+    assert first_index(data).versions[0]["url"] == "https://example.com/test-3.14.zip"
+
+    # Changed content is parsed again
+    index3 = first_index(data.replace(b"3.14", b"3.15"))
+    assert len(validated) == 2
+    assert index3.versions[0]["id"] == "test-3.15"
+
+    # The parsed index is stored as plain JSON, and is parsed again if the
+    # stored data is invalid
+    files = list(tmp_path.glob("*.parsed.json"))
+    assert len(files) == 1
+    key, _, parsed = files[0].read_bytes().partition(b"\n")
+    assert json.loads(parsed)["versions"][0]["sort-version"] == "3.15"
+    files[0].write_bytes(key + b"\n" + b"not json")
+    assert first_index(data.replace(b"3.14", b"3.15")).versions[0]["id"] == "test-3.15"
+    assert len(validated) == 3
+
+
+def test_index_prefetch():
+    import json
+    import threading
+    from manage.urlutils import IndexDownloader
+    pages = 6
+    cache = {}
+    for n in range(pages):
+        page = {"versions": [fake_install_data(f"3.{n}.0")]}
+        if n + 1 < pages:
+            page["next"] = f"index-{n + 1}.json"
+        cache[f"https://example.com/index-{n}.json"] = json.dumps(page).encode()
+
+    loaded = []
+    page_2_started = threading.Event()
+    class Downloader(IndexDownloader):
+        def _load(self, url):
+            loaded.append(url)
+            if url.endswith("-2.json"):
+                page_2_started.set()
+            return super()._load(url)
+
+    with Downloader("https://example.com/index-0.json", iu.Index, cache=cache, prefetch=2) as d:
+        first = next(d)
+        assert first.versions[0]["tag"] == "3.0.0"
+        # Later pages are loaded without waiting for the caller
+        assert page_2_started.wait(5)
+        # But no more than two pages ahead, plus the one being queued
+        assert len(loaded) <= 4
+        assert [i.versions[0]["tag"] for i in d] == [f"3.{n}.0" for n in range(1, pages)]
+    assert len(loaded) == pages
+
+    # Closing early stops prefetching
+    loaded.clear()
+    with Downloader("https://example.com/index-0.json", iu.Index, cache=cache, prefetch=1) as d:
+        next(d)
+    assert list(d) == []
+    assert len(loaded) < pages
+
+
+def test_index_prefetch_error():
+    from manage.urlutils import IndexDownloader
+    cache = {"https://example.com/index.json": b'{"versions": [], "next": "missing.json"}'}
+    d = IndexDownloader("https://example.com/index.json", iu.Index, cache=cache, prefetch=2)
+    def fetch(url):
+        raise FileNotFoundError(url)
+    d._fetch = fetch
+    assert next(d).versions == []
+    with pytest.raises(FileNotFoundError):
+        next(d)
+    assert list(d) == []
+
+
+def test_index_prefetch_unused_error(monkeypatch):
+    import json
+    import threading
+    from manage.install_command import select_package
+    from manage.urlutils import IndexDownloader, LOGGER
+    errors = []
+    monkeypatch.setattr(LOGGER, "error", lambda *a: errors.append(a))
+    cache = {"https://example.com/index.json": json.dumps({
+        "versions": [fake_install_data("3.13.0")],
+        "next": "missing.json",
+    }).encode()}
+    def fetch(url):
+        raise FileNotFoundError(url)
+
+    finished = threading.Event()
+    class Downloader(IndexDownloader):
+        def _prefetch_all(self, url):
+            try:
+                super()._prefetch_all(url)
+            finally:
+                finished.set()
+
+    with Downloader("https://example.com/index.json", iu.Index, cache=cache, prefetch=2) as d:
+        d._fetch = fetch
+        # The first page satisfies the lookup, so the second is never used
+        assert select_package(d, "3.13")["tag"] == "3.13.0"
+    assert finished.wait(5)
+    assert errors == []
+
+    # The error is reported when the page is requested
+    d = IndexDownloader("https://example.com/index.json", iu.Index, cache=cache, prefetch=2)
+    d._fetch = fetch
+    next(d)
+    with pytest.raises(FileNotFoundError):
+        next(d)
+    assert len(errors) == 1
+    assert "missing.json" in errors[0][1]
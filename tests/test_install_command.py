@@ -0,0 +1,383 @@
+import pytest
+import threading
+
+from manage import install_command as IC
+
+
+def download_command(fake_command, download_workers):
+    return fake_command(download_workers=download_workers, dry_run=False, download_dir="downloads")
+
+
+def make_installs(count):
+    return [("source", {"id": f"id{i}", "display-name": f"Install {i}"}) for i in range(count)]
+
+
+@pytest.fixture
+def fake_install(monkeypatch):
+    log = []
+    # Blocks the first download until another package has been installed,
+    # which only happens if extraction overlaps with running downloads.
+    installed = threading.Event()
+
+    def download_one(cmd, source, install, download_dir, *, must_copy=False, show_progress=True):
+        log.append(("download", install["id"], show_progress))
+        if install["id"] == "id0" and cmd.download_workers > 1:
+            assert installed.wait(5), "install did not overlap with downloads"
+        return f"{download_dir}/{install['id']}.zip"
+
+    def install_one(cmd, source, install, *, target=None, package=None):
+        log.append(("install", install["id"], package))
+        installed.set()
+
+    monkeypatch.setattr(IC, "_download_one", download_one)
+    monkeypatch.setattr(IC, "_install_one", install_one)
+    return log
+
+
+def test_install_many_parallel(fake_install, fake_command):
+    IC._install_many(download_command(fake_command, 4), make_installs(3))
+    downloads = [e for e in fake_install if e[0] == "download"]
+    installs = [e for e in fake_install if e[0] == "install"]
+    assert sorted(downloads) == [("download", f"id{i}", False) for i in range(3)]
+    assert sorted(installs) == [("install", f"id{i}", f"downloads/id{i}.zip") for i in range(3)]
+    # The blocked download cannot complete until another has been installed
+    assert installs[0][1] != "id0"
+
+
+def test_install_many_sequential(fake_install, fake_command):
+    IC._install_many(download_command(fake_command, 1), make_installs(3))
+    # Downloads happen within _install_one when not running in parallel
+    assert fake_install == [("install", f"id{i}", None) for i in range(3)]
+
+
+def test_download_many_stops_on_error(fake_install, fake_command, monkeypatch):
+    def download_one(cmd, source, install, download_dir, **kwargs):
+        raise OSError(install["id"])
+    monkeypatch.setattr(IC, "_download_one", download_one)
+    with pytest.raises(OSError):
+        list(IC._download_many(download_command(fake_command, 2), make_installs(5), "downloads"))
+
+
+def test_download_many_shares_destination(fake_command, monkeypatch):
+    active = {}
+    lock = threading.Lock()
+    overlaps = []
+
+    def download_one(cmd, source, install, download_dir, **kwargs):
+        key = IC._download_key(install)
+        with lock:
+            if active.get(key):
+                overlaps.append(key)
+            active[key] = True
+        threading.Event().wait(0.05)
+        with lock:
+            active[key] = False
+        return f"{download_dir}/{install['id']}.zip"
+    monkeypatch.setattr(IC, "_download_one", download_one)
+
+    sha = {"sha256": "AB" * 32}
+    installs = [
+        {"id": "a", "display-name": "A", "sort-version": "1"},
+        {"id": "A", "display-name": "A again", "sort-version": "1"},
+        {"id": "b", "display-name": "B", "sort-version": "1", "hash": sha},
+        {"id": "c", "display-name": "C", "sort-version": "2", "hash": sha},
+        {"id": "d", "display-name": "D", "sort-version": "1"},
+    ]
+    result = list(IC._download_many(download_command(fake_command, 4), [("s", i) for i in installs], "downloads"))
+    assert not overlaps
+    # Every install still gets its own result
+    assert sorted(p for _, _, p in result) == sorted(f"downloads/{i['id']}.zip" for i in installs)
+
+
+def test_download_package_records_hashes(fake_command, tmp_path, monkeypatch):
+    import hashlib
+    data = b"package data" * 1024
+    install = {"url": "https://example.com/package.zip",
+               "hash": {"sha256": hashlib.sha256(data).hexdigest()}}
+    dest = tmp_path / "package.zip"
+    downloads = []
+
+    def urlretrieve(url, outfile, *, hash_algorithms=(), **kwargs):
+        downloads.append(url)
+        outfile.write_bytes(data)
+        return {k: hashlib.new(k, data).hexdigest() for k in hash_algorithms}
+
+    hashed = []
+    _multihash = IC._multihash
+    def multihash(*a):
+        hashed.append(a)
+        return _multihash(*a)
+    monkeypatch.setattr(IC, "_multihash", multihash)
+
+    cmd = fake_command(force=False, bundled_dir=None, download_segments=1,
+                       download_segment_min_size=1024, source="https://example.com/index.json")
+    assert IC.download_package(cmd, install, dest, {}, urlretrieve=urlretrieve) == dest
+    assert (tmp_path / "package.zip.hash").is_file()
+    # Hashes were calculated while downloading, and a cached download reuses
+    # the recorded hashes
+    IC.validate_package(install, dest)
+    IC.download_package(cmd, install, dest, {}, urlretrieve=urlretrieve)
+    assert len(downloads) == 1
+    assert not hashed
+
+    # A modified file is hashed again, and re-downloaded when it fails
+    dest.write_bytes(b"corrupted")
+    IC.download_package(cmd, install, dest, {}, urlretrieve=urlretrieve)
+    assert len(downloads) == 2
+    assert len(hashed) == 1
+    assert dest.read_bytes() == data
+    IC.validate_package(install, dest)
+    assert len(hashed) == 1
+
+
+def make_package(path, files):
+    import zipfile
+    with zipfile.ZipFile(path, "w") as zf:
+        for name, data in files.items():
+            zf.writestr(name, data)
+    return path
+
+
+@pytest.mark.parametrize("workers", [1, 4])
+def test_extract_package(tmp_path, workers):
+    from pathlib import Path
+    files = {f"Lib/pkg{i % 7}/mod{i}.py": f"# module {i}\n".encode() * i for i in range(200)}
+    files["python.exe"] = b"\0" * (3 * IC.EXTRACT_CHUNK_SIZE + 1)
+    package = make_package(tmp_path / "package.zip", files)
+    prefix = tmp_path / "install"
+    progress = []
+    IC.extract_package(package, prefix, Path, on_progress=progress.append, workers=workers)
+    assert progress[:1] + progress[-1:] == [0, 100]
+    assert sorted(progress) == progress
+    for name, data in files.items():
+        assert (prefix / name).read_bytes() == data
+
+
+def test_extract_package_protections(tmp_path, monkeypatch):
+    from pathlib import Path
+    package = make_package(tmp_path / "package.zip", {
+        "python.exe": b"new",
+        "existing.txt": b"new",
+        "escape.txt": b"new",
+    })
+    prefix = tmp_path / "install"
+    prefix.mkdir()
+    (prefix / "existing.txt").write_bytes(b"old")
+    def calculate_dest(prefix, name):
+        if name == "escape.txt":
+            return prefix.parent / name
+        return Path(prefix, name)
+    warnings = []
+    monkeypatch.setattr(IC.LOGGER, "warn", lambda *a: warnings.append(a))
+    IC.extract_package(package, prefix, calculate_dest, workers=2)
+    assert (prefix / "python.exe").read_bytes() == b"new"
+    assert (prefix / "existing.txt").read_bytes() == b"old"
+    assert not (tmp_path / "escape.txt").exists()
+    assert any("outside of its prefix" in a[0] for a in warnings)
+    assert any("overwrite existing item" in a[0] for a in warnings)
+
+    IC.extract_package(package, prefix, calculate_dest, workers=2, repair=True)
+    assert (prefix / "existing.txt").read_bytes() == b"new"
+
+
+def test_download_one_uses_store(fake_command, tmp_path, monkeypatch):
+    import hashlib
+    data = b"package data"
+    def make_install(id):
+        return {"id": id, "sort-version": "1.0", "display-name": id,
+                "url": f"https://example.com/{id}.zip",
+                "hash": {"sha256": hashlib.sha256(data).hexdigest()}}
+
+    downloads = []
+    def download_package(cmd, install, dest, cache, **kwargs):
+        if not dest.is_file():
+            downloads.append(install["id"])
+            dest.parent.mkdir(parents=True, exist_ok=True)
+            dest.write_bytes(data)
+        return dest
+    monkeypatch.setattr(IC, "download_package", download_package)
+
+    cmd = fake_command(force=False, dry_run=False, bundled_dir=None, download_dir=tmp_path / "pkgs")
+    stored = cmd.download_dir / "store" / f"{hashlib.sha256(data).hexdigest()}.zip"
+    # Packages with the same content are only downloaded once
+    assert IC._download_one(cmd, None, make_install("a"), cmd.download_dir) == stored
+    assert IC._download_one(cmd, None, make_install("b"), cmd.download_dir) == stored
+    assert downloads == ["a"]
+
+    # Offline bundles refer to the stored package
+    bundle = tmp_path / "bundle"
+    package = IC._download_one(cmd, None, make_install("b"), bundle, must_copy=True)
+    assert package == bundle / "b-1.0.zip"
+    assert package.read_bytes() == data
+    assert downloads == ["a"]
+
+    # Previously downloaded packages are moved into the store
+    stored.unlink()
+    (cmd.download_dir / "c-1.0.zip").write_bytes(data)
+    assert IC._download_one(cmd, None, make_install("c"), cmd.download_dir) == stored
+    assert not (cmd.download_dir / "c-1.0.zip").exists()
+    assert downloads == ["a"]
+
+
+class FakeIndex:
+    def __init__(self, versions):
+        self.versions = versions
+
+    def find_by_id(self, id):
+        for i in self.versions:
+            if i["id"].casefold() == id.casefold():
+                return i
+        raise LookupError(id)
+
+
+def test_plan_updates(fake_command, monkeypatch, tmp_path):
+    pages = {
+        "main": [
+            FakeIndex([{"id": "a", "sort-version": 2}, {"id": "a", "sort-version": 1}]),
+            FakeIndex([{"id": "b", "sort-version": 1}, {"id": "c", "sort-version": 3}]),
+            FakeIndex([{"id": "d", "sort-version": 1}]),
+        ],
+        "own": [FakeIndex([{"id": "c", "sort-version": 5}])],
+        "broken": None,
+    }
+    opened = []
+    read = []
+
+    class FakeDownloader:
+        def __init__(self, source, *args, **kwargs):
+            opened.append(source)
+            if pages[source] is None:
+                raise OSError("broken source")
+            self.pages = pages[source]
+        def __enter__(self):
+            return self
+        def __exit__(self, *exc_info):
+            pass
+        def __iter__(self):
+            for p in self.pages:
+                read.append(p)
+                yield p
+
+    monkeypatch.setattr(IC, "IndexDownloader", FakeDownloader)
+    cmd = fake_command(download_dir=tmp_path, index_cache_max_age=0, index_prefetch=0)
+    installed = [
+        {"id": "a", "sort-version": 1, "company": "X", "tag": "a", "display-name": "A"},
+        {"id": "B", "sort-version": 1, "company": "X", "tag": "b", "display-name": "B"},
+        {"id": "c", "sort-version": 4, "company": "X", "tag": "c", "display-name": "C",
+         "source": "own"},
+        {"id": "a", "sort-version": 1, "company": "X", "tag": "a", "display-name": "A",
+         "source": "broken"},
+    ]
+    updates = IC._plan_updates(cmd, installed, ["main"])
+    assert [(s, i["id"], i["sort-version"]) for s, i in updates] == [
+        ("main", "a", 2), ("own", "c", 5), ("main", "a", 2),
+    ]
+    # Each source is only opened once, and pages after the last needed id
+    # are never read.
+    assert sorted(opened) == ["broken", "main", "own"]
+    assert pages["main"][2] not in read
+
+    with pytest.raises(IC.NoInstallFoundError):
+        IC._plan_updates(cmd, [{"id": "missing", "sort-version": 1}], ["main"])
+
+
+def shortcut_command(fake_command, tmp_path, installs):
+    cmd = fake_command(
+        installs,
+        install_dir=tmp_path / "pkgs",
+        global_dir=tmp_path / "bin",
+        launcher_exe=tmp_path / "launcher.exe",
+        launcherw_exe=None,
+        enable_shortcut_kinds=None,
+        disable_shortcut_kinds=None,
+    )
+    cmd.install_dir.mkdir()
+    cmd.launcher_exe.write_bytes(b"launcher")
+    return cmd
+
+
+def test_update_all_shortcuts_reconciles(fake_command, tmp_path, monkeypatch):
+    prefix = tmp_path / "pkgs" / "a"
+    install = {
+        "id": "a", "prefix": prefix,
+        "alias": [{"name": "a.exe", "target": "python.exe"},
+                  {"name": "a2.exe", "target": "python.exe"}],
+        "shortcuts": [{"kind": "fake", "name": "A"}],
+    }
+    cmd = shortcut_command(fake_command, tmp_path, [install])
+    prefix.mkdir()
+    (prefix / "python.exe").write_bytes(b"python")
+
+    created = []
+    cleaned = []
+    monkeypatch.setattr(IC, "SHORTCUT_HANDLERS", {"fake": (
+        lambda cmd, i, s: created.append(s["name"]),
+        lambda cmd, pairs: cleaned.append([s["name"] for i, s in pairs]),
+    )})
+    reads = []
+    _read_launcher = IC._read_launcher
+    def read_launcher(launcher, launchers):
+        if str(launcher) not in launchers:
+            reads.append(launcher)
+        return _read_launcher(launcher, launchers)
+    monkeypatch.setattr(IC, "_read_launcher", read_launcher)
+
+    IC.update_all_shortcuts(cmd, path_warning=False)
+    alias = cmd.global_dir / "a.exe"
+    assert alias.read_bytes() == b"launcher"
+    assert (cmd.global_dir / "a.exe.__target__").read_text() == str(prefix / "python.exe")
+    assert created == ["A"]
+    assert cleaned == [["A"]]
+    assert len(reads) == 1
+
+    # Nothing has changed, so nothing is written
+    stamp = alias.stat().st_mtime_ns
+    IC.update_all_shortcuts(cmd, path_warning=False)
+    assert alias.stat().st_mtime_ns == stamp
+    assert created == ["A"]
+    assert cleaned == [["A"]]
+
+    # Modified aliases are rewritten and removed aliases are deleted
+    alias.write_bytes(b"modified")
+    install["alias"].pop()
+    install["shortcuts"][0]["name"] = "B"
+    IC.update_all_shortcuts(cmd, path_warning=False)
+    assert alias.read_bytes() == b"launcher"
+    assert not (cmd.global_dir / "a2.exe").exists()
+    assert not (cmd.global_dir / "a2.exe.__target__").exists()
+    assert created == ["A", "B"]
+    assert cleaned == [["A"], ["B"]]
+
+    # Forcing an update rewrites everything
+    IC.update_all_shortcuts(cmd, path_warning=False, force=True)
+    assert created == ["A", "B", "B"]
+    assert cleaned == [["A"], ["B"], ["B"]]
+
+
+def test_find_install_aliases(fake_command, tmp_path, monkeypatch):
+    prefix = tmp_path / "pkgs" / "a"
+    install = {
+        "id": "a", "prefix": prefix, "executable": prefix / "python.exe",
+        "alias": [{"name": "a.exe", "target": "python.exe"},
+                  {"name": "aw.exe", "target": "pythonw.exe"}],
+    }
+    cmd = shortcut_command(fake_command, tmp_path, [install])
+    prefix.mkdir()
+    (prefix / "python.exe").write_bytes(b"python")
+    (prefix / "pythonw.exe").write_bytes(b"pythonw")
+    monkeypatch.setattr(IC, "SHORTCUT_HANDLERS", {})
+    IC.update_all_shortcuts(cmd, path_warning=False)
+    expect = [cmd.global_dir / "a.exe", cmd.global_dir / "aw.exe"]
+
+    reads = []
+    monkeypatch.setattr(type(prefix), "read_text", lambda self, *a, **kw: reads.append(self))
+    # The index is used without reading any alias
+    assert sorted(IC.find_install_aliases(cmd, install)) == expect
+    assert not reads
+
+    # An alias that is not in the index causes it to be rebuilt
+    (cmd.global_dir / "other.exe.__target__").write_bytes(b"")
+    monkeypatch.undo()
+    aliases = IC.find_install_aliases(cmd, install)
+    # Without install IDs, only aliases to the executable are found
+    assert aliases == [cmd.global_dir / "a.exe"]
@@ -1,3 +1,4 @@
+import os
 import pytest
 
 from pathlib import PurePath
@@ -158,3 +159,107 @@ def test_get_install_to_run_with_default_platform_prerelease(patched_installs2):
     assert i["id"] == "PythonCore-1.0-32"
     i = installs.get_install_to_run("<none>", None, None, default_platform="-arm64")
     assert i["id"] == "PythonCore-1.0-32"
+
+
+@pytest.mark.parametrize("default_platform", [None, "-64", "-32", "-arm64"])
+def test_resolve_table(patched_installs, default_platform):
+    import json
+    from manage.tagutils import tag_or_range
+    ii = installs.get_installs("<none>")
+    # Round-trip the table to ensure it matches what is read from disk
+    table = json.loads(json.dumps(installs._build_resolve_table(ii, "1.0", default_platform)))
+    for key in ["1", "1.0", "1.0-32", "2-64", "Company\\2.1-64"]:
+        assert key in table["tags"]
+
+    for key in table["tags"]:
+        tag = tag_or_range(key)
+        for windowed in (False, True):
+            expect = installs.get_matching_install_tags(
+                ii, tag, windowed=windowed, default_platform=default_platform,
+            )
+            actual = installs._lookup_resolve_table(table, ii, tag, windowed, default_platform)
+            assert [(id(i), id(t)) for i, t in actual] == [(id(i), id(t)) for i, t in expect]
+
+    with pytest.raises(LookupError):
+        installs._lookup_resolve_table(table, ii, tag_or_range("3.0a"), False, default_platform)
+    with pytest.raises(LookupError):
+        installs._lookup_resolve_table(table, ii, tag_or_range("1.0"), False, "-other")
+    with pytest.raises(LookupError):
+        installs._lookup_resolve_table(table, ii[1:], tag_or_range("1.0"), False, default_platform)
+
+
+def test_installs_snapshot(tmp_path, monkeypatch):
+    import json
+    def write_install(tag):
+        (tmp_path / tag).mkdir()
+        i = make_install(tag)
+        del i["prefix"]
+        with open(tmp_path / tag / "__install__.json", "w") as f:
+            json.dump({**i, "schema": 1}, f)
+
+    write_install("1.0")
+    write_install("2.0")
+    installs.update_snapshot(tmp_path)
+    assert (tmp_path / installs.SNAPSHOT_NAME).is_file()
+
+    def no_scan(install_dir):
+        raise AssertionError("install directory should not be scanned")
+    with monkeypatch.context() as m:
+        m.setattr(installs, "_read_install_files", no_scan)
+        ii = list(installs._get_installs(tmp_path))
+    assert sorted(i["id"] for i in ii) == ["PythonCore-1.0", "PythonCore-2.0"]
+    assert all(i["executable"].match("python.exe") for i in ii)
+
+    # Adding a new install invalidates the snapshot
+    write_install("3.0")
+    ii = list(installs._get_installs(tmp_path))
+    assert sorted(i["id"] for i in ii) == ["PythonCore-1.0", "PythonCore-2.0", "PythonCore-3.0"]
+
+
+def test_installs_snapshot_nested_dirs(tmp_path):
+    # The default configuration puts the global and download directories
+    # inside the install directory, and writing to them must not invalidate
+    # the snapshot.
+    (tmp_path / "1.0").mkdir()
+    (tmp_path / "1.0" / "__install__.json").write_text("{}")
+    (tmp_path / "bin").mkdir()
+    (tmp_path / "_cache").mkdir()
+    state = installs._get_install_dir_state(tmp_path)
+    assert list(state) == ["1.0"]
+
+    (tmp_path / "bin" / "python.exe").write_bytes(b"")
+    (tmp_path / "_cache" / "config_cache.json").write_text("{}")
+    (tmp_path / "_cache" / "store").mkdir()
+    (tmp_path / "2.0.0.deleteme").mkdir()
+    (tmp_path / "2.0.0.deleteme" / "__install__.json").write_text("{}")
+    (tmp_path / "3.0").mkdir()
+    assert installs._get_install_dir_state(tmp_path) == state
+
+    # Adding, changing or removing an install does invalidate it
+    (tmp_path / "3.0" / "__install__.json").write_text("{}")
+    assert sorted(installs._get_install_dir_state(tmp_path)) == ["1.0", "3.0"]
+    os.utime(tmp_path / "1.0" / "__install__.json", ns=(1, 1))
+    assert installs._get_install_dir_state(tmp_path)["1.0"] == 1
+    (tmp_path / "1.0" / "__install__.json").unlink()
+    assert list(installs._get_install_dir_state(tmp_path)) == ["3.0"]
+
+
+def test_deferred_delete_hides_install(tmp_path, monkeypatch):
+    import json
+    from manage import fsutils
+    monkeypatch.setattr(fsutils, "ENABLE_DEFERRED_DELETE", True)
+    monkeypatch.setattr(fsutils, "_DEFERRED", set())
+    for tag in ["1.0", "2.0"]:
+        (tmp_path / tag).mkdir()
+        i = make_install(tag)
+        del i["prefix"]
+        with open(tmp_path / tag / "__install__.json", "w") as f:
+            json.dump({**i, "schema": 1}, f)
+        (tmp_path / tag / "python.exe").write_bytes(b"")
+
+    # The tree is left behind, but without the files that identify an install
+    fsutils.rmtree(tmp_path / "1.0", remove_ext_first=("exe", "dll", "json"), defer=True)
+    assert (tmp_path / "1.0.0.deleteme").is_dir()
+    assert not (tmp_path / "1.0.0.deleteme" / "__install__.json").exists()
+    ii = list(installs._get_installs(tmp_path))
+    assert [i["id"] for i in ii] == ["PythonCore-2.0"]
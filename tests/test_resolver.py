@@ -0,0 +1,118 @@
+import os
+import pytest
+
+from manage.exceptions import NoInstallFoundError
+from manage.resolver_command import Resolver, PROTOCOL_VERSION
+
+
+class FakeConfig:
+    def __init__(self, root, env, config_file):
+        self.root = root
+        self.env = env
+        self._config_files = [config_file]
+        self.requests = []
+
+    def get_install_to_run(self, tag, script, *, windowed=False):
+        self.requests.append((tag, script, windowed))
+        if tag == "missing":
+            raise NoInstallFoundError(tag=tag)
+        return {
+            "executable": f"{self.env.get('PREFIX', 'python')}{'w' if windowed else ''}.exe",
+            "executable_args": ["-X", "utf8"],
+        }
+
+
+@pytest.fixture
+def resolver(tmp_path):
+    config_file = tmp_path / "pymanager.json"
+    config_file.write_text("{}")
+    loaded = []
+    def load_config(root, env):
+        cmd = FakeConfig(root, env, config_file)
+        loaded.append(cmd)
+        return cmd
+    r = Resolver(tmp_path, load_config)
+    r.loaded = loaded
+    r.config_file = config_file
+    return r
+
+
+def make_request(root, cwd, tag="", script="", windowed=False, env=None, version=PROTOCOL_VERSION):
+    env_block = "".join(f"{k}={v}\0" for k, v in (env or {}).items())
+    fields = [version, str(root), str(cwd), tag, script, "1" if windowed else "0"]
+    return ("\0".join(fields) + "\0=C:=C:\\\0" + env_block + "\0").encode("utf-16-le")
+
+
+def parse_response(response):
+    if not response:
+        return None
+    return tuple(response.decode("utf-16-le").split("\0"))
+
+
+def test_resolver_resolves(resolver, tmp_path):
+    r = resolver.handle(make_request(tmp_path, tmp_path, "3.13", env={"PREFIX": "py"}))
+    assert parse_response(r) == ("py.exe", "-X utf8")
+    r = resolver.handle(make_request(tmp_path, tmp_path, "3.13", windowed=True, env={"PREFIX": "py"}))
+    assert parse_response(r) == ("pyw.exe", "-X utf8")
+    # Configuration is reused for the same environment
+    assert len(resolver.loaded) == 1
+    assert resolver.loaded[0].env == {"PREFIX": "py"}
+    assert resolver.loaded[0].requests == [("3.13", None, False), ("3.13", None, True)]
+
+    r = resolver.handle(make_request(tmp_path, tmp_path, "3.13", env={"PREFIX": "other"}))
+    assert parse_response(r) == ("other.exe", "-X utf8")
+    assert len(resolver.loaded) == 2
+
+
+def test_resolver_reloads_config(resolver, tmp_path):
+    resolver.handle(make_request(tmp_path, tmp_path, "3.13"))
+    resolver.handle(make_request(tmp_path, tmp_path, "3.13"))
+    assert len(resolver.loaded) == 1
+    resolver.config_file.write_text('{"default_tag": "3.12"}')
+    resolver.handle(make_request(tmp_path, tmp_path, "3.13"))
+    assert len(resolver.loaded) == 2
+
+
+def test_resolver_declines(resolver, tmp_path):
+    # Unrecognised requests
+    assert resolver.handle(b"") == b""
+    assert resolver.handle(make_request(tmp_path, tmp_path, "3.13", version="0")) == b""
+    assert resolver.handle(make_request(tmp_path / "other", tmp_path, "3.13")) == b""
+    assert resolver.handle(make_request(tmp_path, tmp_path / "missing", "3.13")) == b""
+    # Failed lookups are left to the launcher, so it can offer to install
+    assert resolver.handle(make_request(tmp_path, tmp_path, "missing")) == b""
+    assert os.getcwd() != str(tmp_path / "missing")
+
+
+def test_resolver_scripts(resolver, tmp_path):
+    (tmp_path / "plain.py").write_text("print('hello')\n")
+    (tmp_path / "shebang.py").write_bytes(b"\xEF\xBB\xBF#! /usr/bin/python3\n")
+    r = resolver.handle(make_request(tmp_path, tmp_path, script="plain.py"))
+    assert parse_response(r) == ("python.exe", "-X utf8")
+    r = resolver.handle(make_request(tmp_path, tmp_path, script="missing.py"))
+    assert parse_response(r) == ("python.exe", "-X utf8")
+    assert resolver.handle(make_request(tmp_path, tmp_path, script="shebang.py")) == b""
+    # A tag overrides any shebang
+    r = resolver.handle(make_request(tmp_path, tmp_path, "3.13", script="shebang.py"))
+    assert parse_response(r) == ("python.exe", "-X utf8")
+
+
+def test_resolver_environment_case(tmp_path, monkeypatch):
+    import json
+    from manage import config
+    from manage.pathutils import Path
+    from manage.resolver_command import _load_default_config, _parse_environment
+    global_file = tmp_path / "pymanager.json"
+    global_file.write_text(json.dumps({"install_dir": "%LocalAppData%\\Python\\pythons"}))
+    monkeypatch.setattr(config, "_global_file", lambda: global_file)
+    monkeypatch.setenv("PYMANAGER_ENABLE_CONFIG_CACHE", "0")
+
+    # Windows environment blocks use whatever case the variable was set with
+    appdata = tmp_path / "Local"
+    env = _parse_environment(f"LOCALAPPDATA={appdata}\0Path=C:\\Windows\0\0")
+    assert env.get("LocalAppData") == str(appdata)
+    assert env["PATH"] == env["path"] == "C:\\Windows"
+    assert "Path" in env
+
+    cmd = _load_default_config(tmp_path, env)
+    assert str(cmd.install_dir).endswith(str(Path(appdata) / "Python" / "pythons"))
@@ -0,0 +1,105 @@
+import os
+import pytest
+import time
+
+from manage import storeutils as SU
+
+
+def add_package(store_dir, key, size, last_used, name=None):
+    store_dir.mkdir(parents=True, exist_ok=True)
+    p = store_dir / f"{key}.zip"
+    p.write_bytes(b"\0" * size)
+    (store_dir / f"{key}.zip.hash").write_text("{}")
+    if name:
+        SU.write_info(p, {"id": key, "display-name": name, "url": "https://example.com/"})
+    os.utime(p, (last_used, last_used))
+    return p
+
+
+def test_store_path(tmp_path):
+    install = {"url": "https://example.com/package.zip", "hash": {"sha256": "ABC123"}}
+    assert SU.store_path(tmp_path, install) == tmp_path / "abc123.zip"
+    install["url"] = "https://example.com/package.nupkg"
+    assert SU.store_path(tmp_path, install) == tmp_path / "abc123.nupkg"
+    assert SU.store_path(tmp_path, {"url": "x", "hash": {"md5": "abc"}}) is None
+    assert SU.store_path(tmp_path, {"url": "x"}) is None
+
+
+def test_list_and_prune_store(tmp_path):
+    now = time.time()
+    old = add_package(tmp_path, "a" * 64, 100, now - 300, "Oldest")
+    mid = add_package(tmp_path, "b" * 64, 100, now - 200, "Middle")
+    new = add_package(tmp_path, "c" * 64, 100, now - 100)
+
+    entries = SU.list_store(tmp_path)
+    assert [e["path"] for e in entries] == [new, mid, old]
+    assert entries[1]["display-name"] == "Middle"
+    assert "display-name" not in entries[0]
+
+    # Using a package makes it the most recent, without changing its mtime
+    mtime = os.stat(old).st_mtime_ns
+    SU.mark_used(old)
+    assert os.stat(old).st_mtime_ns == mtime
+    assert SU.list_store(tmp_path)[0]["path"] == old
+
+    # Least recently used packages are removed first, unless kept
+    removed = SU.prune_store(tmp_path, 250, keep=[mid])
+    assert [e["path"] for e in removed] == [new]
+    assert not new.exists()
+    assert not (tmp_path / ("c" * 64 + ".zip.hash")).exists()
+
+    removed = SU.prune_store(tmp_path, 100)
+    assert [e["path"] for e in removed] == [mid]
+    assert not (tmp_path / ("b" * 64 + ".zip.info")).exists()
+    assert [e["path"] for e in SU.list_store(tmp_path)] == [old]
+    assert SU.prune_store(tmp_path, 100) == []
+
+
+
+def test_list_store_skips_partial(tmp_path):
+    now = time.time()
+    done = add_package(tmp_path, "a" * 64, 100, now)
+    partial = add_package(tmp_path, "b" * 64, 50, now)
+    (tmp_path / (partial.name + ".resume")).write_text("{}")
+    assert [e["path"] for e in SU.list_store(tmp_path)] == [done]
+    # Partial downloads don't count towards the size, and are never removed
+    assert [e["path"] for e in SU.prune_store(tmp_path, 0)] == [done]
+    assert partial.is_file()
+
+def test_list_missing_store(tmp_path):
+    assert SU.list_store(tmp_path / "missing") == []
+
+
+def test_link_or_copy(tmp_path):
+    src = tmp_path / "src.zip"
+    src.write_bytes(b"data")
+    dest = tmp_path / "bundle" / "dest.zip"
+    dest.parent.mkdir()
+    dest.write_bytes(b"old")
+    SU.link_or_copy(src, dest)
+    assert dest.read_bytes() == b"data"
+    src.unlink()
+    assert dest.read_bytes() == b"data"
+
+
+def make_cache_command(fake_command, download_dir, max_size=None):
+    return fake_command(args=[], download_dir=download_dir, clear=False, prune=True,
+                        max_size=max_size, download_cache_max_size=0)
+
+
+def test_cache_prune_without_limit(fake_command, tmp_path, monkeypatch):
+    from manage import cache_command
+    from manage.logging import LOGGER
+    messages = []
+    monkeypatch.setattr(LOGGER, "info", lambda msg, *a: messages.append(msg % a))
+
+    pkg = add_package(tmp_path / SU.STORE_DIR, "a" * 64, 100, time.time())
+    cache_command.execute(make_cache_command(fake_command, tmp_path))
+    assert pkg.exists()
+    assert "No cache size limit" in messages[0]
+
+    cache_command.execute(make_cache_command(fake_command, tmp_path, 0))
+    assert pkg.exists()
+
+    cache_command.execute(make_cache_command(fake_command, tmp_path, 50))
+    assert not pkg.exists()
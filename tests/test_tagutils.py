@@ -129,3 +129,33 @@ def test_tag_range_company():
     assert not TagRange(r">=Company\3.10").satisfied_by(CompanyTag("OtherCompany", "3.10"))
 
     assert TagRange("=Company\\").satisfied_by(CompanyTag("Company", "3.11"))
+
+
+def test_tag_interned():
+    tag = CompanyTag("Company\\3.13-64")
+    assert CompanyTag("Company\\3.13-64") is tag
+    assert CompanyTag("Company", "3.13-64") is not tag
+    assert CompanyTag("Company", "3.13-64") == tag
+    assert len({tag, CompanyTag("Company", "3.13-64"), CompanyTag("3.13-64")}) == 2
+    with pytest.raises(AttributeError):
+        tag.tag = "3.14"
+
+
+def test_tag_sortkey_order():
+    import itertools
+    import random
+
+    companies = ["", "PythonCore", "Company", "company", "OtherCompany"]
+    tags = ["3", "3.9", "3.10", "3.10.4", "3.13.1a", "3.13.1b", "a3.13.1",
+            "b3.13.1", "Version9", "Version10", "3.14-dev", "3.14.0-embed",
+            "3-3-3", "x-3"]
+    platforms = ["", "-32", "-64", "-arm64"]
+    all_tags = [CompanyTag(c, t + p) for c, t, p in itertools.product(companies, tags, platforms)]
+    random.shuffle(all_tags)
+
+    expected = sorted(all_tags)
+    actual = sorted(all_tags, key=lambda t: t.sortkey)
+    assert actual == expected
+    for x, y in itertools.combinations(expected, 2):
+        assert (x < y) == (x.sortkey < y.sortkey), (x, y)
+        assert (x == y) == (x.sortkey == y.sortkey), (x, y)
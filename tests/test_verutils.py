@@ -67,3 +67,24 @@ def test_version_startswith():
     assert Version("3.13.0").startswith(Version("3.13"))
     assert Version("3.13.0").startswith(Version("3.13.0"))
     assert not Version("3.13").startswith(Version("3.13.0"))
+
+
+def test_version_interned():
+    v = Version("3.14.0b1")
+    assert Version("3.14.0b1") is v
+    assert {v: 1}[Version("3.14.0b1")] == 1
+    with pytest.raises(AttributeError):
+        v.s = "3.15"
+
+
+@pytest.mark.parametrize("wildcard, versions", [
+    ("3.*", ["3", "3.12", "3.13.1", "3.14a1"]),
+    ("3.12.*", ["3.12", "3.12.0", "3.12.5"]),
+    ("3.12-dev", ["3.12a1", "3.12b2", "3.12rc1"]),
+])
+def test_version_wildcard_hash(wildcard, versions):
+    w = Version(wildcard)
+    for v in map(Version, versions):
+        assert w == v
+        assert hash(w) == hash(v)
+        assert v in {w}